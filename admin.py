@@ -1,14 +1,19 @@
 import json
 
 from flask import (
-    Blueprint, g, flash, redirect, render_template, request, url_for
+    Blueprint, abort, g, flash, redirect, render_template, request, url_for
 )
 
 from werkzeug.security import generate_password_hash
 
 from auth import admin_required
+from common.broadcaster import get_broadcaster
 from common.models import User, Service, AppType
+from common.routes import compile_route, route_plans
+from database import get_pool_stats
 from database.data_manager import DataManager
+from database.ingest_buffer import ingest_buffer_stats
+from views import DASHBOARD_PAGE_SIZE, requested_service_filters, service_cards_page
 
 bp = Blueprint("admin", __name__, url_prefix="/admin")
 dm = DataManager()
@@ -140,8 +145,38 @@ def update_user_status(user_id):
 @bp.route("/services")
 @admin_required
 def list_services():
-    services, _ = dm.get_services(status=None)
-    return render_template("admin/services_list.html", services=services)
+    try:
+        status, app_type = requested_service_filters()
+    except ValueError as e:
+        abort(400, str(e))
+
+    # The first page, the next ones come from services_page while scrolling
+    page, _ = dm.get_services_page(limit=DASHBOARD_PAGE_SIZE, status=status, app_type=app_type)
+    services, total = page or ([], 0)
+    next_cursor = services[-1].app_id if len(services) < total else None
+    return render_template("admin/services_list.html", services=services, total=total, next_cursor=next_cursor,
+                           status=status, app_type=app_type, app_types=AppType)
+
+
+@bp.route("/services/page")
+@admin_required
+def services_page():
+    """Pages through the service cards of the admin panel as compact JSON, see views.services_page"""
+    return service_cards_page(lambda service: {
+        "app_id": service.app_id,
+        "name": service.name,
+        "status": service.status,
+        "url": service.url,
+        "route": service.route,
+        "user": service.user,
+        "password": service.password,
+        "app_type": service.app_type,
+        "other_data1": service.other_data1,
+        "other_data2": service.other_data2,
+        "other_data3": service.other_data3,
+        "other_data4": service.other_data4,
+        "other_data5": service.other_data5
+    })
 
 
 @bp.route("/service/add", methods=("GET", "POST"))
@@ -211,7 +246,12 @@ def add_service():
 @admin_required
 def show_service(app_id):
     service, _ = dm.get_service(app_id, status=None)
-    return render_template("admin/service_update.html", service=service)
+    try:
+        route_steps = service.route_plan if isinstance(service, Service) else []
+    except ValueError:
+        # Routes saved before they were validated
+        route_steps = []
+    return render_template("admin/service_update.html", service=service, route_steps=route_steps)
 
 
 @bp.route("/service/<int:app_id>/update", methods=["POST"])
@@ -251,6 +291,35 @@ def update_service(app_id):
     return json.dumps(return_dict)
 
 
+@bp.route("/service/<int:app_id>/route")
+@admin_required
+def preview_route(app_id):
+    """Steps of the saved route of a service, or of the one given in the query string before saving it"""
+    service, _ = dm.get_service(app_id, status=None)
+    route = request.args.get("route", default=None, type=str)
+    steps = []
+    message = ""
+
+    if not isinstance(service, Service):
+        message = "Service not found"
+    else:
+        try:
+            if route is None or "".join(route.split()) == service.route:
+                steps = service.route_plan
+            else:
+                # Not cached, the route is not saved yet
+                steps = compile_route(route)
+        except ValueError as e:
+            message = e.args[0]
+
+    return_dict = {
+        "steps": [step.to_dict() for step in steps],
+        "message": message
+    }
+
+    return json.dumps(return_dict)
+
+
 @bp.route("/service/<int:app_id>/update_status", methods=["POST"])
 @admin_required
 def update_service_status(app_id):
@@ -278,3 +347,27 @@ def update_service_status(app_id):
     }
 
     return json.dumps(return_dict, indent=4)
+
+
+@bp.route("/stats/pool")
+@admin_required
+def pool_stats():
+    return json.dumps(get_pool_stats(), indent=4)
+
+
+@bp.route("/stats/ingest")
+@admin_required
+def ingest_stats():
+    return json.dumps(ingest_buffer_stats() or {}, indent=4)
+
+
+@bp.route("/stats/events")
+@admin_required
+def events_stats():
+    return json.dumps(get_broadcaster().stats(), indent=4)
+
+
+@bp.route("/stats/routes")
+@admin_required
+def routes_stats():
+    return json.dumps(route_plans.stats(), indent=4)
@@ -0,0 +1,161 @@
+import json
+import os
+from datetime import datetime
+
+from flask import (
+    Blueprint, Response, request
+)
+
+from auth import current_user, skip_user_load, token_required, valid_api_token
+from database.data_manager import DataManager
+from database.ingest_buffer import get_ingest_buffer
+
+bp = Blueprint("api", __name__, url_prefix="/api")
+dm = DataManager()
+
+MAX_BATCH_SIZE = 10000
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 1000
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson")
+# Seconds a client is asked to wait when the ingest queue is full
+RETRY_AFTER = 1
+
+
+def buffered_ingest() -> bool:
+    """With INGEST_BUFFER enabled the logs are queued in the write-behind buffer instead of written right away"""
+    return os.getenv("INGEST_BUFFER", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def json_response(return_dict: dict, status: int = 200) -> Response:
+    return Response(json.dumps(return_dict, default=str), status=status, mimetype="application/json")
+
+
+@bp.route("/logs", methods=["POST"])
+@skip_user_load
+@token_required
+def ingest_logs():
+    """Receives a batch of logs as a JSON array or as NDJSON and writes the valid ones in a single transaction,
+    or queues them in the write-behind buffer when INGEST_BUFFER is enabled"""
+    try:
+        entries = parse_batch()
+    except ValueError as e:
+        return json_response({"inserted": 0, "rejected": [], "message": e.args[0]}, 400)
+
+    if len(entries) > MAX_BATCH_SIZE:
+        return json_response({"inserted": 0, "rejected": [],
+                              "message": f"A batch can't have more than {MAX_BATCH_SIZE} logs"}, 413)
+
+    rows, rejected = validate_logs(entries, dm.get_app_ids())
+
+    if buffered_ingest():
+        queued = get_ingest_buffer().put_many(rows)
+        if queued == len(rows):
+            return json_response({"queued": queued, "dropped": 0, "rejected": rejected, "message": "Logs queued"}, 202)
+
+        # The valid logs are queued in order, the client sends again the ones after the first queued
+        return_dict = {
+            "queued": queued,
+            "dropped": len(rows) - queued,
+            "rejected": rejected,
+            "message": f"[Error] The ingest queue is full, only the first {queued} valid logs were queued, "
+                       f"retry the rest later"
+        }
+        response = json_response(return_dict, 503)
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+        return response
+
+    inserted, message = dm.bulk_insert_logs(rows)
+
+    return_dict = {
+        "inserted": len(rows) if inserted else 0,
+        "rejected": rejected,
+        "message": message
+    }
+
+    return json_response(return_dict, 200 if inserted else 500)
+
+
+@bp.route("/services/search")
+@skip_user_load
+def search_services():
+    """Services matching ?q=, best first: every word must match the start of a word of their name, description,
+    url or type. Open to logged in users and API clients, the results only carry what the dashboard shows"""
+    if not valid_api_token() and current_user() is None:
+        return json_response({"services": [], "message": "Log in or send a valid API token"}, 401)
+
+    limit = min(max(request.args.get("limit", SEARCH_LIMIT, type=int), 1), MAX_SEARCH_LIMIT)
+    services, message = dm.search_services(request.args.get("q", ""), limit=limit,
+                                           status=request.args.get("status") or None)
+    if message.startswith("[Error]"):
+        return json_response({"services": [], "message": message}, 500)
+
+    return json_response({
+        "services": [{"app_id": service.app_id,
+                      "name": service.name,
+                      "description": service.description,
+                      "app_type": service.app_type,
+                      "status": service.status} for service in services or []],
+        "message": message
+    })
+
+
+def parse_batch() -> list:
+    """
+    Reads the request body as NDJSON (one log per line) or as a JSON array or object
+    :raise ValueError if the body can't be decoded
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        try:
+            return [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"The body is not valid NDJSON: {e}") from e
+
+    entries = request.get_json(force=True, silent=True)
+    if isinstance(entries, dict):
+        return [entries]
+    if not isinstance(entries, list):
+        raise ValueError("The body must be a JSON array of logs or NDJSON")
+    return entries
+
+
+def validate_logs(entries: list, app_ids: frozenset[int]) -> tuple[list[dict], list[dict]]:
+    """
+    Checks every log and converts it into a row ready to be inserted
+    :param entries: decoded logs with app_id, status, status_date (ISO 8601) and optionally other_data
+    :param app_ids: ids of the known services
+    :return: the valid rows and a list with the index and reason of each rejected log
+    """
+    rows = []
+    rejected = []
+
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            rejected.append({"index": index, "error": "The log must be an object"})
+            continue
+
+        app_id = entry.get("app_id")
+        status = entry.get("status")
+        other_data = entry.get("other_data")
+
+        if not isinstance(app_id, int) or isinstance(app_id, bool) or app_id not in app_ids:
+            rejected.append({"index": index, "error": f"Unknown app_id: {app_id}"})
+            continue
+        if not isinstance(status, str) or not status:
+            rejected.append({"index": index, "error": "The status is required"})
+            continue
+        if other_data is not None and not isinstance(other_data, str):
+            rejected.append({"index": index, "error": "other_data must be a string"})
+            continue
+
+        try:
+            status_date = datetime.fromisoformat(entry.get("status_date"))
+        except (TypeError, ValueError):
+            rejected.append({"index": index, "error": "status_date must be an ISO 8601 date"})
+            continue
+        if status_date.tzinfo is not None:
+            # Logs are stored in the server's local time without timezone
+            status_date = status_date.astimezone().replace(tzinfo=None)
+
+        rows.append({"app_id": app_id, "status": status, "status_date": status_date, "other_data": other_data})
+
+    return rows, rejected
@@ -1,7 +1,9 @@
 import functools
+import hmac
+import os
 
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, current_app, flash, g, redirect, render_template, request, session, url_for
 )
 from werkzeug.exceptions import abort
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -39,10 +41,39 @@ def admin_required(view):
     return wrapped_view
 
 
-@bp.before_app_request
-def load_logged_in_user():
-    """If a user id is stored in the session, load the user object from
-    the database into ``g.user``."""
+def valid_api_token() -> bool:
+    """True if the request carries the API_TOKEN environment variable as a bearer token"""
+    token = os.getenv("API_TOKEN")
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return bool(token) and scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def token_required(view):
+    """View decorator for machine clients: requires the API_TOKEN environment variable as a bearer
+    token, a logged in admin is accepted too."""
+
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if valid_api_token():
+            return view(**kwargs)
+
+        user = current_user()
+        if user is not None and user.type_ == "admin":
+            return view(**kwargs)
+
+        abort(401, "A valid API token is required")
+    return wrapped_view
+
+
+def skip_user_load(view):
+    """View decorator for endpoints mostly called by machine clients, so load_logged_in_user doesn't
+    look the user up for them: ``g.user`` is only loaded when the view calls current_user()."""
+    view.skip_user_load = True
+    return view
+
+
+def session_user():
+    """The user whose id is stored in the session, from the user cache or the database"""
     user_id = session.get("user_id")
 
     try:
@@ -51,11 +82,30 @@ def load_logged_in_user():
         user_id = None
 
     if user_id is None:
+        return None
+    return dm.get_user_id(user_id=user_id, cached=True)
+
+
+def current_user():
+    """``g.user``, looked up on first use in the views marked with skip_user_load"""
+    if "user" not in g:
+        g.user = session_user()
+    return g.user
+
+
+@bp.before_app_request
+def load_logged_in_user():
+    """If a user id is stored in the session, load the user object from
+    the user cache or the database into ``g.user``. Static files don't
+    need it, views marked with skip_user_load load it with current_user()."""
+    view = current_app.view_functions.get(request.endpoint)
+    if request.endpoint == "static":
         g.user = None
-    else:
-        g.user = (
-            dm.get_user_id(user_id=user_id)
-        )
+        return
+    if getattr(view, "skip_user_load", False):
+        return
+
+    g.user = session_user()
 
 
 @bp.route("/login", methods=("GET", "POST"))
@@ -107,7 +157,8 @@ def update_user():
         if user_.role != role:
             user_.role = role
             if dm.update_user(user_)[0]:
-                g.user.role = role
+                # g.user is shared through the user cache, update_user dropped it from there, it is read again
+                g.user = dm.get_user_id(user_id=user_.id, cached=True)
                 message = "Role updated"
             else:
                 message = "Role couldn't be updated"
@@ -126,6 +177,7 @@ def update_user():
 
 
 @bp.route("/logout")
+@skip_user_load
 def logout():
     """Clear the current session, including the stored user id."""
     session.clear()
@@ -0,0 +1,4 @@
+"""
+Benchmarks of the app, run them with: python -m benchmarks.<module>
+The ones that need a database run on their own temporary SQLite database
+"""
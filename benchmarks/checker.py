@@ -0,0 +1,62 @@
+"""
+Services checked per second by checker.runner.CheckRunner against the local stub server, one check at a time
+and with growing concurrency. Results are not written to a database.
+
+Run it with: python -m benchmarks.checker --services 1000 --latency 0.02
+"""
+# Standard library imports
+import argparse
+import logging
+import time
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.checker", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=1000, help="services checked by each run")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds every stub response waits")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 200],
+                        help="checks in flight of each run")
+    parser.add_argument("--per-host", type=int, default=50, help="requests in flight per host")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    from benchmarks.stub_server import StubServer, USER, PASSWORD
+    from checker.runner import CheckRunner, Target, RUNNING
+
+    server = StubServer(latency=args.latency).start()
+    kinds = [Target(0, f"{server.url}/login", "write:input:id:login_user|write:input:id:login_password|"
+                                              "click:input:name:login_button|obtain:div:class:infoContainer",
+                    "web", USER, PASSWORD),
+             Target(0, f"{server.url}/sensor", "blank:blank:blank:blank", "temperature_sensor",
+                    sensor_name="Temperatura_Area_ISP"),
+             Target(0, f"{server.url}/sensor", "blank:blank:blank:blank", "water_sensor", sensor_name="Sensor_Agua"),
+             Target(0, f"{server.url}/ok", "obtain:h1:id:title", "web"),
+             Target(0, f"{server.url}/error", "blank:blank:blank:blank", "web")]
+    targets = [kinds[i % len(kinds)]._replace(app_id=i + 1) for i in range(args.services)]
+    # Every fifth service points to a page that answers 500
+    expected_running = sum(1 for target in targets if not target.url.endswith("/error"))
+
+    print(f"{'concurrency':<14}{'services':>10}{'seconds':>10}{'services/s':>12}{'running':>10}{'requests':>10}")
+    try:
+        for concurrency in args.concurrency:
+            # Serial runs take too long with many services, they check a slice and are scaled
+            sample = targets if concurrency > 1 else targets[:max(len(targets) // 10, len(kinds))]
+            runner = CheckRunner(writer=lambda rows: (True, "Success"), concurrency=concurrency,
+                                 limit_per_host=args.per_host, timeout=30)
+            requests = server.requests
+            elapsed = time.perf_counter()
+            rows = runner.run(sample)
+            elapsed = time.perf_counter() - elapsed
+            running = sum(row["status"] == RUNNING for row in rows)
+            print(f"{concurrency:<14}{len(sample):>10}{elapsed:>10.2f}{len(sample) / elapsed:>12.1f}"
+                  f"{running:>10}{server.requests - requests:>10}")
+    finally:
+        server.stop()
+
+    print(f"Expected running in a full run: {expected_running} of {len(targets)}")
+
+
+if __name__ == "__main__":
+    main()
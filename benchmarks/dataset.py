@@ -0,0 +1,161 @@
+"""
+Deterministic synthetic dataset for the benchmarks: services of every AppType and their logs spread evenly over
+a number of days, with the readings the sensors write in other_data (e.g.: Temperatura_Area_ISP-23.5). The same
+arguments always give the same rows, so runs on different commits read the same data
+
+Run it alone with: python -m benchmarks.dataset --services 200 --logs 1000000 --output wsc.db
+"""
+# Standard library imports
+import argparse
+from datetime import datetime, timedelta
+import logging
+import math
+import os
+import random
+import time
+from typing import Iterator
+
+# The last log is written right before END, the data doesn't depend on when it is generated
+END = datetime(2022, 3, 1)
+AREAS = ("ISP", "Servidores", "Datacenter", "Bodega", "Oficina", "Planta", "Laboratorio", "Recepcion")
+CITIES = ("Amsterdam", "Bogota", "Medellin", "Cali", "Lima", "Quito", "Madrid", "Miami")
+# Rows per INSERT executemany
+CHUNK = 50000
+
+
+def dataset_name(services: int, logs: int, days: int, seed: int) -> str:
+    """File name of a dataset, generate() reuses the file when it is already there"""
+    return f"wsc-{services}s-{logs}l-{days}d-{seed}.db"
+
+
+def generate_services(count: int, seed: int) -> list:
+    """
+    :param count: number of services, spread evenly over every AppType
+    :return: the Services, not added to the database yet
+    """
+    from common.models import AppType, Service
+
+    rng = random.Random(seed)
+    app_types = list(AppType)
+    services = []
+    for i in range(count):
+        app_type = app_types[i % len(app_types)]
+        area, city = rng.choice(AREAS), rng.choice(CITIES)
+        if app_type == AppType.T_SENSOR:
+            name, description = f"Sensor Temperatura {area} {i}", f"Sensor de temperatura en el Área de {area}"
+        elif app_type == AppType.W_SENSOR:
+            name, description = f"Sensor Agua {area} {i}", f"Sensor de agua dentro del Área de {area}"
+        elif app_type == AppType.ZABBIX:
+            name, description = f"Zabbix {city} {i}", f"Monitoreo Zabbix de la sede {city}"
+        else:
+            name, description = f"TM+ {city} {i}", f"Aplicación web de la sede {city}"
+        services.append(Service(name=name, description=description, url=f"http://{app_type.value}{i}.local/",
+                                route="blank:blank:blank:blank", user="checker", password="secret",
+                                app_type=app_type, other_data1=area))
+    return services
+
+
+def generate_logs(services: list[tuple[int, str, str]], count: int, days: int, seed: int) -> Iterator[list[dict]]:
+    """
+    Logs round robin over the services, evenly spaced over the days before END. Temperatures follow a daily cycle
+    around a base of their own with some noise, water sensors read 0 (dry) most of the time; 2% of the checks fail
+    and a failed sensor check has no reading
+    :param services: (app_id, app_type, area) of each service
+    :param count: number of logs
+    :param days: days the logs span
+    :return: the rows, CHUNK at a time, ready for an INSERT into service_log
+    """
+    from common.models import AppType
+
+    rng = random.Random(seed)
+    bases = [rng.uniform(18, 24) for _ in services]
+    start = END - timedelta(days=days)
+    step = timedelta(days=days) / count
+
+    for offset in range(0, count, CHUNK):
+        rows = []
+        for i in range(offset, min(offset + CHUNK, count)):
+            index = i % len(services)
+            app_id, app_type, area = services[index]
+            status_date = start + step * i
+            running = rng.random() >= 0.02
+            other_data, value = "", None
+            if running and app_type == AppType.T_SENSOR.value:
+                hour = status_date.hour + status_date.minute / 60
+                value = round(bases[index] + 2 * math.sin((hour - 9) / 24 * 2 * math.pi) + rng.gauss(0, 0.3), 1)
+                other_data = f"Temperatura_Area_{area}-{value}"
+            elif running and app_type == AppType.W_SENSOR.value:
+                value = 1.0 if rng.random() < 0.01 else 0.0
+                other_data = f"Sensor_Agua_{area}-{value:g}"
+            rows.append({"app_id": app_id, "status": "Running" if running else "Not running",
+                         "status_date": status_date, "other_data": other_data, "value": value})
+        yield rows
+
+
+def generate(path: str, services: int, logs: int, days: int = 30, seed: int = 1) -> dict:
+    """
+    Fills a new SQLite database with the dataset, then brings the rollups and the current status up to date
+    like the app does while it runs. An existing file is kept as it is
+    :param path: SQLite file, SQL_CONNECTION is pointed to it
+    :param services: number of services
+    :param logs: number of logs
+    :param days: days the logs span, ending at END
+    :param seed: seed of the random values
+    :return: a dict with the app_id of the first service of each type and the dates of the logs
+    """
+    from sqlalchemy import func, insert, select
+    from common.models import Service, ServiceLog
+    from database import dispose_engine, get_engine
+    from database.data_manager import DataManager
+    from database.rollups import update_rollups
+
+    dispose_engine()
+    os.environ["SQL_CONNECTION"] = f"sqlite:///{os.path.abspath(path)}"
+    exists = os.path.exists(path)
+    DataManager.create_schema()
+    # What the process cached came from the previous database
+    DataManager._data_changed(services=True)
+    DataManager.user_cache.invalidate()
+
+    if not exists:
+        started = time.perf_counter()
+        DataManager.bulk_add_service(generate_services(services, seed))
+        with get_engine().connect() as connection:
+            rows = connection.execute(select(Service.app_id, Service.app_type, Service.other_data1)
+                                      .order_by(Service.app_id)).all()
+        with get_engine().begin() as connection:
+            for chunk in generate_logs([tuple(row) for row in rows], logs, days, seed):
+                connection.execute(insert(ServiceLog.__table__), chunk)
+        update_rollups(batch_size=100000)
+        DataManager.rebuild_status_current()
+        logging.getLogger(__name__).info(f"Dataset {path} generated in {time.perf_counter() - started:.1f}s")
+
+    with get_engine().connect() as connection:
+        first = dict(connection.execute(select(Service.app_type, func.min(Service.app_id))
+                                        .group_by(Service.app_type)).all())
+    return {"app_ids": first, "start": END - timedelta(days=days), "end": END}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.dataset", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=200, help="services, spread over every type")
+    parser.add_argument("--logs", type=int, default=1000000, help="logs, spread over the services")
+    parser.add_argument("--days", type=int, default=30, help="days the logs span")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random values")
+    parser.add_argument("--output", help="SQLite file written, by default named after the arguments")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    path = args.output or dataset_name(args.services, args.logs, args.days, args.seed)
+    if os.path.exists(path):
+        parser.error(f"{path} already exists")
+
+    started = time.perf_counter()
+    generate(path, args.services, args.logs, args.days, args.seed)
+    print(f"{path}: {args.services} services, {args.logs} logs over {args.days} days "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Time to build the graph of a temperature sensor from one day of raw logs: the columnar path of
+views.get_logs_and_graph, which reads the stored readings, against the previous one (ServiceLog objects, to_dict
+per row, a pandas DataFrame and str.split on other_data), on a temporary SQLite database
+
+Run it with: python -m benchmarks.graph --rows 10000 100000 1000000
+"""
+# Standard library imports
+import argparse
+from datetime import date, datetime, timedelta
+import logging
+import os
+import random
+import tempfile
+import time
+
+DAY = date(2022, 2, 1)
+
+
+def seed(rows: int) -> int:
+    """Adds a temperature sensor with rows logs spread over DAY, returns its app_id"""
+    from sqlalchemy import insert
+    from common.models import AppType, Service, ServiceLog
+    from database import get_engine
+    from database.data_manager import DataManager
+
+    DataManager.create_schema()
+    DataManager.add_service(Service(name=f"Sensor {rows}", description="Benchmark sensor", url="http://sensor.local",
+                                    route="blank:blank:blank:blank", app_type=AppType.T_SENSOR))
+    app_id = max(DataManager.get_app_ids())
+
+    start = datetime(DAY.year, DAY.month, DAY.day)
+    step = timedelta(days=1) / rows
+    with get_engine().begin() as connection:
+        for offset in range(0, rows, 50000):
+            readings = [round(20 + random.random() * 5, 1) if i % 50 else None
+                        for i in range(offset, min(offset + 50000, rows))]
+            connection.execute(insert(ServiceLog.__table__), [
+                {"app_id": app_id,
+                 "status": "Running" if random.random() > 0.02 else "Not running",
+                 "status_date": start + step * (offset + i),
+                 "other_data": f"Temperatura_Area_ISP-{reading}" if reading is not None else "",
+                 "value": reading}
+                for i, reading in enumerate(readings)])
+    return app_id
+
+
+def pandas_graph(app_id: int, width: int) -> str:
+    """The graph path before the columnar one, kept here as the baseline"""
+    import pandas as pd
+    import views
+    from common.columns import LogColumns
+    from common.sensors import reading_after_dash
+    from database.data_manager import DataManager
+
+    logs, _ = DataManager.get_logs(app_id=app_id, start_date_=DAY, end_date_=DAY)
+    df = pd.DataFrame([log.to_dict() for log in logs])
+    df["other_data"] = df["other_data"].map(reading_after_dash, na_action="ignore")
+    # Same downsampling and encoding as the columnar path, only the decoding differs
+    columns = LogColumns(status_date=df["status_date"].to_numpy().astype("datetime64[us]"),
+                         status=df["status"].to_numpy(dtype=object),
+                         reading=df["other_data"].to_numpy(dtype=float))
+    fig = views.Figure()
+    kept = views.downsample_status(columns, width)
+    fig.add_scatter(columns.status_date[kept], columns.status[kept], name="Status")
+    dates, temperatures, _ = views.downsample_temperature(columns, width)
+    fig.add_scatter(dates, temperatures, secondary_y=True, name="Temperature")
+    return fig.to_json()
+
+
+def best_of(repeat: int, function, *args) -> float:
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.graph", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000], help="logs in the day")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per path, the fastest one is reported")
+    parser.add_argument("--width", type=int, default=1000, help="graph width in pixels")
+    parser.add_argument("--baseline", action=argparse.BooleanOptionalAction, default=True,
+                        help="also time the pandas path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    directory = tempfile.mkdtemp(prefix="wsc-bench-")
+    os.environ["SQL_CONNECTION"] = f"sqlite:///{os.path.join(directory, 'graph.db')}"
+
+    import views
+    from common.columns import LogColumns
+    from common.models import AppType
+    from database.data_manager import DataManager
+
+    print(f"{'rows':>9}{'fetch s':>10}{'decode s':>10}{'columnar s':>12}{'pandas s':>10}{'speedup':>9}")
+    for rows in args.rows:
+        app_id = seed(rows)
+        fetch = best_of(args.repeat, DataManager.get_log_columns, app_id, DAY, DAY)
+        logs, _ = DataManager.get_log_columns(app_id, DAY, DAY)
+        decode = best_of(args.repeat, LogColumns.decode, *logs, AppType.T_SENSOR.value)
+        columnar = best_of(args.repeat, views.get_logs_and_graph, app_id, DAY, DAY, args.width)
+        pandas = best_of(args.repeat, pandas_graph, app_id, args.width) if args.baseline else 0
+        print(f"{rows:>9}{fetch:>10.3f}{decode:>10.3f}{columnar:>12.3f}{pandas:>10.3f}"
+              f"{pandas / columnar if pandas else 0:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compares log ingestion through the ORM (DataManager.bulk_add_log_service) against the Core executemany
+path behind POST /api/logs (DataManager.bulk_insert_logs)
+
+Run it with: python -m benchmarks.ingest --rows 50000 --batch 1000
+"""
+# Standard library imports
+import argparse
+from datetime import datetime, timedelta
+import logging
+import os
+import tempfile
+import time
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ingest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="logs inserted by each path")
+    parser.add_argument("--batch", type=int, default=1000, help="logs per call")
+    parser.add_argument("--services", type=int, default=50, help="services the logs are spread on")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    directory = tempfile.mkdtemp(prefix="wsc-bench-")
+    # The engine reads SQL_CONNECTION the first time it is used
+    os.environ["SQL_CONNECTION"] = f"sqlite:///{os.path.join(directory, 'ingest.db')}"
+
+    from common.models import Service, ServiceLog, AppType
+    from database.data_manager import DataManager
+
+    DataManager.create_schema()
+    DataManager.bulk_add_service([Service(name=f"Service {i}", description="", url=f"http://service{i}.local",
+                                          route="blank:blank:blank:blank", app_type=AppType.T_SENSOR)
+                                  for i in range(args.services)])
+    start = datetime(2022, 1, 1)
+
+    def rows(services: list, offset: int, count: int):
+        for i in range(offset, offset + count):
+            yield (services[i % len(services)],
+                   "Running" if i % 10 else "Not running",
+                   start + timedelta(seconds=i),
+                   f"Temperature-{20 + i % 50 / 10}")
+
+    # The ORM path needs attached Service objects, committing a batch expires them so they are loaded again
+    elapsed = time.perf_counter()
+    for offset in range(0, args.rows, args.batch):
+        services, _ = DataManager.get_services(status=None)
+        DataManager.bulk_add_log_service([ServiceLog(status, status_date, service, other_data)
+                                          for service, status, status_date, other_data
+                                          in rows(services, offset, min(args.batch, args.rows - offset))])
+    orm = time.perf_counter() - elapsed
+
+    app_ids = sorted(DataManager.get_app_ids())
+    elapsed = time.perf_counter()
+    for offset in range(args.rows, 2 * args.rows, args.batch):
+        DataManager.bulk_insert_logs([{"app_id": app_id, "status": status,
+                                       "status_date": status_date, "other_data": other_data}
+                                      for app_id, status, status_date, other_data
+                                      in rows(app_ids, offset, min(args.batch, 2 * args.rows - offset))])
+    core = time.perf_counter() - elapsed
+
+    print(f"{'path':<30}{'seconds':>10}{'rows/s':>12}")
+    print(f"{'ORM bulk_add_log_service':<30}{orm:>10.2f}{args.rows / orm:>12.0f}")
+    print(f"{'Core bulk_insert_logs':<30}{core:>10.2f}{args.rows / core:>12.0f}")
+    print(f"Speedup: {orm / core:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Requests per second served by gunicorn (gunicorn.conf.py, wsgi:app) with a growing number of workers, measured
+with an asyncio client over keep-alive connections. On a machine with fewer cores than workers the rate stops
+growing at the number of cores.
+
+Run it with: python -m benchmarks.load --workers 1 2 4 --duration 10 --path /
+"""
+# Standard library imports
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(services: int, logs: int):
+    """Creates the schema once, like the gunicorn master does, and adds services with some logs"""
+    from common.models import Service, AppType
+    from database import dispose_engine
+    from database.data_manager import DataManager
+
+    DataManager.create_schema()
+    DataManager.bulk_add_service([Service(name=f"Service {i}", description=f"Service number {i}",
+                                          url=f"http://service{i}.local", route="blank:blank:blank:blank",
+                                          app_type=AppType.WEBAPP)
+                                  for i in range(services)])
+    app_ids = sorted(DataManager.get_app_ids())
+    start = datetime.now() - timedelta(seconds=logs)
+    DataManager.bulk_insert_logs([{"app_id": app_ids[i % len(app_ids)], "status": "Running" if i % 10 else
+                                   "Not running", "status_date": start + timedelta(seconds=i), "other_data": ""}
+                                  for i in range(logs)])
+    dispose_engine()
+
+
+async def load(url: str, duration: float, connections: int) -> tuple[int, int, list[float]]:
+    """
+    :return: a tuple with the successful requests, the failed ones and the latency of each one in seconds
+    """
+    from checker.client import HttpClient
+
+    client = HttpClient(limit_per_host=connections)
+    deadline = time.monotonic() + duration
+    latencies = []
+    failed = 0
+
+    async def user():
+        nonlocal failed
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.request("GET", url, max_redirects=0)
+            except (OSError, asyncio.IncompleteReadError, Exception):
+                failed += 1
+                continue
+            if response.status < 400:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failed += 1
+
+    try:
+        await asyncio.gather(*(user() for _ in range(connections)))
+    finally:
+        await client.close()
+    return len(latencies), failed, latencies
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    from urllib.request import urlopen
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited before it was ready")
+        try:
+            with urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn was not ready after {timeout}s")
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts measured")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker")
+    parser.add_argument("--connections", type=int, default=32, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per worker count")
+    parser.add_argument("--path", default="/", help="page requested")
+    parser.add_argument("--services", type=int, default=100, help="services in the database")
+    parser.add_argument("--logs", type=int, default=20000, help="logs in the database")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    directory = tempfile.mkdtemp(prefix="wsc-bench-")
+    env = dict(os.environ,
+               SQL_CONNECTION=f"sqlite:///{os.path.join(directory, 'load.db')}",
+               SECRET_KEY="benchmark",
+               ROLLUP_WORKER="false",
+               DB_CREATE_SCHEMA="true")
+    os.environ["SQL_CONNECTION"] = env["SQL_CONNECTION"]
+    seed(args.services, args.logs)
+
+    print(f"{'workers':<10}{'requests':>10}{'failed':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for workers in args.workers:
+        port = free_port()
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                    "--workers", str(workers), "--threads", str(args.threads),
+                                    "--bind", f"127.0.0.1:{port}", "wsgi:app"],
+                                   cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        url = f"http://127.0.0.1:{port}{args.path}"
+        try:
+            wait_ready(url, process)
+            done, failed, latencies = asyncio.run(load(url, args.duration, args.connections))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(30)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000 if latencies else 0
+        print(f"{workers:<10}{done:>10}{failed:>8}{done / args.duration:>10.0f}{p50:>10.1f}{p99:>10.1f}")
+
+    print(f"Cores: {os.cpu_count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Load test of the web app: gunicorn (gunicorn.conf.py, wsgi:app) is started on a synthetic dataset
+(benchmarks.dataset), a number of users log in and a weighted mix of dashboard, graph and admin requests is sent
+at a target rate. The throughput, the p50/p95/p99 latency and the error rate are reported per endpoint; with --slo
+the command exits with 1 when one of the objectives is missed.
+
+Requests are sent on schedule whether the previous ones were answered or not (open loop), and their latency runs
+from the time they were due, so a slow server can't hide the requests it kept waiting.
+
+Run it with: python -m benchmarks.loadtest --rate 50 --duration 30 --slo benchmarks/slo.json
+"""
+# Standard library imports
+import argparse
+import asyncio
+from datetime import timedelta
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+from benchmarks.load import ROOT, free_port, wait_ready
+
+EMAIL = "loadtest@wsc.local"
+PASSWORD = "loadtest"
+# Weight of each endpoint in the mix of requests
+DEFAULT_MIX = "dashboard=40,services_page=10,graph=20,logs=5,login=5,admin_services=10,admin_route=5,admin_stats=5"
+# Objectives an SLO file may set, for the whole run ("total") or per endpoint ("endpoints")
+SLO_LIMITS = ("p50_ms", "p95_ms", "p99_ms", "max_ms", "error_rate")
+SLO_MINIMUMS = ("throughput",)
+
+
+def endpoints(dataset: dict) -> dict[str, tuple[str, str, Optional[dict]]]:
+    """
+    :param dataset: what benchmarks.dataset.generate returned
+    :return: method, path and form of each endpoint of the mix, by name
+    """
+    from common.models import AppType
+
+    sensor = dataset["app_ids"][AppType.T_SENSOR.value]
+    web = dataset["app_ids"][AppType.WEBAPP.value]
+    day = (dataset["end"] - timedelta(days=1)).date().isoformat()
+    return {
+        "dashboard": ("GET", "/", None),
+        "services_page": ("GET", "/services/page", None),
+        "graph": ("POST", f"/service/{sensor}/callback", {"log-start": day}),
+        "logs": ("GET", f"/service/{sensor}/logs", {"log-start": day}),
+        "login": ("POST", "/auth/login", {"email": EMAIL, "password": PASSWORD}),
+        "admin_services": ("GET", "/admin/services/page", None),
+        "admin_route": ("GET", f"/admin/service/{web}/route", None),
+        "admin_stats": ("GET", "/admin/stats/pool", None),
+    }
+
+
+def parse_mix(value: str, known: dict) -> dict[str, float]:
+    """
+    :param value: weight of each endpoint, e.g.: "dashboard=3,graph=1"
+    :return: the positive weights by endpoint name
+    :raise ValueError if an endpoint or a weight isn't valid
+    """
+    mix = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        if name.strip() not in known:
+            raise ValueError(f"Unknown endpoint {name}, it must be one of: {', '.join(known)}")
+        mix[name.strip()] = float(weight or 1)
+    mix = {name: weight for name, weight in mix.items() if weight > 0}
+    if not mix:
+        raise ValueError("The mix doesn't have any endpoint")
+    return mix
+
+
+def percentile(latencies: list[float], percent: float) -> float:
+    """Nearest rank percentile of sorted latencies, 0 when there aren't any"""
+    if not latencies:
+        return 0.0
+    return latencies[max(math.ceil(percent / 100 * len(latencies)) - 1, 0)]
+
+
+def summarize(samples: list[tuple[float, bool]], elapsed: float) -> dict:
+    """
+    :param samples: latency in seconds and success of each request
+    :param elapsed: seconds the load lasted
+    """
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {"requests": len(samples),
+            "errors": errors,
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "throughput": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": latencies[-1] * 1000 if latencies else 0.0}
+
+
+async def log_in(client, base_url: str) -> dict[str, str]:
+    """
+    :return: the cookies of a new session
+    :raise RuntimeError if the login is refused
+    """
+    cookies = {}
+    response = await client.request("POST", base_url + "/auth/login", data={"email": EMAIL, "password": PASSWORD},
+                                    cookies=cookies, max_redirects=0)
+    if response.status != 302 or not cookies:
+        raise RuntimeError(f"The login answered {response.status}")
+    return cookies
+
+
+async def load(base_url: str, routes: dict, mix: dict[str, float], rate: float, duration: float, users: int,
+               connections: int, timeout: float, seed: int) -> tuple[dict[str, list[tuple[float, bool]]], float]:
+    """
+    Sends rate * duration requests, one every 1 / rate seconds, each to an endpoint drawn from the mix by a user
+    drawn from the logged in ones
+    :return: a tuple with the latency and success of the requests per endpoint and the seconds the load lasted
+    """
+    from checker.client import HttpClient, HttpError
+
+    client = HttpClient(limit_per_host=connections)
+    sessions = [await log_in(client, base_url) for _ in range(users)]
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    loop = asyncio.get_running_loop()
+    pending = set()
+
+    async def send(name: str, due: float, cookies: dict[str, str]):
+        method, path, data = routes[name]
+        try:
+            response = await asyncio.wait_for(client.request(method, base_url + path, data=data, cookies=cookies,
+                                                             max_redirects=0), timeout)
+            # The login answers with a redirect to the dashboard
+            ok = response.status < 400
+        except (HttpError, OSError, asyncio.TimeoutError):
+            ok = False
+        samples[name].append((loop.time() - due, ok))
+
+    start = loop.time()
+    try:
+        for i in range(int(rate * duration)):
+            due = start + i / rate
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+            name = rng.choices(names, weights)[0]
+            # A login starts a new session, the other requests use the session of a user
+            cookies = {} if name == "login" else rng.choice(sessions)
+            task = asyncio.create_task(send(name, due, cookies))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+    finally:
+        await client.close()
+    return samples, loop.time() - start
+
+
+def validate_slo(slo: dict):
+    """
+    :param slo: objectives for the whole run ("total") and per endpoint ("endpoints"), e.g.:
+    {"total": {"p95_ms": 500, "error_rate": 0.01}, "endpoints": {"graph": {"p99_ms": 2000}}}
+    Latencies and error rates are maximums, throughput (requests per second) is a minimum
+    :raise ValueError if the SLO has an unknown objective
+    """
+    for objectives in [slo.get("total", {}), *slo.get("endpoints", {}).values()]:
+        for key in objectives:
+            if key not in SLO_LIMITS + SLO_MINIMUMS:
+                raise ValueError(f"Unknown objective {key}, it must be one of: {', '.join(SLO_LIMITS + SLO_MINIMUMS)}")
+
+
+def check_slo(report: dict, slo: dict) -> list[str]:
+    """
+    :param report: the summary of the whole run ("total") and of each endpoint ("endpoints")
+    :param slo: objectives with the same layout, see validate_slo
+    :return: a message per objective missed
+    """
+    targets = [("total", report["total"], slo.get("total", {}))]
+    targets += [(name, report["endpoints"].get(name), objectives)
+                for name, objectives in slo.get("endpoints", {}).items()]
+
+    violations = []
+    for name, summary, objectives in targets:
+        for key, objective in objectives.items():
+            if summary is None:
+                violations.append(f"{name}: no request was sent, {key} can't be checked")
+            elif key in SLO_LIMITS and summary[key] > objective:
+                violations.append(f"{name}: {key} is {summary[key]:.3f}, above {objective}")
+            elif key in SLO_MINIMUMS and summary[key] < objective:
+                violations.append(f"{name}: {key} is {summary[key]:.3f}, below {objective}")
+    return violations
+
+
+def create_user():
+    from werkzeug.security import generate_password_hash
+    from common.models import User
+    from database.data_manager import DataManager
+
+    if DataManager.get_user_email(EMAIL) is None:
+        DataManager.add_user(User(email=EMAIL, password=generate_password_hash(PASSWORD), name="Load test",
+                                  type_="admin"))
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20, help="requests sent per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--users", type=int, default=10, help="logged in users the requests are spread on")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weight of each endpoint ({DEFAULT_MIX})")
+    parser.add_argument("--connections", type=int, default=64, help="requests in flight at most")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as an error")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker")
+    parser.add_argument("--services", type=int, default=200, help="services of the dataset")
+    parser.add_argument("--logs", type=int, default=100000, help="logs of the dataset")
+    parser.add_argument("--data-dir", help="folder of the dataset, it is generated once and reused. "
+                                           "A temporary folder, removed at the end, by default")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the dataset and of the mix")
+    parser.add_argument("--slo", help="JSON file with the objectives, the command exits with 1 if one is missed")
+    parser.add_argument("--output", help="JSON file the report is written to")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    slo = None
+    if args.slo:
+        with open(args.slo) as file:
+            slo = json.load(file)
+        try:
+            validate_slo(slo)
+        except ValueError as e:
+            parser.error(f"{args.slo}: {e}")
+
+    temporary = args.data_dir is None
+    directory = tempfile.mkdtemp(prefix="wsc-bench-") if temporary else args.data_dir
+    os.makedirs(directory, exist_ok=True)
+
+    from benchmarks.dataset import dataset_name, generate
+    from database import dispose_engine
+
+    path = os.path.join(directory, dataset_name(args.services, args.logs, 30, args.seed))
+    dataset = generate(path, args.services, args.logs, seed=args.seed)
+    create_user()
+    routes = endpoints(dataset)
+    try:
+        mix = parse_mix(args.mix, routes)
+    except ValueError as e:
+        parser.error(str(e))
+    # Closing the connections first checkpoints the WAL, the workers open the file on their own
+    dispose_engine()
+
+    env = dict(os.environ,
+               SQL_CONNECTION=f"sqlite:///{os.path.abspath(path)}",
+               SECRET_KEY="loadtest",
+               ROLLUP_WORKER="false",
+               DB_CREATE_SCHEMA="false")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                "--workers", str(args.workers), "--threads", str(args.threads),
+                                "--bind", f"127.0.0.1:{port}", "wsgi:app"],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        wait_ready(base_url + "/", process)
+        samples, elapsed = asyncio.run(load(base_url, routes, mix, args.rate, args.duration, args.users,
+                                            args.connections, args.timeout, args.seed))
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(30)
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report = {"arguments": vars(args),
+              "total": summarize([sample for endpoint in samples.values() for sample in endpoint], elapsed),
+              "endpoints": {name: summarize(endpoint, elapsed) for name, endpoint in samples.items() if endpoint}}
+
+    print(f"{'endpoint':<16}{'requests':>9}{'req/s':>8}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}")
+    for name, summary in [*report["endpoints"].items(), ("total", report["total"])]:
+        print(f"{name:<16}{summary['requests']:>9}{summary['throughput']:>8.1f}{summary['error_rate']:>8.1%}"
+              f"{summary['p50_ms']:>9.1f}{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{summary['max_ms']:>9.1f}")
+    if report["total"]["throughput"] < args.rate * 0.95:
+        print(f"The load only reached {report['total']['throughput']:.1f} of the {args.rate:g} requests per second "
+              f"asked, the requests waited for the server")
+
+    violations = check_slo(report, slo) if slo is not None else []
+    report["slo_violations"] = violations
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {args.output}")
+
+    for violation in violations:
+        print(f"SLO missed: {violation}")
+    if violations:
+        return 1
+    if slo is not None:
+        print("Every SLO was met")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Range query latency against the size of the history, with every log in service_log and with the closed months
+moved to their monthly partitions (database.partitions), on temporary SQLite databases. It also times removing
+the oldest month: a DELETE on service_log against dropping its partition
+
+Run it with: python -m benchmarks.partitions --months 1 6 24 --logs-per-month 100000
+"""
+# Standard library imports
+import argparse
+from datetime import date, datetime, timedelta
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+# Last month of the history, the older ones are before it
+LAST_MONTH = date(2022, 12, 1)
+
+
+def use_database(path: str):
+    """Points the process wide engine to another SQLite file"""
+    from database import dispose_engine
+
+    dispose_engine()
+    os.environ["SQL_CONNECTION"] = f"sqlite:///{path}"
+
+
+def months_back(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def seed(months: int, logs_per_month: int, services: int) -> list[int]:
+    """Adds temperature sensors and logs_per_month logs per month spread over them, returns their app_ids"""
+    from sqlalchemy import insert
+    from common.models import AppType, Service, ServiceLog
+    from database import get_engine
+    from database.data_manager import DataManager
+    from database.partitions import next_month
+
+    DataManager.create_schema()
+    DataManager.bulk_add_service([Service(name=f"Sensor {i}", description="Benchmark sensor", url="http://sensor.local",
+                                          route="blank:blank:blank:blank", app_type=AppType.T_SENSOR)
+                                  for i in range(services)])
+    app_ids = sorted(DataManager.get_app_ids())
+
+    with get_engine().begin() as connection:
+        for month in range(months, 0, -1):
+            start = months_back(LAST_MONTH, month - 1)
+            first = datetime(start.year, start.month, 1)
+            step = (next_month(first) - first) / logs_per_month
+            for offset in range(0, logs_per_month, 50000):
+                rows = []
+                for i in range(offset, min(offset + 50000, logs_per_month)):
+                    reading = round(20 + random.random() * 5, 1)
+                    rows.append({"app_id": app_ids[i % services],
+                                 "status": "Running" if random.random() > 0.02 else "Not running",
+                                 "status_date": first + step * i,
+                                 "other_data": f"Temperatura_Area_ISP-{reading}",
+                                 "value": reading})
+                connection.execute(insert(ServiceLog.__table__), rows)
+    return app_ids
+
+
+def best_of(repeat: int, function, *args, **kwargs) -> float:
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def range_queries(app_id: int, months: int, repeat: int) -> dict[str, float]:
+    """Times the reads of the service graph and the logs page on a recent day, an old day and a week"""
+    from database.data_manager import DataManager
+
+    recent = LAST_MONTH + timedelta(days=14)
+    old = months_back(LAST_MONTH, months - 1) + timedelta(days=14)
+    return {
+        "recent day": best_of(repeat, DataManager.get_log_columns, app_id, recent, recent),
+        "old day": best_of(repeat, DataManager.get_log_columns, app_id, old, old),
+        "week": best_of(repeat, DataManager.get_logs, app_id=app_id,
+                        start_date_=LAST_MONTH - timedelta(days=3), end_date_=LAST_MONTH + timedelta(days=3)),
+        "all services": best_of(repeat, DataManager.get_logs, start_date_=recent, end_date_=recent),
+    }
+
+
+def expire_oldest_month(months: int, partitioned: bool) -> float:
+    """Removes the logs of the oldest month, returns the seconds it took"""
+    from sqlalchemy import delete
+    from common.models import ServiceLog
+    from database import get_engine
+    from database.partitions import drop_partition, month_start, next_month, partition_name
+
+    oldest = months_back(LAST_MONTH, months - 1)
+    start = time.perf_counter()
+    if partitioned:
+        drop_partition(partition_name(oldest))
+    else:
+        log = ServiceLog.__table__
+        with get_engine().begin() as connection:
+            connection.execute(delete(log).where(log.c.status_date >= month_start(oldest),
+                                                 log.c.status_date < next_month(oldest)))
+    return time.perf_counter() - start
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.partitions", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months", type=int, nargs="+", default=[1, 6, 24], help="months of history")
+    parser.add_argument("--logs-per-month", type=int, default=100000, help="logs per month, across every service")
+    parser.add_argument("--services", type=int, default=10, help="number of services")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query, the fastest one is reported")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    directory = tempfile.mkdtemp(prefix="wsc-bench-")
+
+    print(f"{'months':>7}{'logs':>10}  {'layout':<12}{'recent day ms':>14}{'old day ms':>11}{'week ms':>9}"
+          f"{'all services ms':>16}{'expire month s':>15}")
+    try:
+        for months in args.months:
+            monolithic = os.path.join(directory, f"monolithic-{months}.db")
+            partitioned = os.path.join(directory, f"partitioned-{months}.db")
+            use_database(monolithic)
+            app_id = seed(months, args.logs_per_month, args.services)[0]
+            # Closing the connections first checkpoints the WAL into the file copied
+            use_database(partitioned)
+            shutil.copyfile(monolithic, partitioned)
+
+            from database.partitions import partition_logs
+            # Every month but the last one goes to its partition
+            partition_logs(before=LAST_MONTH)
+
+            for layout, path in (("monolithic", monolithic), ("partitioned", partitioned)):
+                use_database(path)
+                timings = range_queries(app_id, months, args.repeat)
+                expire = expire_oldest_month(months, layout == "partitioned") if months > 1 else 0.0
+                print(f"{months:>7}{months * args.logs_per_month:>10}  {layout:<12}"
+                      f"{timings['recent day'] * 1000:>14.1f}{timings['old day'] * 1000:>11.1f}"
+                      f"{timings['week'] * 1000:>9.1f}{timings['all services'] * 1000:>16.1f}{expire:>15.3f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Checks whether the scheduler keeps up with many services: simulated checks (no network, no database) run for a
+while and the queue lag, the checks per second and how spread they are over time are reported
+
+Run it with: python -m benchmarks.scheduler --services 10000 --duration 60 --scale 10
+"""
+# Standard library imports
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime
+import logging
+import random
+import time
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.scheduler", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=10000, help="services scheduled")
+    parser.add_argument("--duration", type=float, default=60, help="seconds the checks run")
+    parser.add_argument("--scale", type=float, default=10,
+                        help="the default intervals are divided by it to get more checks in a short run")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds a simulated check takes")
+    parser.add_argument("--failures", type=float, default=0.05, help="fraction of services that are down")
+    parser.add_argument("--concurrency", type=int, default=500, help="checks running at once")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    from checker.runner import CheckRunner, Target, RUNNING, NOT_RUNNING
+    from checker.scheduler import Scheduler, DEFAULT_INTERVALS
+
+    app_types = list(DEFAULT_INTERVALS)
+    targets = [Target(i + 1, f"http://service{i}.local", "blank:blank:blank:blank", app_types[i % len(app_types)])
+               for i in range(args.services)]
+    down = set(random.sample([target.app_id for target in targets], int(args.services * args.failures)))
+    started = Counter()
+
+    class SimulatedRunner(CheckRunner):
+        async def check(self, client, target: Target) -> dict:
+            started[int(time.monotonic())] += 1
+            await asyncio.sleep(args.latency)
+            return {"app_id": target.app_id,
+                    "status": NOT_RUNNING if target.app_id in down else RUNNING,
+                    "status_date": datetime.now(),
+                    "other_data": ""}
+
+    scheduler = Scheduler(intervals={app_type: interval / args.scale for app_type, interval
+                                     in DEFAULT_INTERVALS.items()},
+                          min_interval=10 / args.scale)
+    runner = SimulatedRunner(writer=lambda rows: (True, "Success"), concurrency=args.concurrency)
+
+    async def run():
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(args.duration, stop.set)
+        await runner.run_scheduled(scheduler, lambda: targets, reload_interval=args.duration + 1, stop=stop)
+
+    elapsed = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - elapsed
+
+    stats = scheduler.stats()
+    # The first and last seconds are partial
+    per_second = [started[second] for second in sorted(started)[1:-1]] or [0]
+    mean = sum(per_second) / len(per_second)
+    print(f"Services: {stats['services']}, failing: {stats['failing']}, run: {elapsed:.1f}s")
+    print(f"Checks: {stats['dispatched']}, {stats['dispatched'] / elapsed:.0f}/s, "
+          f"peak {max(per_second)}/s, peak to mean {max(per_second) / mean if mean else 0:.2f}")
+    print(f"Lag: avg {stats['lag_avg']}s, p95 {stats['lag_p95']}s, max {stats['lag_max']}s, "
+          f"overdue at the end {stats['overdue']}")
+    print("Keeps up" if stats["lag_p95"] < 1 else "Falls behind: raise --concurrency or the intervals")
+
+
+if __name__ == "__main__":
+    main()
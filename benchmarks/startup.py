@@ -0,0 +1,130 @@
+"""
+Startup cost of the web app: the import time of each module (python -X importtime) and the memory of a process
+after it created the app, served the dashboard and drew a graph, then the memory of each gunicorn worker.
+Heavy packages (pandas, numpy) must only show up after the graph.
+
+Run it with: python -m benchmarks.startup --top 15 --workers 2
+"""
+# Standard library imports
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.load import ROOT, free_port, seed, wait_ready
+
+# Modules loaded by create_app, the blueprints included
+APP_MODULES = ("main", "auth", "views", "admin", "api")
+
+# Run in a new interpreter, so nothing is imported beforehand
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from main import create_app
+app = create_app()
+steps = {"create_app": time.perf_counter() - start}
+
+def memory():
+    with open("/proc/self/status") as status:
+        rss = dict(line.split(":", 1) for line in status)["VmRSS"].strip()
+    return rss, sorted(name for name in ("pandas", "numpy", "plotly") if name in sys.modules)
+
+result = {"create_app": memory()}
+app.test_client().get("/")
+result["dashboard"] = memory()
+import views
+with app.test_request_context():
+    views.get_logs_and_graph(app_id=1, start_date=None, end_date=None)
+result["graph"] = memory()
+print(json.dumps({"create_app": steps["create_app"], "steps": result}))
+"""
+
+
+def import_times(env: dict, top: int) -> tuple[float, list[tuple[int, str]]]:
+    """
+    :return: the import time of the app modules in seconds and the modules that took longest, with their own
+    time in µs
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(APP_MODULES)}"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stderr
+    total = 0
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(own), name.strip()))
+        # Modules imported at the top level, the others are counted in their cumulative time
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1e6, sorted(modules, reverse=True)[:top]
+
+
+def worker_memory(pid: int) -> dict[str, int]:
+    """Rss counts the pages shared with the master, Pss splits them between the processes sharing them (kB)"""
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                memory[key] = int(value.split()[0])
+    return memory
+
+
+def gunicorn_memory(env: dict, workers: int) -> list[dict[str, int]]:
+    port = free_port()
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "wsgi:app"],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(f"http://127.0.0.1:{port}/", process)
+        # Every worker gets some requests
+        from urllib.request import urlopen
+        for _ in range(workers * 10):
+            with urlopen(f"http://127.0.0.1:{port}/", timeout=5):
+                pass
+        time.sleep(0.5)
+        children = subprocess.run(["pgrep", "-P", str(process.pid)], capture_output=True, text=True).stdout.split()
+        return [worker_memory(int(pid)) for pid in children]
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(30)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules listed")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers measured, 0 to skip them")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="wsc-bench-")
+    env = dict(os.environ,
+               SQL_CONNECTION=f"sqlite:///{os.path.join(directory, 'startup.db')}",
+               SECRET_KEY="benchmark",
+               ROLLUP_WORKER="false")
+    os.environ["SQL_CONNECTION"] = env["SQL_CONNECTION"]
+    seed(services=10, logs=2000)
+
+    total, modules = import_times(env, args.top)
+    print(f"import {', '.join(APP_MODULES)}: {total * 1000:.0f} ms, slowest modules (own time):")
+    for own, name in modules:
+        print(f"  {own / 1000:>8.1f} ms  {name}")
+
+    probe = json.loads(subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env,
+                                      capture_output=True, text=True, check=True).stdout.splitlines()[-1])
+    print(f"create_app: {probe['create_app'] * 1000:.0f} ms")
+    for step, (rss, heavy) in probe["steps"].items():
+        print(f"  after {step:<11} RSS {rss:>10}, heavy packages loaded: {', '.join(heavy) or 'none'}")
+
+    if args.workers:
+        for number, memory in enumerate(gunicorn_memory(env, args.workers), 1):
+            print(f"gunicorn worker {number}: RSS {memory['Rss'] / 1024:.1f} MB, PSS {memory['Pss'] / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Local HTTP server that imitates the pages the checker visits: a login form, a sensor page, slow and broken pages.
+The benchmarks and the tests of the checker run against it
+
+Run it alone with: python -m benchmarks.stub_server --port 8081
+"""
+# Standard library imports
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+USER = "checker"
+PASSWORD = "secret"
+SESSION_COOKIE = "stub_session"
+
+LOGIN_PAGE = """<html><body>
+<form action="/login" method="post">
+    <input type="hidden" name="token" value="stub-token">
+    <input type="text" id="login_user" name="user">
+    <input type="password" id="login_password" name="password">
+    <input type="submit" name="login_button" value="Log in">
+</form>
+</body></html>"""
+HOME_PAGE = """<html><body><div class="infoContainer main">Welcome {user}</div><a class="logout" href="/logout">Log out</a>
+</body></html>"""
+SENSOR_PAGE = """<html><body><table>
+<tr><td>Temperatura_Area_ISP - {temperature} °C</td></tr>
+<tr><td>Sensor_Agua - Normal</td></tr>
+</table></body></html>"""
+OK_PAGE = """<html><body><h1 id="title">It works</h1></body></html>"""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "StubServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path in ("/", "/ok"):
+            self.send_page(OK_PAGE)
+        elif path == "/login":
+            self.send_page(LOGIN_PAGE)
+        elif path == "/home":
+            user = self.cookies().get(SESSION_COOKIE)
+            if user:
+                self.send_page(HOME_PAGE.format(user=user))
+            else:
+                self.send_redirect("/login")
+        elif path == "/sensor":
+            self.send_page(SENSOR_PAGE.format(temperature=round(20 + time.time() % 10, 1)))
+        elif path == "/chunked":
+            self.send_chunked(OK_PAGE)
+        elif path == "/slow":
+            time.sleep(float(parse_qs(urlsplit(self.path).query).get("delay", ["5"])[0]))
+            self.send_page(OK_PAGE)
+        elif path == "/truncated":
+            self.send_truncated(OK_PAGE)
+        elif path == "/error":
+            self.send_page("<html><body>Internal error</body></html>", status=500)
+        else:
+            self.send_page("<html><body>Not found</body></html>", status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        if urlsplit(self.path).path == "/login" and form.get("user") == [USER] and \
+                form.get("password") == [PASSWORD] and form.get("token") == ["stub-token"]:
+            self.send_redirect("/home", cookie=f"{SESSION_COOKIE}={USER}; Path=/; HttpOnly")
+        else:
+            self.send_page(LOGIN_PAGE, status=401)
+
+    def cookies(self) -> dict[str, str]:
+        cookies = {}
+        for cookie in self.headers.get("Cookie", "").split(";"):
+            name, _, value = cookie.strip().partition("=")
+            cookies[name] = value
+        return cookies
+
+    def send_page(self, page: str, status: int = 200):
+        self.server.wait()
+        body = page.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunked(self, page: str):
+        self.server.wait()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        body = page.encode()
+        for start in range(0, len(body), 16):
+            chunk = body[start:start + 16]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_truncated(self, page: str):
+        """Announces the whole page but sends its first bytes only, then closes the connection"""
+        self.server.wait()
+        body = page.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:5])
+        self.close_connection = True
+
+    def send_redirect(self, location: str, cookie: str = None):
+        self.server.wait()
+        self.send_response(302)
+        self.send_header("Location", location)
+        if cookie:
+            self.send_header("Set-Cookie", cookie)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class StubServer(ThreadingHTTPServer):
+    """Serves StubHandler from a background thread, every response waits latency seconds"""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def wait(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.stub_server", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every response waits")
+    args = parser.parse_args()
+
+    server = StubServer(port=args.port, latency=args.latency)
+    print(f"Serving on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,227 @@
+"""
+Benchmark suite of the hot paths: the DataManager reads, views.get_logs_and_graph and the Flask endpoints through
+the test client, on synthetic datasets (benchmarks.dataset) of growing size. The results are saved as JSON and
+compared against a previous run, the baseline
+
+Run it with: python -m benchmarks.suite --logs 10000 1000000 10000000 --output results.json
+Then, on another commit: python -m benchmarks.suite --output new.json --baseline results.json
+"""
+# Standard library imports
+import argparse
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+# A benchmark regressed when its fastest run is this much slower than the baseline's, the fastest run is the one
+# least disturbed by the rest of the machine
+REGRESSION_THRESHOLD = 0.2
+
+
+def measure(function: Callable, repeat: int) -> dict[str, float]:
+    """
+    Runs the function once to warm it up and then repeat times
+    :return: a dict with the min, median, mean and max seconds and the number of runs
+    """
+    function()
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed.append(time.perf_counter() - start)
+    return {"min": min(elapsed), "median": statistics.median(elapsed), "mean": statistics.fmean(elapsed),
+            "max": max(elapsed), "runs": repeat}
+
+
+def request(client, method: str, url: str, **kwargs) -> Callable:
+    """A request through the test client that fails the benchmark unless it is answered with a 200"""
+    def send():
+        response = client.open(url, method=method, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {url} answered {response.status_code}")
+        response.get_data()
+    return send
+
+
+def login(client):
+    """Adds an admin user and logs the client in, the pages behind login_required need one"""
+    from common.models import User
+    from database.data_manager import DataManager
+
+    user = DataManager.get_user_email("bench@wsc.local")
+    if user is None:
+        DataManager.add_user(User(email="bench@wsc.local", password="-", name="Benchmark", type_="admin"))
+        user = DataManager.get_user_email("bench@wsc.local")
+    with client.session_transaction() as session:
+        session["user_id"] = user.id
+
+
+def cases(app, client, dataset: dict) -> dict[str, Callable]:
+    """
+    :param dataset: what benchmarks.dataset.generate returned
+    :return: the functions timed, by name
+    """
+    import views
+    from common.models import AppType
+    from database.data_manager import DataManager
+
+    sensor = dataset["app_ids"][AppType.T_SENSOR.value]
+    web = dataset["app_ids"][AppType.WEBAPP.value]
+    last_day = (dataset["end"] - timedelta(days=1)).date()
+    week = last_day - timedelta(days=6)
+    first_day = dataset["start"].date()
+
+    def uncached_dashboard():
+        views.dashboard_cache.invalidate()
+        request(client, "GET", "/")()
+
+    def in_app_context(function, *args, **kwargs):
+        def run():
+            with app.app_context():
+                function(*args, **kwargs)
+        return run
+
+    return {
+        "DataManager.get_logs sensor day": lambda: DataManager.get_logs(app_id=sensor, start_date_=last_day,
+                                                                        end_date_=last_day),
+        "DataManager.get_logs all services day": lambda: DataManager.get_logs(start_date_=last_day,
+                                                                              end_date_=last_day),
+        "DataManager.get_logs web week": lambda: DataManager.get_logs(app_id=web, start_date_=week,
+                                                                      end_date_=last_day),
+        "DataManager.get_log_columns sensor day": lambda: DataManager.get_log_columns(sensor, last_day, last_day),
+        "DataManager.get_logs_page sensor": lambda: DataManager.get_logs_page(sensor, first_day, last_day,
+                                                                              limit=views.LOGS_PAGE_SIZE),
+        "DataManager.get_last_active_time": DataManager.get_last_active_time,
+        "DataManager.get_services_page": DataManager.get_services_page,
+        "DataManager.search_services": lambda: DataManager.search_services("sensor temp"),
+        "views.get_logs_and_graph day": in_app_context(views.get_logs_and_graph, sensor, last_day, last_day),
+        "views.get_logs_and_graph week": in_app_context(views.get_logs_and_graph, sensor, week, last_day),
+        "views.get_logs_and_graph all": in_app_context(views.get_logs_and_graph, sensor, first_day, last_day),
+        "GET /": request(client, "GET", "/"),
+        "GET / uncached": uncached_dashboard,
+        "GET /services/page": request(client, "GET", "/services/page"),
+        "POST /service/<id>/callback day": request(client, "POST", f"/service/{sensor}/callback",
+                                                   data={"log-start": last_day.isoformat()}),
+        "GET /service/<id>/logs": request(client, "GET", f"/service/{sensor}/logs",
+                                          query_string={"log-start": first_day.isoformat(),
+                                                        "log-end": last_day.isoformat()}),
+        "GET /api/services/search": request(client, "GET", "/api/services/search", query_string={"q": "sensor"}),
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Prints the fastest run of every benchmark next to the baseline's
+    :return: the benchmarks slower than the baseline by more than threshold
+    """
+    regressions = []
+    print(f"\n{'logs':>9}  {'benchmark':<40}{'baseline ms':>12}{'current ms':>12}{'change':>9}")
+    for scale, timings in results["results"].items():
+        for name, timing in timings.items():
+            before = baseline.get("results", {}).get(scale, {}).get(name)
+            if before is None:
+                continue
+            change = timing["min"] / before["min"] - 1 if before["min"] else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  slower"
+                regressions.append(f"{scale} {name}")
+            elif change < -threshold:
+                flag = "  faster"
+            print(f"{scale:>9}  {name:<40}{before['min'] * 1000:>12.2f}{timing['min'] * 1000:>12.2f}"
+                  f"{change:>+9.0%}{flag}")
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", type=int, nargs="+", default=[10000, 1000000, 10000000],
+                        help="logs of each dataset, one run per scale")
+    parser.add_argument("--services", type=int, default=200, help="services of each dataset")
+    parser.add_argument("--days", type=int, default=30, help="days the logs span")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the dataset")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark, after a warm up one")
+    parser.add_argument("--data-dir", help="folder of the datasets, they are generated once and reused. "
+                                           "A temporary folder, removed at the end, by default")
+    parser.add_argument("--only", nargs="+", default=[], help="only the benchmarks whose name contains one of these")
+    parser.add_argument("--output", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown reported as a regression, 0.2 is 20%%")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    temporary = args.data_dir is None
+    directory = tempfile.mkdtemp(prefix="wsc-bench-") if temporary else args.data_dir
+    os.makedirs(directory, exist_ok=True)
+
+    from benchmarks.dataset import dataset_name, generate
+    from database import dispose_engine
+
+    results = {"created": datetime.now().isoformat(timespec="seconds"), "environment": environment(),
+               "arguments": {"services": args.services, "days": args.days, "seed": args.seed,
+                             "repeat": args.repeat},
+               "results": {}}
+    try:
+        for logs in args.logs:
+            path = os.path.join(directory, dataset_name(args.services, logs, args.days, args.seed))
+            started = time.perf_counter()
+            dataset = generate(path, args.services, logs, args.days, args.seed)
+            print(f"\nDataset of {logs} logs ready in {time.perf_counter() - started:.1f}s")
+
+            from main import create_app
+            app = create_app({"TESTING": True}, create_schema=False)
+            client = app.test_client()
+            login(client)
+
+            timings = results["results"][str(logs)] = {}
+            print(f"{'benchmark':<40}{'min ms':>10}{'median ms':>11}{'max ms':>10}")
+            for name, function in cases(app, client, dataset).items():
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                timing = timings[name] = measure(function, args.repeat)
+                print(f"{name:<40}{timing['min'] * 1000:>10.2f}{timing['median'] * 1000:>11.2f}"
+                      f"{timing['max'] * 1000:>10.2f}")
+            dispose_engine()
+    finally:
+        dispose_engine()
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks are slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""
+Checker of the services: runs the Service.route of every active service with asyncio and writes the results as logs
+
+Run a sweep with: python -m checker --once
+"""
@@ -0,0 +1,68 @@
+"""
+Checks the active services continuously, each one when the scheduler says it is due: python -m checker
+or a single sweep of all of them: python -m checker --once
+"""
+# Standard library imports
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+# Third party imports
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    logging.warning("Package python-dotenv need to be installed")
+    raise ImportError("Package python-dotenv need to be installed")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m checker", description="Checks the active services")
+    parser.add_argument("--once", action="store_true", help="check every service once and exit")
+    parser.add_argument("--intervals", default=os.getenv("CHECK_INTERVALS", ""),
+                        help="seconds between checks per service type, e.g.: temperature_sensor=30,web=120")
+    parser.add_argument("--reload", type=float, default=float(os.getenv("CHECK_RELOAD", 60)),
+                        help="seconds between two reads of the services list")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("CHECK_CONCURRENCY", 100)),
+                        help="checks running at once")
+    parser.add_argument("--per-host", type=int, default=int(os.getenv("CHECK_PER_HOST", 4)),
+                        help="requests in flight per host")
+    parser.add_argument("--timeout", type=float, default=float(os.getenv("CHECK_TIMEOUT", 30)),
+                        help="seconds a check can take")
+    parser.add_argument("--max-body", type=int, default=int(os.getenv("CHECK_MAX_BODY", 5 * 1024 * 1024)),
+                        help="bytes of a page, a larger one makes the check fail")
+    args = parser.parse_args(argv)
+
+    from checker.runner import CheckRunner, Target
+    from checker.scheduler import Scheduler, parse_intervals
+    from database.data_manager import DataManager
+
+    def load_targets() -> list[Target]:
+        services, message = DataManager.get_services(status="active")
+        return [Target.from_service(service) for service in services or []]
+
+    DataManager.create_schema()
+    runner = CheckRunner(concurrency=args.concurrency, limit_per_host=args.per_host, timeout=args.timeout,
+                         max_body_size=args.max_body)
+
+    if args.once:
+        start = time.monotonic()
+        rows = runner.run(load_targets())
+        running = sum(row["status"] == "Running" for row in rows)
+        print(f"Checked {len(rows)} services, {running} running, in {time.monotonic() - start:.2f}s")
+        return 0
+
+    scheduler = Scheduler(intervals=parse_intervals(args.intervals))
+    try:
+        asyncio.run(runner.run_scheduled(scheduler, load_targets, reload_interval=args.reload))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Asyncio HTTP/1.1 client with keep-alive connections pooled per host, built on asyncio streams
+"""
+# Standard library imports
+import asyncio
+import logging
+import ssl
+from typing import NamedTuple, Optional
+from urllib.parse import urlencode, urljoin, urlsplit
+
+USER_AGENT = "WebStatusChecker"
+REDIRECT_STATUSES = frozenset((301, 302, 303, 307, 308))
+# Bytes of a response body kept in memory, a larger response fails the request
+MAX_BODY_SIZE = 5 * 1024 * 1024
+# Header lines read before giving up on a response
+MAX_HEADERS = 100
+# Bytes read at a time from a body without Content-Length
+READ_SIZE = 64 * 1024
+
+
+class HttpError(Exception):
+    """The server closed the connection, sent an incomplete response or answered something that isn't HTTP/1.x"""
+
+
+class ResponseTooLarge(HttpError):
+    """The response has more headers or a larger body than the client accepts, it isn't retried"""
+
+
+class HttpResponse(NamedTuple):
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    url: str
+
+    @property
+    def text(self) -> str:
+        charset = "utf-8"
+        for parameter in self.headers.get("content-type", "").split(";")[1:]:
+            key, _, value = parameter.strip().partition("=")
+            if key.lower() == "charset" and value:
+                charset = value.strip('"')
+        try:
+            return self.body.decode(charset, errors="replace")
+        except LookupError:
+            return self.body.decode("utf-8", errors="replace")
+
+
+class _Connection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class HttpClient:
+    """
+    Sends requests with at most limit_per_host of them in flight per host, idle connections are kept and reused
+    Must be used from a single event loop
+    """
+    __logger = logging.getLogger(__name__)
+
+    def __init__(self, limit_per_host: int = 4, connect_timeout: float = 5.0, verify_ssl: bool = True,
+                 max_body_size: int = MAX_BODY_SIZE):
+        """
+        :param limit_per_host: requests in flight per (scheme, host, port), also the idle connections kept
+        :param connect_timeout: seconds to open a connection
+        :param verify_ssl: check the certificates of https services
+        :param max_body_size: bytes of a response body, a larger one raises ResponseTooLarge
+        """
+        self.limit_per_host = limit_per_host
+        self.connect_timeout = connect_timeout
+        self.max_body_size = max_body_size
+        self._ssl = ssl.create_default_context()
+        if not verify_ssl:
+            self._ssl.check_hostname = False
+            self._ssl.verify_mode = ssl.CERT_NONE
+        self._idle: dict[tuple, list[_Connection]] = {}
+        self._limits: dict[tuple, asyncio.Semaphore] = {}
+        self.opened = 0
+        self.reused = 0
+
+    async def request(self, method: str, url: str,
+                      data: Optional[dict[str, str]] = None,
+                      cookies: Optional[dict[str, str]] = None,
+                      max_redirects: int = 5) -> HttpResponse:
+        """
+        :param method: GET or POST
+        :param url: absolute http or https url
+        :param data: form fields, sent urlencoded in the body of a POST or in the query string of a GET
+        :param cookies: cookies sent, updated with the ones the server sets
+        :param max_redirects: redirects followed
+        :raise HttpError, OSError or asyncio.TimeoutError if the request can't be completed
+        """
+        method = method.upper()
+        for _ in range(max_redirects + 1):
+            body = None
+            if data is not None and method == "GET":
+                url = f"{url.split('?', 1)[0]}?{urlencode(data)}"
+            elif data is not None:
+                body = urlencode(data).encode()
+
+            response = await self._send(method, url, body, cookies)
+            if response.status not in REDIRECT_STATUSES or "location" not in response.headers:
+                return response
+
+            url = urljoin(url, response.headers["location"])
+            if response.status in (301, 302, 303):
+                method, data = "GET", None
+        return response
+
+    async def close(self):
+        for connections in self._idle.values():
+            for connection in connections:
+                connection.close()
+        self._idle.clear()
+
+    def stats(self) -> dict:
+        return {
+            "opened": self.opened,
+            "reused": self.reused,
+            "idle": sum(len(connections) for connections in self._idle.values())
+        }
+
+    async def _send(self, method: str, url: str, body: Optional[bytes],
+                    cookies: Optional[dict[str, str]]) -> HttpResponse:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise HttpError(f"Unsupported url: {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+
+        lines = [f"{method} {parts.path or '/'}{'?' + parts.query if parts.query else ''} HTTP/1.1",
+                 f"Host: {host}",
+                 f"User-Agent: {USER_AGENT}",
+                 "Accept: */*",
+                 "Connection: keep-alive"]
+        if cookies:
+            lines.append("Cookie: " + "; ".join(f"{name}={value}" for name, value in cookies.items()))
+        if body is not None:
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+        if body is not None or method == "POST":
+            lines.append(f"Content-Length: {len(body or b'')}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.limit_per_host)
+
+        async with limit:
+            connection, reused = await self._acquire(key)
+            try:
+                try:
+                    status, headers, payload, keep_alive = await self._exchange(connection, head, body, method)
+                except ResponseTooLarge:
+                    raise
+                except (HttpError, ConnectionError, EOFError):
+                    if not reused:
+                        raise
+                    # The server closed the idle connection, the request is sent once more on a new one
+                    connection.close()
+                    connection, _ = await self._acquire(key, fresh=True)
+                    status, headers, payload, keep_alive = await self._exchange(connection, head, body, method)
+            except BaseException as error:
+                connection.close()
+                if isinstance(error, EOFError):
+                    # asyncio.IncompleteReadError: the body is shorter than its Content-Length or chunk size
+                    raise HttpError(f"Incomplete response from {url}: {error}") from error
+                raise
+
+            if keep_alive and connection.usable:
+                self._idle.setdefault(key, []).append(connection)
+            else:
+                connection.close()
+
+        if cookies is not None:
+            for cookie in headers.pop("set-cookie", []):
+                name, _, value = cookie.split(";", 1)[0].partition("=")
+                if name.strip():
+                    cookies[name.strip()] = value.strip()
+        else:
+            headers.pop("set-cookie", None)
+
+        return HttpResponse(status, headers, payload, url)
+
+    async def _acquire(self, key: tuple, fresh: bool = False) -> tuple[_Connection, bool]:
+        idle = self._idle.get(key, [])
+        while idle and not fresh:
+            connection = idle.pop()
+            if connection.usable:
+                self.reused += 1
+                return connection, True
+            connection.close()
+
+        scheme, hostname, port = key
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(hostname, port, ssl=self._ssl if scheme == "https" else None),
+            self.connect_timeout)
+        self.opened += 1
+        return _Connection(reader, writer), False
+
+    async def _exchange(self, connection: _Connection, head: bytes, body: Optional[bytes],
+                        method: str) -> tuple[int, dict, bytes, bool]:
+        connection.writer.write(head + (body or b""))
+        await connection.writer.drain()
+        reader = connection.reader
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise HttpError("The server closed the connection")
+        try:
+            version, status, _ = status_line.decode("latin-1").split(" ", 2)
+            status = int(status)
+        except ValueError:
+            raise HttpError(f"Invalid status line: {status_line[:100]!r}")
+        if not version.startswith("HTTP/1."):
+            raise HttpError(f"Unsupported protocol: {version}")
+
+        headers: dict = {"set-cookie": []}
+        for _ in range(MAX_HEADERS + 1):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "set-cookie":
+                headers[name].append(value)
+            else:
+                headers[name] = value
+        else:
+            raise ResponseTooLarge(f"More than {MAX_HEADERS} headers")
+
+        connection_header = headers.get("connection", "").lower()
+        keep_alive = connection_header != "close" and (version == "HTTP/1.1" or connection_header == "keep-alive")
+
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            payload = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            received = 0
+            while True:
+                size = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+                received += size
+                self._check_body_size(received)
+                if size == 0:
+                    # Trailers end with an empty line
+                    for _ in range(MAX_HEADERS + 1):
+                        if (await reader.readline()) in (b"\r\n", b"\n", b""):
+                            break
+                    else:
+                        raise ResponseTooLarge(f"More than {MAX_HEADERS} trailers")
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            payload = b"".join(chunks)
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            self._check_body_size(length)
+            payload = await reader.readexactly(length)
+        else:
+            chunks = []
+            received = 0
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                received += len(data)
+                self._check_body_size(received)
+                chunks.append(data)
+            payload = b"".join(chunks)
+            keep_alive = False
+
+        return status, headers, payload, keep_alive
+
+    def _check_body_size(self, size: int):
+        if size > self.max_body_size:
+            raise ResponseTooLarge(f"The body is larger than {self.max_body_size} bytes")
@@ -0,0 +1,138 @@
+"""
+Minimal HTML model used by the checker: finds the elements named by a route and rebuilds the forms to submit
+"""
+# Standard library imports
+from html.parser import HTMLParser
+from typing import Optional
+
+VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source",
+                       "track", "wbr"))
+FIELD_TAGS = frozenset(("input", "select", "textarea", "button"))
+# Inputs that are only sent when they are the one clicked
+BUTTON_TYPES = frozenset(("submit", "button", "image", "reset"))
+
+
+class Element:
+    __slots__ = ("tag", "attrs", "form", "_text")
+
+    def __init__(self, tag: str, attrs: dict[str, str], form: Optional["Form"]):
+        self.tag = tag
+        self.attrs = attrs
+        self.form = form
+        self._text: list[str] = []
+
+    def matches(self, tag: str, attribute: str, value: str) -> bool:
+        if self.tag != tag:
+            return False
+        if attribute == "class":
+            return value in self.attrs.get("class", "").split()
+        return self.attrs.get(attribute) == value
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.attrs.get("name")
+
+    @property
+    def text(self) -> str:
+        return " ".join("".join(self._text).split())
+
+
+class Form:
+    __slots__ = ("action", "method", "fields")
+
+    def __init__(self, action: str, method: str):
+        self.action = action
+        self.method = method
+        self.fields: list[Element] = []
+
+    def values(self, clicked: Optional[Element] = None) -> dict[str, str]:
+        """
+        Gets the values the browser would submit
+        :param clicked: the button that submits the form, it is the only button sent
+        """
+        values = {}
+        for field in self.fields:
+            if not field.name or "disabled" in field.attrs:
+                continue
+            kind = field.attrs.get("type", "text").lower()
+            if field.tag == "button" or (field.tag == "input" and kind in BUTTON_TYPES):
+                if field is clicked:
+                    values[field.name] = field.attrs.get("value", "")
+            elif kind in ("checkbox", "radio"):
+                if "checked" in field.attrs:
+                    values[field.name] = field.attrs.get("value", "on")
+            elif field.tag in ("textarea", "select"):
+                values[field.name] = field.attrs.get("value", field.text if field.tag == "textarea" else "")
+            else:
+                values[field.name] = field.attrs.get("value", "")
+        return values
+
+
+class Document(HTMLParser):
+    """Parses a page once, keeping every element with its text and the form it belongs to"""
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=True)
+        self.elements: list[Element] = []
+        self.forms: list[Form] = []
+        self._open: list[Element] = []
+        self._text: list[str] = []
+        self._form: Optional[Form] = None
+        self._select: Optional[Element] = None
+        self.feed(html)
+        self.close()
+
+    def find(self, tag: str, attribute: str, value: str) -> Optional[Element]:
+        for element in self.elements:
+            if element.matches(tag, attribute, value):
+                return element
+        return None
+
+    @property
+    def text(self) -> str:
+        return " ".join("".join(self._text).split())
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value if value is not None else "" for key, value in attrs}
+        if tag == "form":
+            self._form = Form(attrs.get("action", ""), attrs.get("method", "get").lower())
+            self.forms.append(self._form)
+
+        element = Element(tag, attrs, self._form)
+        self.elements.append(element)
+        if tag in FIELD_TAGS and self._form is not None:
+            self._form.fields.append(element)
+        if tag == "select":
+            self._select = element
+        elif tag == "option" and self._select is not None:
+            # The first option is selected unless another one says so
+            if "value" not in self._select.attrs or "selected" in attrs:
+                self._select.attrs["value"] = attrs.get("value", "")
+
+        if tag not in VOID_TAGS:
+            self._open.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self._open and self._open[-1].tag == tag:
+            self._open.pop()
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "select":
+            self._select = None
+
+        # Unclosed elements inside the one closed are closed too, like browsers do
+        for position in range(len(self._open) - 1, -1, -1):
+            if self._open[position].tag == tag:
+                del self._open[position:]
+                break
+
+    def handle_data(self, data):
+        if self._open and self._open[-1].tag in ("script", "style"):
+            return
+        self._text.append(data)
+        for element in self._open:
+            element._text.append(data)
+
@@ -0,0 +1,311 @@
+"""
+Runs the checks of many services concurrently on one event loop and writes the results as service logs
+"""
+# Standard library imports
+import asyncio
+from datetime import datetime
+import logging
+import time
+from typing import Callable, Iterable, NamedTuple, Optional
+from urllib.parse import urljoin
+
+# Local specific imports
+try:
+    from checker.client import MAX_BODY_SIZE, HttpClient, HttpError, HttpResponse
+    from checker.document import Document
+    from common.routes import Step, route_plans
+    from common.sensors import SENSOR_TYPES, first_number
+except ImportError:
+    logging.warning("Packages checker and common need to be near this package")
+    raise ImportError("Packages checker and common need to be near this package")
+
+RUNNING = "Running"
+NOT_RUNNING = "Not running"
+# other_data is a String column, long texts obtained from a page are cut
+OTHER_DATA_MAX_LENGTH = 255
+# Seconds results can wait before being written when the checks run continuously
+FLUSH_INTERVAL = 1.0
+
+
+class Target(NamedTuple):
+    """The fields of a Service the checker needs, copied so the checks don't touch ORM objects"""
+    app_id: int
+    url: str
+    route: str
+    app_type: str
+    user: Optional[str] = None
+    password: Optional[str] = None
+    sensor_name: Optional[str] = None
+
+    @classmethod
+    def from_service(cls, service) -> "Target":
+        return cls(service.app_id, service.url, service.route, service.app_type,
+                   service.user, service.password, service.other_data1)
+
+
+def _text_after(text: str, name: str) -> Optional[str]:
+    """
+    :return: the text after the name, without the separator, or None if the name isn't in the text
+    """
+    position = text.find(name)
+    # The separator after the name, e.g.: "Temperatura_Area_ISP - 26 °C", is not a minus sign
+    return text[position + len(name):].lstrip(" -:=") if position >= 0 else None
+
+
+class CheckFailed(Exception):
+    """A step of the route couldn't be done, the message ends in other_data"""
+
+
+class CheckRunner:
+    """
+    Checks services with at most concurrency checks in flight, limit_per_host requests per host and a timeout per
+    check. Results are handed to writer in batches of batch_size rows, by default DataManager.bulk_insert_logs
+    """
+    __logger = logging.getLogger(__name__)
+
+    def __init__(self,
+                 writer: Callable[[list[dict]], tuple[bool, str]] = None,
+                 concurrency: int = 100,
+                 limit_per_host: int = 4,
+                 timeout: float = 30.0,
+                 batch_size: int = 500,
+                 verify_ssl: bool = True,
+                 max_body_size: int = MAX_BODY_SIZE):
+        """
+        :param writer: function that commits a list of log rows
+        :param concurrency: checks running at once
+        :param limit_per_host: requests in flight per host
+        :param timeout: seconds a whole check can take, every step included
+        :param batch_size: rows per call to writer
+        :param verify_ssl: check the certificates of https services
+        :param max_body_size: bytes of a page, a larger one makes the check fail
+        """
+        if writer is None:
+            # Imported here so the checker can run without a database, e.g. from the benchmark
+            from database.data_manager import DataManager
+            writer = DataManager.bulk_insert_logs
+
+        self.writer = writer
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.verify_ssl = verify_ssl
+        self.max_body_size = max_body_size
+
+    def _client(self) -> HttpClient:
+        return HttpClient(limit_per_host=self.limit_per_host, verify_ssl=self.verify_ssl,
+                          max_body_size=self.max_body_size)
+
+    @staticmethod
+    def plan(target: Target) -> tuple[Step, ...]:
+        """Compiled once per service and route, not on every check"""
+        return route_plans.get(target.app_id, target.route)
+
+    def run(self, targets: Iterable[Target]) -> list[dict]:
+        """
+        Checks every target and writes the results
+        :return: the log rows, with the keys app_id, status, status_date and other_data
+        """
+        return asyncio.run(self.run_async(list(targets)))
+
+    async def run_async(self, targets: list[Target]) -> list[dict]:
+        client = self._client()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        rows: list[dict] = []
+        pending_writes = []
+        written = 0
+        start = time.perf_counter()
+
+        async def bounded(target: Target) -> dict:
+            async with semaphore:
+                try:
+                    return await self.check(client, target)
+                except Exception as error:
+                    # One service can't end the sweep, the others are still checked and written
+                    self.__logger.exception(f"Unexpected error checking the service {target.app_id}")
+                    return self._row(target, NOT_RUNNING, f"{type(error).__name__}: {error}")
+
+        try:
+            for next_row in asyncio.as_completed([bounded(target) for target in targets]):
+                rows.append(await next_row)
+                if len(rows) - written >= self.batch_size:
+                    # The database is written from a thread so the checks keep running meanwhile
+                    pending_writes.append(loop.run_in_executor(None, self._write, rows[written:]))
+                    written = len(rows)
+            if len(rows) > written:
+                pending_writes.append(loop.run_in_executor(None, self._write, rows[written:]))
+            await asyncio.gather(*pending_writes)
+        finally:
+            await client.close()
+
+        elapsed = time.perf_counter() - start
+        self.__logger.info(f"Checked {len(rows)} services in {elapsed:.2f}s, {client.stats()}")
+        return rows
+
+    async def run_scheduled(self, scheduler, load_targets: Callable[[], Iterable[Target]],
+                            reload_interval: float = 60.0, stop: Optional[asyncio.Event] = None):
+        """
+        Checks the services whenever the scheduler says they are due, until stop is set
+        :param scheduler: a checker.scheduler.Scheduler, it gets the result of every check
+        :param load_targets: function that returns the services to check, called from a thread every reload_interval
+        :param reload_interval: seconds between two calls to load_targets, they also log the scheduler stats
+        :param stop: event that ends the loop, the checks in flight are finished and written
+        """
+        client = self._client()
+        loop = asyncio.get_running_loop()
+        stop = stop or asyncio.Event()
+        in_flight: set[asyncio.Task] = set()
+        writes: set[asyncio.Future] = set()
+        rows: list[dict] = []
+        next_reload = next_flush = loop.time()
+
+        async def scheduled_check(target: Target):
+            try:
+                row = await self.check(client, target)
+            except Exception as error:
+                # The service must go back to the schedule whatever happened
+                self.__logger.exception(f"Unexpected error checking the service {target.app_id}", exc_info=True)
+                row = self._row(target, NOT_RUNNING, f"{type(error).__name__}: {error}")
+            scheduler.record(target.app_id, row["status"])
+            rows.append(row)
+
+        def flush():
+            if rows:
+                write = loop.run_in_executor(None, self._write, rows.copy())
+                writes.add(write)
+                write.add_done_callback(writes.discard)
+                rows.clear()
+
+        try:
+            while not stop.is_set():
+                now = loop.time()
+                if now >= next_reload:
+                    scheduler.sync(await loop.run_in_executor(None, lambda: list(load_targets())))
+                    self.__logger.info(f"Scheduler: {scheduler.stats()}, connections: {client.stats()}")
+                    next_reload = now + reload_interval
+
+                for target in scheduler.pop_due(limit=self.concurrency - len(in_flight)):
+                    task = asyncio.create_task(scheduled_check(target))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+
+                if len(rows) >= self.batch_size or now >= next_flush:
+                    flush()
+                    next_flush = now + FLUSH_INTERVAL
+
+                if len(in_flight) >= self.concurrency:
+                    # Every slot is taken, the next service can start when a check ends
+                    await asyncio.wait(in_flight, timeout=FLUSH_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    next_due = scheduler.next_due_in()
+                    await asyncio.sleep(FLUSH_INTERVAL if next_due is None else min(next_due, FLUSH_INTERVAL))
+        finally:
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            flush()
+            if writes:
+                await asyncio.gather(*writes)
+            await client.close()
+
+    async def check(self, client: HttpClient, target: Target) -> dict:
+        """
+        Runs the route of a service, it is Running if the page loads and every step can be done
+        :return: the log row of the check
+        """
+        status, other_data = RUNNING, ""
+        try:
+            other_data = await asyncio.wait_for(self._run_plan(client, target), self.timeout)
+        except CheckFailed as error:
+            status, other_data = NOT_RUNNING, str(error)
+        except asyncio.TimeoutError:
+            status, other_data = NOT_RUNNING, f"Timeout after {self.timeout}s"
+        except (HttpError, OSError, ValueError) as error:
+            status, other_data = NOT_RUNNING, f"{type(error).__name__}: {error}"
+
+        self.__logger.debug(f"Service {target.app_id} is {status} {other_data}")
+        return self._row(target, status, other_data)
+
+    @staticmethod
+    def _row(target: Target, status: str, other_data: Optional[str]) -> dict:
+        return {"app_id": target.app_id,
+                "status": status,
+                "status_date": datetime.now(),
+                "other_data": (other_data or "")[:OTHER_DATA_MAX_LENGTH]}
+
+    async def _run_plan(self, client: HttpClient, target: Target) -> str:
+        cookies: dict[str, str] = {}
+        response = self._ensure_ok(await client.request("GET", target.url, cookies=cookies))
+        document = Document(response.text)
+        # The first write step gets the user and the second one the password
+        credentials = iter((target.user or "", target.password or ""))
+        written: dict[str, str] = {}
+        obtained = None
+
+        for step in self.plan(target):
+            if step.action == "blank":
+                continue
+            element = document.find(step.tag, step.attribute, step.value)
+            if element is None:
+                raise CheckFailed(f"Element not found: {step}")
+
+            if step.action == "write":
+                if element.name:
+                    written[element.name] = next(credentials, "")
+            elif step.action == "click":
+                if element.tag == "a" and element.attrs.get("href"):
+                    response = await client.request("GET", urljoin(response.url, element.attrs["href"]),
+                                                    cookies=cookies)
+                elif element.form is not None:
+                    form = element.form
+                    values = form.values(clicked=element)
+                    values.update(written)
+                    response = await client.request(form.method.upper(), urljoin(response.url, form.action),
+                                                    data=values, cookies=cookies)
+                else:
+                    raise CheckFailed(f"Nothing to submit: {step}")
+                document = Document(self._ensure_ok(response).text)
+                written = {}
+            elif step.action == "obtain":
+                obtained = element.text
+
+        if target.app_type in SENSOR_TYPES:
+            return self._sensor_reading(target, obtained, document)
+        return obtained or ""
+
+    def _write(self, rows: list[dict]):
+        written, message = self.writer(rows)
+        if not written:
+            self.__logger.error(f"Couldn't write {len(rows)} check results: {message}")
+
+    @staticmethod
+    def _ensure_ok(response: HttpResponse) -> HttpResponse:
+        if response.status >= 400:
+            raise CheckFailed(f"HTTP {response.status} from {response.url}")
+        return response
+
+    @staticmethod
+    def _sensor_reading(target: Target, obtained: Optional[str], document: Document) -> str:
+        """
+        Reads the value of a sensor from the obtained element or, without one, from the text after the sensor name
+        Readings that aren't a number, e.g.: "Sensor_Agua - Normal", are kept as text and the log has no value
+        :return: other_data as common.sensors.parse_value expects it, "<sensor name>-<reading>"
+        """
+        text = obtained
+        if text is None and target.sensor_name:
+            # The innermost element with the sensor name holds the reading, e.g.: the cell "Sensor_Agua - Normal"
+            texts = [element.text for element in document.elements if target.sensor_name in element.text]
+            text = _text_after(min(texts, key=len), target.sensor_name) if texts else None
+            if not text:
+                # Or the next one, e.g.: <td>Temperatura_Area_ISP</td><td>26 °C</td>, only numbers are read from
+                # the rest of the page
+                rest = _text_after(document.text, target.sensor_name)
+                text = rest if first_number(rest) is not None else None
+
+        value = first_number(text)
+        if value is not None:
+            return f"{target.sensor_name or 'Sensor'}-{value}"
+        if not text or not text.strip():
+            raise CheckFailed(f"No reading found for {target.sensor_name or target.app_id}")
+        return f"{target.sensor_name or 'Sensor'}-{text.strip()}"
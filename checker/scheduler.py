@@ -0,0 +1,210 @@
+"""
+Adaptive scheduling of the checks: per AppType intervals with jitter, longer intervals for healthy services and
+shorter ones for failing services, kept in a heap ordered by due time
+"""
+# Standard library imports
+from collections import deque
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Callable, Iterable, Optional
+
+# Local specific imports
+try:
+    from checker.runner import RUNNING, Target
+    from common.models import AppType
+except ImportError:
+    logging.warning("Packages checker and common need to be near this package")
+    raise ImportError("Packages checker and common need to be near this package")
+
+# Seconds between two checks of a service that just changed status, sensors are checked more often
+DEFAULT_INTERVALS: dict[str, float] = {
+    AppType.T_SENSOR.value: 60,
+    AppType.W_SENSOR.value: 60,
+    AppType.WEBAPP.value: 300,
+    AppType.ZABBIX.value: 600,
+}
+
+
+def parse_intervals(value: str) -> dict[str, float]:
+    """
+    :param value: intervals per AppType, e.g.: "temperature_sensor=30,web=120"
+    :return: DEFAULT_INTERVALS updated with the ones given
+    :raise ValueError if a type or an interval is not valid
+    """
+    intervals = dict(DEFAULT_INTERVALS)
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        app_type, _, seconds = item.partition("=")
+        if app_type.strip() not in intervals:
+            raise ValueError(f"Unknown service type {app_type}, it must be one of: {', '.join(intervals)}")
+        intervals[app_type.strip()] = float(seconds)
+    return intervals
+
+
+class _Entry:
+    __slots__ = ("target", "due", "multiplier", "last_status", "in_flight")
+
+    def __init__(self, target: Target, due: float):
+        self.target = target
+        self.due = due
+        self.multiplier = 1.0
+        self.last_status: Optional[str] = None
+        self.in_flight = False
+
+
+class Scheduler:
+    """
+    Decides when each service is checked next. pop_due() hands out the services whose time has come and record()
+    schedules them again with the result of the check. Not thread safe, it is used from the checker event loop
+    """
+    __logger = logging.getLogger(__name__)
+
+    def __init__(self,
+                 intervals: dict[str, float] = None,
+                 jitter: float = 0.1,
+                 backoff: float = 1.5,
+                 max_backoff: float = 4.0,
+                 failing_factor: float = 0.25,
+                 min_interval: float = 10.0,
+                 lag_window: int = 10000,
+                 clock: Callable[[], float] = time.monotonic,
+                 rng: random.Random = None):
+        """
+        :param intervals: base seconds between checks per AppType value, DEFAULT_INTERVALS by default
+        :param jitter: every interval is moved randomly by up to this fraction of it
+        :param backoff: factor applied to the interval of a service after each check that finds it running again
+        :param max_backoff: a healthy service is checked at most every interval * max_backoff seconds
+        :param failing_factor: factor applied to the interval while a service is not running
+        :param min_interval: seconds between two checks of a service, whatever the factors
+        :param lag_window: dispatches kept to compute the lag percentiles
+        :param clock: monotonic time source, replaced in the benchmark
+        """
+        self.intervals = intervals or dict(DEFAULT_INTERVALS)
+        self.jitter = jitter
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failing_factor = failing_factor
+        self.min_interval = min_interval
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._entries: dict[int, _Entry] = {}
+        self._heap: list[tuple[float, int, int]] = []
+        self._sequence = itertools.count()
+        self._lags: deque[float] = deque(maxlen=lag_window)
+        self.dispatched = 0
+        self.lag_max = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def sync(self, targets: Iterable[Target]) -> tuple[int, int]:
+        """
+        Adds the new services, updates the known ones and forgets the ones that are gone
+        New services get a random due time within their interval, so a sweep is spread instead of starting at once
+        :return: a tuple with the number of services added and removed
+        """
+        now = self.clock()
+        seen = set()
+        added = 0
+        for target in targets:
+            seen.add(target.app_id)
+            entry = self._entries.get(target.app_id)
+            if entry is None:
+                entry = self._entries[target.app_id] = _Entry(target, now + self.rng.uniform(0, self.base(target)))
+                self._push(entry)
+                added += 1
+            else:
+                entry.target = target
+
+        removed = [app_id for app_id in self._entries if app_id not in seen]
+        for app_id in removed:
+            # Its heap item is skipped when it comes out
+            del self._entries[app_id]
+
+        if added or removed:
+            self.__logger.info(f"Scheduling {len(self._entries)} services: {added} added, {len(removed)} removed")
+        return added, len(removed)
+
+    def base(self, target: Target) -> float:
+        return self.intervals.get(target.app_type, self.intervals.get(AppType.WEBAPP.value, 300))
+
+    def pop_due(self, limit: int = None) -> list[Target]:
+        """
+        Takes the services due now, the most overdue first, and marks them as being checked
+        :param limit: services taken at most, e.g. the free check slots
+        """
+        now = self.clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+            due_time, _, app_id = heapq.heappop(self._heap)
+            entry = self._entries.get(app_id)
+            if entry is None or entry.in_flight or entry.due != due_time:
+                continue
+
+            entry.in_flight = True
+            lag = now - due_time
+            self._lags.append(lag)
+            self.lag_max = max(self.lag_max, lag)
+            self.dispatched += 1
+            due.append(entry.target)
+        return due
+
+    def next_due_in(self) -> Optional[float]:
+        """
+        :return: seconds until the next service is due, 0 if one is overdue, None if there is nothing scheduled
+        """
+        while self._heap:
+            due_time, _, app_id = self._heap[0]
+            entry = self._entries.get(app_id)
+            if entry is None or entry.in_flight or entry.due != due_time:
+                heapq.heappop(self._heap)
+                continue
+            return max(due_time - self.clock(), 0.0)
+        return None
+
+    def record(self, app_id: int, status: str) -> Optional[float]:
+        """
+        Schedules the next check of a service with the result of the last one
+        :return: the interval chosen in seconds or None if the service was removed meanwhile
+        """
+        entry = self._entries.get(app_id)
+        if entry is None:
+            return None
+
+        if status != RUNNING:
+            entry.multiplier = self.failing_factor
+        elif entry.last_status == RUNNING:
+            entry.multiplier = min(entry.multiplier * self.backoff, self.max_backoff)
+        else:
+            # Back from failing, or first check: start again from the base interval
+            entry.multiplier = 1.0
+        entry.last_status = status
+
+        interval = max(self.base(entry.target) * entry.multiplier, self.min_interval)
+        interval *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+        entry.due = self.clock() + interval
+        entry.in_flight = False
+        self._push(entry)
+        return interval
+
+    def stats(self) -> dict:
+        """
+        Lag is how late a check started after its due time, it grows when the checks can't keep up
+        """
+        lags = sorted(self._lags)
+        now = self.clock()
+        return {
+            "services": len(self._entries),
+            "in_flight": sum(entry.in_flight for entry in self._entries.values()),
+            "overdue": sum(not entry.in_flight and entry.due <= now for entry in self._entries.values()),
+            "dispatched": self.dispatched,
+            "lag_avg": round(sum(lags) / len(lags), 4) if lags else 0.0,
+            "lag_p95": round(lags[min(int(len(lags) * 0.95), len(lags) - 1)], 4) if lags else 0.0,
+            "lag_max": round(self.lag_max, 4),
+            "failing": sum(entry.last_status not in (None, RUNNING) for entry in self._entries.values())
+        }
+
+    def _push(self, entry: _Entry):
+        heapq.heappush(self._heap, (entry.due, next(self._sequence), entry.target.app_id))
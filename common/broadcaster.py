@@ -0,0 +1,147 @@
+"""
+In-process fan-out of events to the Server-Sent Events clients, every message is encoded once for all of them
+"""
+# Standard library imports
+import json
+import os
+import queue
+import threading
+from typing import Any, Optional
+
+# Request threads of a worker kept for the other requests, the /events clients can hold the rest
+RESERVED_THREADS = 2
+
+
+class Subscription:
+    """Bounded queue of encoded messages for one client, the oldest message is dropped when it is full"""
+
+    def __init__(self, max_queue: int = 100):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, message: str):
+        while True:
+            try:
+                self._queue.put_nowait(message)
+                return
+            except queue.Full:
+                # A slow client loses old deltas instead of slowing down the writers
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[str]:
+        """
+        :param timeout: seconds to wait for a message
+        :return: the next message or None if there wasn't one before the timeout
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broadcaster:
+    """Publishes events to every subscription, publish() never blocks on a client"""
+
+    def __init__(self, max_subscribers: int = 100, max_queue: int = 100):
+        """
+        :param max_subscribers: clients connected at once, each one holds a worker thread
+        :param max_queue: messages kept for a client that doesn't read them fast enough
+        """
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self.published = 0
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscriptions)
+
+    def subscribe(self) -> Optional[Subscription]:
+        """
+        :return: a new subscription or None if max_subscribers are already connected
+        """
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self.max_queue)
+            self._subscriptions.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event: str, data: Any) -> int:
+        """
+        Encodes an event as a Server-Sent Events message and queues it for every subscription
+        :param event: name of the event
+        :param data: JSON serializable payload
+        :return: the number of subscriptions the event was queued for
+        """
+        with self._lock:
+            if not self._subscriptions:
+                return 0
+            self._last_id += 1
+            message = f"id: {self._last_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+            for subscription in self._subscriptions:
+                subscription.offer(message)
+            self.published += 1
+            return len(self._subscriptions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscriptions),
+                "published": self.published,
+                "dropped": sum(subscription.dropped for subscription in self._subscriptions)
+            }
+
+
+_broadcaster: Optional[Broadcaster] = None
+_broadcaster_lock = threading.Lock()
+_request_threads: Optional[int] = None
+
+
+def limit_to_threads(threads: int):
+    """
+    Keeps the clients of this process below its request threads, each client holds one while it is connected
+    :param threads: threads serving the requests of this process, e.g.: the gunicorn threads setting
+    """
+    global _request_threads
+
+    _request_threads = threads
+
+
+def get_broadcaster() -> Broadcaster:
+    """
+    Returns the process wide broadcaster, configured by the environment variables EVENTS_MAX_CLIENTS and EVENTS_QUEUE.
+    After limit_to_threads it accepts RESERVED_THREADS clients less than the request threads at most
+    """
+    global _broadcaster
+
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                max_subscribers = int(os.getenv("EVENTS_MAX_CLIENTS", 100))
+                if _request_threads is not None:
+                    max_subscribers = min(max_subscribers, max(_request_threads - RESERVED_THREADS, 0))
+                _broadcaster = Broadcaster(max_subscribers=max_subscribers,
+                                           max_queue=int(os.getenv("EVENTS_QUEUE", 100)))
+    return _broadcaster
+
+
+def _after_fork_in_child():
+    """The clients connected to the parent are not the child's, it starts with a broadcaster of its own"""
+    global _broadcaster, _broadcaster_lock
+
+    _broadcaster_lock = threading.Lock()
+    _broadcaster = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
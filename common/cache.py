@@ -0,0 +1,95 @@
+# Standard library imports
+from collections import OrderedDict
+import os
+import threading
+import time
+from typing import Any, Hashable, Optional
+import weakref
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries also expire ttl seconds after being stored"""
+
+    _MISSING = object()
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0, name: Optional[str] = None):
+        """
+        :param max_size: entries kept, the least recently used one is evicted beyond it
+        :param ttl: seconds an entry is valid, 0 or less disables the cache
+        :param name: name the cache is reported under by cache_stats
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _caches.add(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is self._MISSING or entry[0] < time.monotonic():
+                if entry is not self._MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Removes an entry, or every entry when no key is given
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / requests, 4) if requests else 0.0
+            }
+
+
+_caches: "weakref.WeakSet[TTLCache]" = weakref.WeakSet()
+
+
+def cache_stats() -> dict[str, dict]:
+    """
+    Gets the stats of every named cache of the process
+    :return: a dict with the stats of each cache by name
+    """
+    return {cache.name: cache.stats() for cache in list(_caches) if cache.name}
+
+
+def _after_fork_in_child():
+    """
+    A lock held by another thread of the parent would never be released in the child, every cache gets a new one
+    and starts empty, like the rest of the process wide state after a fork
+    """
+    for cache in list(_caches):
+        cache._lock = threading.Lock()
+        cache._data.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
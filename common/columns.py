@@ -0,0 +1,56 @@
+"""
+Logs of a service decoded column by column into numpy arrays, for the graphs drawn from raw logs
+"""
+# Standard library imports
+import logging
+from typing import NamedTuple, Optional, Sequence
+
+# Third party imports
+try:
+    import numpy as np
+except ImportError:
+    logging.warning("Package numpy need to be installed")
+    raise ImportError("Package numpy need to be installed")
+
+# Local specific imports
+try:
+    from common.sensors import SENSOR_TYPES
+except ImportError:
+    logging.warning("Package common need to be near this package")
+    raise ImportError("Package common need to be near this package")
+
+
+def parse_dates(values: Sequence) -> np.ndarray:
+    """
+    :param values: ISO 8601 strings (as SQLite returns them, with a space or a T) or datetimes
+    :return: a datetime64[us] array, parsed by numpy in a single call
+    """
+    return np.array(values, dtype="datetime64[us]")
+
+
+def epoch_ns(dates: np.ndarray) -> np.ndarray:
+    return dates.astype("datetime64[ns]").astype("int64")
+
+
+class LogColumns(NamedTuple):
+    """status_date, status and, for sensors, the reading of each log, in date order"""
+    status_date: np.ndarray
+    status: np.ndarray
+    reading: Optional[np.ndarray]
+
+    @classmethod
+    def decode(cls, status_dates: Sequence, statuses: Sequence[str], values: Sequence[Optional[float]],
+               app_type: str) -> "LogColumns":
+        """
+        :param status_dates: status_date column as returned by DataManager.get_log_columns
+        :param statuses: status column
+        :param values: value column, the readings parsed when the logs were written, None becomes NaN
+        :param app_type: value of the service's AppType
+        """
+        return cls(status_date=parse_dates(status_dates),
+                   status=np.array(statuses, dtype=object),
+                   reading=np.array(values, dtype=float) if app_type in SENSOR_TYPES else None)
+
+    @property
+    def size(self) -> int:
+        return len(self.status_date)
@@ -0,0 +1,91 @@
+"""
+Reduction of time series to a number of points the browser can draw, bounded by the graph width in pixels
+"""
+# Standard library imports
+import logging
+
+# Third party imports
+try:
+    import numpy as np
+except ImportError:
+    logging.warning("Package numpy need to be installed")
+    raise ImportError("Package numpy need to be installed")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: picks the points that keep the visual shape of a line
+    :param x: sorted numeric x values
+    :param y: numeric y values, same length as x
+    :param threshold: number of points to keep, at least 3
+    :return: the sorted indices of the points kept
+    """
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # The first and last points are always kept, the rest are split in threshold - 2 buckets
+    edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    indices[-1] = length - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else length
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        # Area of the triangle formed by the previous point, each candidate and the next bucket average
+        areas = np.abs((x[previous] - average_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(areas.argmax())
+        indices[bucket + 1] = previous
+
+    return indices
+
+
+def bucket_aggregate(x: np.ndarray, y: np.ndarray, buckets: int) -> tuple[np.ndarray, np.ndarray,
+                                                                          np.ndarray, np.ndarray]:
+    """
+    Splits the x range in buckets of the same width and aggregates y in each non empty one
+    :param x: sorted numeric x values
+    :param y: numeric y values, same length as x
+    :param buckets: number of buckets
+    :return: a tuple of arrays: bucket start, minimum, maximum and mean of y
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if not len(x):
+        empty = np.empty(0)
+        return empty, empty, empty, empty
+
+    edges = np.linspace(x[0], x[-1], max(buckets, 1) + 1)
+    positions = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, len(edges) - 2)
+    used, first = np.unique(positions, return_index=True)
+
+    minimums = np.minimum.reduceat(y, first)
+    maximums = np.maximum.reduceat(y, first)
+    means = np.add.reduceat(y, first) / np.diff(np.append(first, len(y)))
+
+    return edges[used], minimums, maximums, means
+
+
+def collapse_runs(values: np.ndarray) -> np.ndarray:
+    """
+    Run-length collapsing: keeps only the first and last point of each run of equal values
+    :param values: the series, e.g. the status of each log
+    :return: the sorted indices of the points kept
+    """
+    values = np.asarray(values)
+    length = len(values)
+    if length <= 2:
+        return np.arange(length)
+
+    changes = np.flatnonzero(values[1:] != values[:-1])
+    # Last point of each run and first point of the next one
+    indices = np.concatenate(([0], changes, changes + 1, [length - 1]))
+    return np.unique(indices)
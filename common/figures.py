@@ -0,0 +1,87 @@
+"""
+Plotly figures built as plain JSON, the browser draws them with plotly.js so the plotly package is not needed to
+serve the graphs. Only what the service graphs use is supported: scatter traces on one x axis and up to two y axes
+"""
+# Standard library imports
+from datetime import date, datetime
+import json
+import math
+from typing import Any
+
+# Look of the default plotly template ("plotly") for cartesian graphs, sent with every figure
+TEMPLATE: dict = {
+    "data": {"scatter": [{"marker": {"colorbar": {"outlinewidth": 0, "ticks": ""}}, "type": "scatter"}]},
+    "layout": {
+        "colorway": ["#636efa", "#EF553B", "#00cc96", "#ab63fa", "#FFA15A",
+                     "#19d3f3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52"],
+        "font": {"color": "#2a3f5f"},
+        "hoverlabel": {"align": "left"},
+        "hovermode": "closest",
+        "paper_bgcolor": "white",
+        "plot_bgcolor": "#E5ECF6",
+        "title": {"x": 0.05},
+        "xaxis": {"automargin": True, "gridcolor": "white", "linecolor": "white", "ticks": "",
+                  "title": {"standoff": 15}, "zerolinecolor": "white", "zerolinewidth": 2},
+        "yaxis": {"automargin": True, "gridcolor": "white", "linecolor": "white", "ticks": "",
+                  "title": {"standoff": 15}, "zerolinecolor": "white", "zerolinewidth": 2}
+    }
+}
+
+
+def to_list(values) -> list:
+    """
+    Converts the values of a trace to something json can encode: datetimes become ISO 8601 strings and NaN None
+    :param values: a list, a numpy array or a pandas Series
+    """
+    if hasattr(values, "to_numpy"):
+        values = values.to_numpy()
+
+    dtype = getattr(values, "dtype", None)
+    if dtype is None:
+        return [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+
+    if dtype.kind == "M":
+        # numpy is already loaded if there is an array
+        import numpy as np
+        return np.datetime_as_string(values, unit="auto").tolist()
+    if dtype.kind == "f":
+        return [None if math.isnan(value) else value for value in values.tolist()]
+    return values.tolist()
+
+
+class Figure:
+    """Same JSON as plotly.subplots.make_subplots(specs=[[{"secondary_y": True}]]) with go.Scatter traces"""
+
+    def __init__(self):
+        self.data: list[dict] = []
+        self.layout: dict = {
+            "template": TEMPLATE,
+            "xaxis": {"anchor": "y", "domain": [0.0, 0.94]},
+            "yaxis": {"anchor": "x", "domain": [0.0, 1.0]},
+            "yaxis2": {"anchor": "x", "overlaying": "y", "side": "right"}
+        }
+
+    def add_scatter(self, x, y, secondary_y: bool = False, **attributes: Any) -> "Figure":
+        """
+        :param x: values of the x axis
+        :param y: values of the y axis
+        :param secondary_y: draw the trace against the right y axis
+        :param attributes: plotly.js scatter attributes, e.g.: name, mode, line
+        """
+        self.data.append({**attributes,
+                          "x": to_list(x),
+                          "y": to_list(y),
+                          "type": "scatter",
+                          "xaxis": "x",
+                          "yaxis": "y2" if secondary_y else "y"})
+        return self
+
+    def update_yaxes(self, secondary_y: bool = False, **attributes: Any) -> "Figure":
+        self.layout["yaxis2" if secondary_y else "yaxis"].update(attributes)
+        return self
+
+    def to_dict(self) -> dict:
+        return {"data": self.data, "layout": self.layout}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"))
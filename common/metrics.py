@@ -0,0 +1,220 @@
+"""
+Process wide metrics in the Prometheus text format: request latency, database queries attributed to the Flask
+endpoint that ran them and slow query logging. The counters are plain dicts behind a lock, cheap enough to leave on
+"""
+# Standard library imports
+from bisect import bisect_left
+from contextvars import ContextVar
+import logging
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+# Queries run outside of a request (rollup worker, ingest buffer, checker) are counted under this endpoint
+BACKGROUND = "background"
+# Parameters of a slow query are cut to this many characters in the log
+SLOW_QUERY_PARAMETERS_LENGTH = 1000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+QUERIES_PER_REQUEST_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+slow_query_logger = logging.getLogger("database.slow_queries")
+
+
+def _label_pairs(names: tuple[str, ...], values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Thread safe counter by label values"""
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_values, value in values:
+            labels = _label_pairs(self.labels, label_values)
+            lines.append(f"{self.name}{{{labels}}} {_number(value)}" if labels else f"{self.name} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Thread safe histogram by label values, with fixed buckets"""
+
+    def __init__(self, name: str, description: str, buckets: Iterable[float], labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: the count of each bucket (not cumulative), the +Inf one last, then the sum
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted((label_values, list(counts)) for label_values, counts in self._series.items())
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_values, counts in series:
+            labels = _label_pairs(self.labels, label_values)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_number(bound)}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+def collected(name: str, description: str, values: dict, label: Optional[str] = None,
+              kind: str = "gauge") -> list[str]:
+    """
+    Renders a metric whose values are read at scrape time, e.g. from the stats() of a cache
+    :param values: value by label value, or a single value by None when there isn't any label
+    :param kind: gauge or counter
+    """
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for label_value, value in values.items():
+        labels = f'{{{label}="{_escape(label_value)}"}}' if label is not None else ""
+        lines.append(f"{name}{labels} {_number(value)}")
+    return lines
+
+
+class RequestMetrics:
+    """What the queries of the current request added up to"""
+    __slots__ = ("endpoint", "started", "queries", "query_seconds")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request", default=None)
+
+requests_total = Counter("wsc_http_requests_total", "HTTP requests answered", ("endpoint", "method", "status"))
+request_duration = Histogram("wsc_http_request_duration_seconds",
+                             "Seconds from the start of a request until its response is ready (before streaming)",
+                             LATENCY_BUCKETS, ("endpoint",))
+request_queries = Histogram("wsc_http_request_queries", "Database queries run per request",
+                            QUERIES_PER_REQUEST_BUCKETS, ("endpoint",))
+query_duration = Histogram("wsc_db_query_duration_seconds", "Seconds each database query took, by endpoint",
+                           QUERY_BUCKETS, ("endpoint",))
+slow_queries = Counter("wsc_db_slow_queries_total", "Database queries slower than SLOW_QUERY_MS", ("endpoint",))
+
+METRICS: tuple = (requests_total, request_duration, request_queries, query_duration, slow_queries)
+
+
+def start_request(endpoint: Optional[str]) -> RequestMetrics:
+    """Starts counting the queries of a request, until end_request"""
+    metrics = RequestMetrics(endpoint or "unmatched")
+    current_request.set(metrics)
+    return metrics
+
+
+def end_request(method: str, status: int) -> Optional[RequestMetrics]:
+    """
+    Records the latency and the queries of the current request
+    :return: its metrics, None if start_request wasn't called
+    """
+    metrics = current_request.get()
+    if metrics is None:
+        return None
+    requests_total.inc(metrics.endpoint, method, status)
+    request_duration.observe(time.perf_counter() - metrics.started, metrics.endpoint)
+    request_queries.observe(metrics.queries, metrics.endpoint)
+    return metrics
+
+
+def clear_request():
+    """The queries run from now on in this thread are background ones"""
+    current_request.set(None)
+
+
+def observe_query(seconds: float, statement: str, parameters, executemany: bool, slow_seconds: float):
+    """
+    Attributes a query to the current endpoint and logs it when it took slow_seconds or more
+    :param slow_seconds: 0 or less doesn't log any query
+    """
+    metrics = current_request.get()
+    if metrics is not None:
+        endpoint = metrics.endpoint
+        metrics.queries += 1
+        metrics.query_seconds += seconds
+    else:
+        endpoint = BACKGROUND
+    query_duration.observe(seconds, endpoint)
+
+    if 0 < slow_seconds <= seconds:
+        slow_queries.inc(endpoint)
+        if executemany:
+            parameters = f"{len(parameters)} parameter sets, the first one: {parameters[0] if parameters else None}"
+        parameters = str(parameters)
+        if len(parameters) > SLOW_QUERY_PARAMETERS_LENGTH:
+            parameters = parameters[:SLOW_QUERY_PARAMETERS_LENGTH] + "..."
+        slow_query_logger.warning(f"Slow query ({seconds * 1000:.1f} ms) in {endpoint}: "
+                                  f"{' '.join(statement.split())} parameters: {parameters}")
+
+
+def render(*extra: list[str]) -> str:
+    """
+    :param extra: lines of the metrics collected by the caller
+    :return: every metric in the Prometheus text format
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for metric_lines in extra:
+        lines.extend(metric_lines)
+    return "\n".join(lines) + "\n"
+
+
+def _after_fork_in_child():
+    # The workers count their own requests, what the master did before the fork isn't theirs
+    for metric in METRICS:
+        metric.reset()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
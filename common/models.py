@@ -7,8 +7,9 @@ from typing import Final, TypeVar
 
 # Third party imports
 try:
-    from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
-    from sqlalchemy.orm import relationship, validates
+    from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index, MetaData, \
+        PrimaryKeyConstraint, Table
+    from sqlalchemy.orm import relationship, validates, declared_attr
 except ImportError:
     logging.warning("Package sqlalchemy need to be installed")
     raise ImportError("Package sqlalchemy need to be installed")
@@ -16,9 +17,10 @@ except ImportError:
 # Local specific imports
 try:
     from database import Base
+    from common.routes import ROUTE_PATTERN, ROUTE_PATTERN_LEN, Step, compile_route, route_plans
 except ImportError:
-    logging.warning("Package database need to be near this package")
-    raise ImportError("Package database need to be near this package")
+    logging.warning("Packages database and common need to be near this package")
+    raise ImportError("Packages database and common need to be near this package")
 
 
 T = TypeVar('T', bound='AppType')
@@ -68,7 +70,7 @@ class Service(Base):
     # e.g.: click:input:name:login_button
     # e.g.: obtain:div:class:infoContainer
     # Ensure that the chosen attributes identify a single element in the html page
-    __route_pattern: Final[str] = "<action>:<tag_name>:<tag_attribute>:<attribute_value>"
+    __route_pattern: Final[str] = ROUTE_PATTERN
 
     def __init__(self,
                  name: str,
@@ -125,17 +127,10 @@ class Service(Base):
 
     @validates("route")
     def validate_route(self, key, value):
-        is_valid = True
-        for route in value.split("|"):
-            route = route.split(":")
-            if len(route) != self.route_pattern_len or \
-                    route[0] not in ("write", "click", "obtain", "blank") or \
-                    route[2] not in ("id", "class", "name", "blank"):
-                is_valid = False
-
-        if is_valid:
-            return "".join(value.split())
-        raise ValueError(f"The route must have the pattern {self.__route_pattern}")
+        route = "".join(value.split())
+        # Raises ValueError if a step doesn't follow the pattern
+        compile_route(route)
+        return route
 
     @validates("app_type")
     def validate_app_type(self, key, value):
@@ -150,7 +145,14 @@ class Service(Base):
 
     @property
     def route_pattern_len(self) -> int:
-        return len(self.__route_pattern.split(":"))
+        return ROUTE_PATTERN_LEN
+
+    @property
+    def route_plan(self) -> tuple[Step, ...]:
+        """
+        The route parsed in steps, from the cache shared by the checker and the admin pages
+        """
+        return route_plans.get(self.app_id, self.route)
 
     def to_dict(self):
         return {
@@ -167,11 +169,24 @@ class Service(Base):
 
 class ServiceLog(Base):
     __tablename__ = 'service_log'
+    __table_args__ = (
+        # Date range scans of a single service: DataManager.get_logs
+        Index("ix_service_log_app_id_status_date", "app_id", "status_date"),
+        # Covers max(status_date) ... WHERE status = ? GROUP BY app_id: DataManager.get_last_active_time
+        Index("ix_service_log_status_app_id_status_date", "status", "app_id", "status_date"),
+        # Date range scans across every service
+        Index("ix_service_log_status_date", "status_date"),
+        # The rollup watermark, retention and partitions rely on log_id growing: without AUTOINCREMENT SQLite reuses
+        # the ids once the table is emptied
+        {"sqlite_autoincrement": True},
+    )
 
     log_id = Column(Integer, primary_key=True)
     status = Column(String, nullable=False)
     status_date = Column(DateTime, nullable=False)
     other_data = Column(String, nullable=True)
+    # Numeric reading of the sensors, parsed from other_data when the log is written (common.sensors)
+    value = Column(Float, nullable=True)
     app_id = Column(Integer, ForeignKey('service.app_id'))
     service = relationship("Service", back_populates="logs", lazy="joined")
 
@@ -201,6 +216,186 @@ class ServiceLog(Base):
         return f'{self.service} - {self.status} - {self.status_date.strftime("%d/%m/%Y %H:%M:%S")}'
 
 
+class ServiceStatusCurrent(Base):
+    """Latest known status of each service, kept up to date every time logs are committed"""
+    __tablename__ = 'service_status_current'
+
+    app_id = Column(Integer, ForeignKey('service.app_id'), primary_key=True)
+    last_status = Column(String, nullable=False)
+    last_status_date = Column(DateTime, nullable=False)
+    last_running_date = Column(DateTime, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, app_id: int):
+        self.app_id = app_id
+        self.consecutive_failures = 0
+
+    def apply_log(self, status: str, status_date: datetime):
+        """
+        Folds a new log into the current status
+        :param status: status of the log
+        :param status_date: date of the log, logs older than last_status_date only move last_running_date
+        """
+        if status == "Running" and (self.last_running_date is None or status_date > self.last_running_date):
+            self.last_running_date = status_date
+
+        if self.last_status_date is not None and status_date < self.last_status_date:
+            return
+
+        self.last_status = status
+        self.last_status_date = status_date
+        self.consecutive_failures = 0 if status == "Running" else (self.consecutive_failures or 0) + 1
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.app_id}, {self.last_status}, {self.last_status_date}, ' \
+               f'{self.last_running_date}, {self.consecutive_failures})'
+
+
+class RollupMixin:
+    """Aggregated logs of a service in a time bucket, merged incrementally by database.rollups"""
+    resolution: str
+    __table_args__ = (PrimaryKeyConstraint("app_id", "bucket_start"),)
+
+    @declared_attr
+    def app_id(cls):
+        return Column(Integer, ForeignKey('service.app_id'), nullable=False)
+
+    bucket_start = Column(DateTime, nullable=False)
+    count_total = Column(Integer, nullable=False, default=0)
+    count_running = Column(Integer, nullable=False, default=0)
+    uptime = Column(Float, nullable=False, default=0.0)
+    first_status_date = Column(DateTime, nullable=True)
+    last_status_date = Column(DateTime, nullable=True)
+    # Numeric reading of the sensors (temperature, water), empty for services without readings
+    value_count = Column(Integer, nullable=False, default=0)
+    value_sum = Column(Float, nullable=True)
+    value_min = Column(Float, nullable=True)
+    value_max = Column(Float, nullable=True)
+
+    def __init__(self, app_id: int, bucket_start: datetime):
+        self.app_id = app_id
+        self.bucket_start = bucket_start
+        self.count_total = 0
+        self.count_running = 0
+        self.uptime = 0.0
+        self.value_count = 0
+
+    @property
+    def count_not_running(self) -> int:
+        return self.count_total - self.count_running
+
+    @property
+    def value_avg(self):
+        return self.value_sum / self.value_count if self.value_count else None
+
+    def merge(self, other: "RollupMixin"):
+        """
+        Adds the aggregates of another bucket of the same service and time
+        :param other: a rollup with the aggregates of new logs
+        """
+        self.count_total += other.count_total
+        self.count_running += other.count_running
+        self.uptime = self.count_running / self.count_total if self.count_total else 0.0
+        if other.first_status_date and (not self.first_status_date or other.first_status_date < self.first_status_date):
+            self.first_status_date = other.first_status_date
+        if other.last_status_date and (not self.last_status_date or other.last_status_date > self.last_status_date):
+            self.last_status_date = other.last_status_date
+
+        if other.value_count:
+            self.value_count += other.value_count
+            self.value_sum = (self.value_sum or 0.0) + other.value_sum
+            self.value_min = other.value_min if self.value_min is None else min(self.value_min, other.value_min)
+            self.value_max = other.value_max if self.value_max is None else max(self.value_max, other.value_max)
+
+    def add_log(self, status: str, status_date: datetime, value: float = None):
+        """
+        Folds a single log into the bucket
+        :param status: status of the log
+        :param status_date: date of the log
+        :param value: numeric reading of the log, if any
+        """
+        other = type(self)(self.app_id, self.bucket_start)
+        other.count_total = 1
+        other.count_running = 1 if status == "Running" else 0
+        other.first_status_date = other.last_status_date = status_date
+        if value is not None:
+            other.value_count = 1
+            other.value_sum = other.value_min = other.value_max = value
+        self.merge(other)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.app_id}, {self.bucket_start}, {self.count_total}, ' \
+               f'{self.count_running}, {self.value_min}, {self.value_avg}, {self.value_max})'
+
+
+class ServiceLogHourly(RollupMixin, Base):
+    __tablename__ = 'service_log_hourly'
+    resolution = "hour"
+
+
+class ServiceLogDaily(RollupMixin, Base):
+    __tablename__ = 'service_log_daily'
+    resolution = "day"
+
+
+class RollupWatermark(Base):
+    """Last log already folded into the rollup tables"""
+    __tablename__ = 'rollup_watermark'
+
+    name = Column(String, primary_key=True)
+    last_log_id = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, name: str, last_log_id: int = 0):
+        self.name = name
+        self.last_log_id = last_log_id
+
+
+class LogPartition(Base):
+    """A month of service_log moved to its own table, see database.partitions"""
+    __tablename__ = 'log_partition'
+    ATTACHED = "attached"
+    DETACHED = "detached"
+    ARCHIVED = "archived"
+
+    name = Column(String, primary_key=True)
+    month_start = Column(DateTime, nullable=False)
+    month_end = Column(DateTime, nullable=False)
+    # attached: read along with service_log, detached: moved to the SQLite file in path,
+    # archived: exported to the CSV files under path
+    state = Column(String, nullable=False, default=ATTACHED)
+    path = Column(String, nullable=True)
+
+    def __init__(self, name: str, month_start: datetime, month_end: datetime):
+        self.name = name
+        self.month_start = month_start
+        self.month_end = month_end
+        self.state = self.ATTACHED
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name}, {self.month_start}, {self.month_end}, {self.state}, {self.path})'
+
+
+# Tables of the partitions, outside Base.metadata so create_all doesn't create them
+partition_metadata = MetaData()
+
+
+def service_log_partition(name: str) -> Table:
+    """
+    Table of a month of service_log: same columns and indexes, without the foreign key so it can be detached
+    :param name: name of the partition, e.g.: service_log_202201
+    """
+    table = partition_metadata.tables.get(name)
+    if table is None:
+        log = ServiceLog.__table__
+        table = Table(name, partition_metadata,
+                      *(Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                               autoincrement=False)
+                        for column in log.columns))
+        for index in log.indexes:
+            Index(index.name.replace(log.name, name, 1), *(table.c[column.name] for column in index.columns))
+    return table
+
+
 class User(Base):
     __tablename__ = 'users'
 
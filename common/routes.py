@@ -0,0 +1,131 @@
+"""
+Service.route DSL: every route is parsed once into immutable steps, cached per service
+"""
+# Standard library imports
+import os
+import threading
+from typing import Final, Iterator, Optional
+
+ROUTE_PATTERN: Final[str] = "<action>:<tag_name>:<tag_attribute>:<attribute_value>"
+ROUTE_PATTERN_LEN: Final[int] = len(ROUTE_PATTERN.split(":"))
+ACTIONS: Final[tuple[str, ...]] = ("write", "click", "obtain", "blank")
+ATTRIBUTES: Final[tuple[str, ...]] = ("id", "class", "name", "blank")
+
+
+class Step:
+    """One <action>:<tag_name>:<tag_attribute>:<attribute_value> of a route, it can't be modified"""
+    __slots__ = ("action", "tag", "attribute", "value")
+
+    def __init__(self, action: str, tag: str, attribute: str, value: str):
+        object.__setattr__(self, "action", action)
+        object.__setattr__(self, "tag", tag)
+        object.__setattr__(self, "attribute", attribute)
+        object.__setattr__(self, "value", value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter((self.action, self.tag, self.attribute, self.value))
+
+    def __eq__(self, other):
+        return isinstance(other, Step) and tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.action}, {self.tag}, {self.attribute}, {self.value})'
+
+    def __str__(self):
+        return ":".join(self)
+
+    def to_dict(self):
+        return {
+            "action": self.action,
+            "tag": self.tag,
+            "attribute": self.attribute,
+            "value": self.value
+        }
+
+
+def compile_route(route: str) -> tuple[Step, ...]:
+    """
+    Parses a route, blank steps included
+    :param route: a route as stored in Service.route, e.g.: "write:input:id:login_user|click:input:name:login"
+    :return: the steps in the order they have to run
+    :raise ValueError if a step doesn't follow the pattern action:tag_name:tag_attribute:attribute_value
+    """
+    steps = []
+    for part in "".join(route.split()).split("|"):
+        fields = part.split(":")
+        if len(fields) != ROUTE_PATTERN_LEN or fields[0] not in ACTIONS or fields[2] not in ATTRIBUTES:
+            raise ValueError(f"The route must have the pattern {ROUTE_PATTERN}")
+        steps.append(Step(*fields))
+    return tuple(steps)
+
+
+class RoutePlanCache:
+    """Compiled routes by app_id, a plan is compiled again only when the route of its service changes"""
+
+    def __init__(self):
+        self._plans: dict[int, tuple[str, tuple[Step, ...]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, app_id: Optional[int], route: str) -> tuple[Step, ...]:
+        """
+        :param app_id: id of the service, services not saved yet (None) are compiled without being cached
+        :param route: the current route of the service
+        :raise ValueError if the route is not valid
+        """
+        if app_id is None:
+            return compile_route(route)
+
+        with self._lock:
+            cached = self._plans.get(app_id)
+            if cached is not None and cached[0] == route:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        plan = compile_route(route)
+        with self._lock:
+            self._plans[app_id] = (route, plan)
+        return plan
+
+    def invalidate(self, app_id: Optional[int] = None):
+        """
+        Drops the plan of a service, or every plan when no app_id is given
+        """
+        with self._lock:
+            if app_id is None:
+                self._plans.clear()
+            else:
+                self._plans.pop(app_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._plans),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / requests, 4) if requests else 0.0
+            }
+
+
+# Shared by the checker and the admin pages
+route_plans = RoutePlanCache()
+
+
+def _after_fork_in_child():
+    # The plans are still valid in the child, only the lock could have been held by another thread
+    route_plans._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
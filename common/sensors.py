@@ -0,0 +1,55 @@
+# Standard library imports
+import logging
+import re
+from typing import Callable, Optional
+
+# Local specific imports
+try:
+    from common.models import AppType
+except ImportError:
+    logging.warning("Package common need to be near this package")
+    raise ImportError("Package common need to be near this package")
+
+
+NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def first_number(text: str) -> Optional[float]:
+    """
+    :return: the first number written in the text, e.g.: 26.5 for "Temperatura 26,5 °C", or None
+    """
+    match = NUMBER.search(text or "")
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def reading_after_dash(other_data: str) -> Optional[float]:
+    """
+    :param other_data: "<sensor name>-<reading>", e.g.: "Temperatura_Area_ISP-23.5" or, as the sensor pages write
+    it, "Temperatura_Area_ISP - 26 °C"
+    :return: the first number after the dash or None if there isn't one, e.g.: for "Sensor_Agua - Normal"
+    """
+    _, separator, reading = other_data.partition("-")
+    return first_number(reading) if separator else None
+
+
+# Parser of the reading each AppType writes in other_data, it is stored in ServiceLog.value when the log is written
+READING_PARSERS: dict[str, Callable[[str], Optional[float]]] = {
+    AppType.T_SENSOR.value: reading_after_dash,
+    AppType.W_SENSOR.value: reading_after_dash,
+}
+
+# Services whose logs carry a numeric reading
+SENSOR_TYPES: frozenset[str] = frozenset(READING_PARSERS)
+
+
+def parse_value(app_type: str, other_data: Optional[str]) -> Optional[float]:
+    """
+    Extracts the numeric reading of a sensor log
+    :param app_type: value of the service's AppType
+    :param other_data: other_data of the log
+    :return: the reading or None if the service is not a sensor or the log doesn't have a valid reading
+    """
+    parser = READING_PARSERS.get(app_type)
+    if parser is None or not other_data:
+        return None
+    return parser(other_data)
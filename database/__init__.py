@@ -1,31 +1,285 @@
 # Standard library imports
 import os
 import logging
+import threading
+import time
 
 # Third party imports
 try:
-    from sqlalchemy import create_engine
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.exc import DisconnectionError, TimeoutError as PoolTimeoutError
+    from sqlalchemy.engine import make_url
     from sqlalchemy.ext.declarative import declarative_base
     from sqlalchemy.orm import sessionmaker, scoped_session
+    from sqlalchemy.pool import QueuePool
 except ImportError:
     logging.warning("Package sqlalchemy need to be installed")
     raise ImportError("Package sqlalchemy need to be installed")
 
-SQL_CONNECTION = os.getenv('SQL_CONNECTION')
+# Local specific imports
+try:
+    from common.metrics import observe_query
+except ImportError:
+    logging.warning("Package common need to be near this package")
+    raise ImportError("Package common need to be near this package")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 
 __logger = logging.getLogger(__name__)
-__logger.info(f"Initiating Database connection")
-__logger.debug(f"Initiating Database connection to {SQL_CONNECTION}")
 
 Base = declarative_base()
 
 
+class PoolStats:
+    """Thread safe counters about the connection pool usage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.checked_out = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def on_connect(self):
+        with self._lock:
+            self.connections += 1
+
+    def on_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+
+    def on_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out -= 1
+
+    def on_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+            if timed_out:
+                self.timeouts += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checked_out": self.checked_out,
+                "timeouts": self.timeouts,
+                "wait_total_seconds": round(self.wait_total, 6),
+                "wait_max_seconds": round(self.wait_max, 6),
+                "wait_avg_seconds": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout had to wait for a connection"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            pool_stats.on_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.on_wait(time.perf_counter() - start)
+        return connection
+
+
+_engine = None
+_session_registry = None
+_registry_lock = threading.Lock()
+
+
+def _is_sqlite_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _create_engine(connection: str):
+    # Settings are read here and not at import time, so a .env file loaded by the entry point is honored
+    sqlite_wal = _env_bool('SQLITE_WAL', True)
+    sqlite_busy_timeout = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+    query_metrics = _env_bool('METRICS', True)
+    slow_query_seconds = float(os.getenv('SLOW_QUERY_MS', 500)) / 1000
+
+    url = make_url(connection)
+    is_sqlite = url.get_backend_name() == "sqlite"
+    kwargs = {}
+
+    if is_sqlite:
+        kwargs["connect_args"] = {"check_same_thread": False,
+                                  "timeout": sqlite_busy_timeout / 1000}
+
+    # Connection pool configuration, ignored for in-memory SQLite databases
+    if not _is_sqlite_memory(url):
+        kwargs.update(poolclass=InstrumentedQueuePool,
+                      pool_size=int(os.getenv('SQL_POOL_SIZE', 5)),
+                      max_overflow=int(os.getenv('SQL_POOL_MAX_OVERFLOW', 10)),
+                      pool_timeout=float(os.getenv('SQL_POOL_TIMEOUT', 30)),
+                      pool_pre_ping=_env_bool('SQL_POOL_PRE_PING', True),
+                      pool_recycle=int(os.getenv('SQL_POOL_RECYCLE', 1800)))
+
+    engine = create_engine(url, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        pool_stats.on_connect()
+        if is_sqlite:
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"PRAGMA busy_timeout = {sqlite_busy_timeout}")
+            # Only applies to new database files, it lets database.retention.compact free pages step by step
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            if sqlite_wal and not _is_sqlite_memory(url):
+                cursor.execute("PRAGMA journal_mode = WAL")
+                cursor.execute("PRAGMA synchronous = NORMAL")
+            cursor.close()
+
+    @event.listens_for(engine, "connect")
+    def remember_pid(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        # A connection opened before a fork belongs to the parent, the pool replaces it with a new one
+        if connection_record.info.get("pid") != os.getpid():
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise DisconnectionError(f"Connection record belongs to pid {connection_record.info.get('pid')}, "
+                                     f"attempting to check out in pid {os.getpid()}")
+        pool_stats.on_checkout()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        pool_stats.on_checkin()
+
+    if query_metrics:
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context.query_started = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            started = getattr(context, "query_started", None)
+            if started is not None:
+                observe_query(time.perf_counter() - started, statement, parameters, executemany, slow_query_seconds)
+
+    return engine
+
+
 def get_engine():
-    return create_engine(SQL_CONNECTION)  # , connect_args={"check_same_thread": False})
+    """
+    Returns the process wide engine, creating it on first use
+    :return: a sqlalchemy Engine bound to the SQL_CONNECTION environment variable
+    """
+    global _engine
+
+    if _engine is None:
+        with _registry_lock:
+            if _engine is None:
+                connection = os.getenv('SQL_CONNECTION')
+                __logger.info(f"Initiating Database connection")
+                __logger.debug(f"Initiating Database connection to {connection}")
+                _engine = _create_engine(connection)
+    return _engine
+
+
+def _get_session_registry():
+    global _session_registry
+
+    if _session_registry is None:
+        engine = get_engine()
+        with _registry_lock:
+            if _session_registry is None:
+                _session_registry = scoped_session(sessionmaker(bind=engine))
+    return _session_registry
 
 
 def get_session():
-    engine = get_engine()
-    Session = scoped_session(sessionmaker(bind=engine))
-    session = Session()
-    return session
+    """
+    Returns the session bound to the current scope (thread), it is discarded by remove_session
+    :return: a sqlalchemy Session
+    """
+    return _get_session_registry()()
+
+
+def new_session():
+    """
+    Returns a session outside of the current scope, for work that outlives it like streaming a response
+    The caller must close it
+    :return: a sqlalchemy Session
+    """
+    return _get_session_registry().session_factory()
+
+
+def remove_session(exception=None):
+    """
+    Closes and discards the session of the current scope, meant to be used as an app teardown hook
+    :param exception: exception passed by the teardown hook, it isn't used
+    """
+    if _session_registry is not None:
+        _session_registry.remove()
+
+
+def dispose_engine():
+    """
+    Drops the process wide engine and its pooled connections, the next call to get_engine creates a new one
+    """
+    global _engine, _session_registry
+
+    with _registry_lock:
+        if _session_registry is not None:
+            _session_registry.remove()
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _session_registry = None
+
+
+def _after_fork_in_child():
+    """
+    The child of a fork (e.g. a WSGI worker) must not share the parent's pooled connections: it forgets the engine
+    without closing them, they are still the parent's, and creates its own on first use
+    """
+    global _engine, _session_registry, _registry_lock
+
+    _registry_lock = threading.Lock()
+    _engine = None
+    _session_registry = None
+    pool_stats.__init__()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_pool_stats() -> dict:
+    """
+    Gets the connection pool metrics
+    :return: a dict with the checkout counters and wait times, plus the current pool status
+    """
+    stats = pool_stats.to_dict()
+    if _engine is not None and isinstance(_engine.pool, QueuePool):
+        pool = _engine.pool
+        stats.update(pool_size=pool.size(),
+                     pool_checked_in=pool.checkedin(),
+                     pool_overflow=pool.overflow())
+    return stats
@@ -0,0 +1,207 @@
+"""
+Maintenance commands for the database, run them with: python -m database <command>
+"""
+# Standard library imports
+import argparse
+from datetime import date
+import json
+import logging
+import os
+import sys
+
+# Third party imports
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    logging.warning("Package python-dotenv need to be installed")
+    raise ImportError("Package python-dotenv need to be installed")
+
+
+def migrate(args) -> int:
+    from database.migrations import upgrade
+    from database.rollups import update_rollups
+
+    applied = upgrade()
+    print(f"Migrations applied: {', '.join(str(version) for version in applied) or 'none'}")
+    # The graphs of more than GRAPH_RAW_MAX_DAYS read the rollups, they are ready before the app starts
+    print(f"Logs rolled up: {update_rollups()}")
+    return 0
+
+
+def explain(args) -> int:
+    from database.data_manager import DataManager
+
+    plans = DataManager.explain_hot_queries()
+    print(json.dumps(plans, indent=4))
+    return 0 if all(plan["uses_index"] for plan in plans.values()) else 1
+
+
+def rebuild_status(args) -> int:
+    from database.data_manager import DataManager
+
+    rebuilt, message = DataManager.rebuild_status_current()
+    print(message)
+    return 0 if rebuilt else 1
+
+
+def rollup(args) -> int:
+    from database.rollups import rebuild_rollups, update_rollups
+
+    folded = rebuild_rollups() if args.rebuild else update_rollups()
+    print(f"Logs rolled up: {folded}")
+    return 0
+
+
+def backfill(args) -> int:
+    from database import get_engine
+    from database.migrations import backfill_all_values
+
+    with get_engine().begin() as connection:
+        updated = backfill_all_values(connection)
+    print(f"Readings parsed: {updated}")
+    if updated:
+        print("The rollups folded before don't have these readings, run: python -m database rollup --rebuild")
+    return 0
+
+
+def rebuild_search(args) -> int:
+    from database import get_engine
+    from database.search import rebuild_search_index, search_index_exists
+
+    with get_engine().begin() as connection:
+        if not search_index_exists(connection):
+            print(f"[Error] There isn't a search index, run python -m database migrate (it needs SQLite with FTS5)")
+            return 1
+        rebuild_search_index(connection)
+    print(f"Search index rebuilt")
+    return 0
+
+
+def retention(args) -> int:
+    from database.retention import expire_logs, parse_retention
+
+    default = os.getenv("RETENTION_DEFAULT_DAYS")
+    try:
+        days = parse_retention(os.getenv("RETENTION_DAYS", ""), float(default) if default else None)
+    except ValueError as e:
+        print(f"[Error] RETENTION_DAYS is not valid: {e}")
+        return 1
+
+    result = expire_logs(days, None if args.no_archive else os.getenv("ARCHIVE_DIR", "archive"),
+                         batch_size=args.batch_size, pause=args.pause, dry_run=args.dry_run)
+    print(json.dumps(result, indent=4))
+    return 0
+
+
+def compact(args) -> int:
+    from database.retention import compact as compact_database, enable_incremental_vacuum
+
+    if args.enable_incremental:
+        enable_incremental_vacuum()
+    print(json.dumps(compact_database(pages=args.pages, pause=args.pause), indent=4))
+    return 0
+
+
+def partition(args) -> int:
+    from database.partitions import partition_logs
+
+    moved = partition_logs(before=args.before, batch_size=args.batch_size, pause=args.pause)
+    print(json.dumps(moved, indent=4))
+    return 0
+
+
+def partitions(args) -> int:
+    from database.partitions import get_partitions
+
+    print(json.dumps(get_partitions(), indent=4, default=str))
+    return 0
+
+
+def detach_partition(args) -> int:
+    from database.partitions import detach_partition as detach
+
+    try:
+        print(f"Partition detached to {detach(args.name, os.getenv('PARTITION_DIR', 'partitions'))}")
+    except ValueError as e:
+        print(f"[Error] {e}")
+        return 1
+    return 0
+
+
+def attach_partition(args) -> int:
+    from database.partitions import attach_partition as attach
+
+    try:
+        print(f"Logs attached: {attach(args.name)}")
+    except ValueError as e:
+        print(f"[Error] {e}")
+        return 1
+    return 0
+
+
+def archive_partition(args) -> int:
+    from database.retention import archive_partition as archive
+
+    try:
+        files = archive(args.name, os.getenv("ARCHIVE_DIR", "archive"))
+    except ValueError as e:
+        print(f"[Error] {e}")
+        return 1
+    print(json.dumps(files, indent=4))
+    return 0
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m database", description="Database maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("migrate", help="create missing tables and apply pending migrations") \
+        .set_defaults(func=migrate)
+    subparsers.add_parser("explain", help="check that the hot queries use the service_log indexes") \
+        .set_defaults(func=explain)
+    subparsers.add_parser("rebuild-status", help="recompute service_status_current from service_log") \
+        .set_defaults(func=rebuild_status)
+    rollup_parser = subparsers.add_parser("rollup", help="fold new logs into the hourly and daily rollups")
+    rollup_parser.add_argument("--rebuild", action="store_true", help="empty the rollups and fold every log again")
+    rollup_parser.set_defaults(func=rollup)
+    subparsers.add_parser("backfill-values", help="parse the readings of the sensor logs that don't have one") \
+        .set_defaults(func=backfill)
+    subparsers.add_parser("rebuild-search", help="index every service again in the full-text search index") \
+        .set_defaults(func=rebuild_search)
+    retention_parser = subparsers.add_parser("retention", help="archive and delete the logs older than RETENTION_DAYS")
+    retention_parser.add_argument("--dry-run", action="store_true", help="only count the logs that would be deleted")
+    retention_parser.add_argument("--no-archive", action="store_true", help="delete the logs without exporting them")
+    retention_parser.add_argument("--batch-size", type=int, default=5000, help="logs deleted per transaction")
+    retention_parser.add_argument("--pause", type=float, default=0.0, help="seconds between two batches")
+    retention_parser.set_defaults(func=retention)
+    compact_parser = subparsers.add_parser("compact", help="free the unused pages of SQLite and run PRAGMA optimize")
+    compact_parser.add_argument("--pages", type=int, default=1000, help="pages freed per step")
+    compact_parser.add_argument("--pause", type=float, default=0.0, help="seconds between two steps")
+    compact_parser.add_argument("--enable-incremental", action="store_true",
+                                help="switch to auto_vacuum = INCREMENTAL first, runs a full VACUUM once")
+    compact_parser.set_defaults(func=compact)
+    partition_parser = subparsers.add_parser("partition", help="move the closed months of service_log to their "
+                                                               "monthly partitions")
+    partition_parser.add_argument("--before", type=date.fromisoformat,
+                                  help="only move the months before this date (YYYY-MM-DD), the current one by default")
+    partition_parser.add_argument("--batch-size", type=int, default=5000, help="logs moved per transaction")
+    partition_parser.add_argument("--pause", type=float, default=0.0, help="seconds between two batches")
+    partition_parser.set_defaults(func=partition)
+    subparsers.add_parser("partitions", help="list the monthly partitions").set_defaults(func=partitions)
+    for name, func, help_ in (("detach-partition", detach_partition, "move a partition to its own SQLite file "
+                                                                      "in PARTITION_DIR"),
+                              ("attach-partition", attach_partition, "copy a detached partition back"),
+                              ("archive-partition", archive_partition, "export a partition to ARCHIVE_DIR "
+                                                                        "and drop it")):
+        partition_parser = subparsers.add_parser(name, help=help_)
+        partition_parser.add_argument("name", help="name of the partition, e.g.: service_log_202201")
+        partition_parser.set_defaults(func=func)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
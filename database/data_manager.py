@@ -3,12 +3,17 @@ import os
 from datetime import datetime, date, timedelta
 import inspect
 import logging
-from typing import Optional, Literal
+import threading
+import time
+from typing import Optional, Literal, Iterable, Iterator
 
 # Third party imports
 try:
     import sqlalchemy.exc
-    from sqlalchemy.orm import joinedload
+    from sqlalchemy import String, and_, case, func, insert, null, or_, select, tuple_, type_coerce, union_all
+    from sqlalchemy.dialects import postgresql, sqlite
+    from sqlalchemy.engine import Row
+    from sqlalchemy.orm import aliased, joinedload
     from sqlalchemy.sql.functions import max
 except ImportError:
     logging.warning("Package sqlalchemy need to be installed")
@@ -16,8 +21,16 @@ except ImportError:
 
 # Local specific imports
 try:
-    from database import Base, get_session, get_engine
-    from common.models import Service, ServiceLog, AppType, User
+    from database import get_session, get_engine, new_session
+    from database.migrations import upgrade
+    from database.partitions import overlapping_partitions
+    from database.search import SEARCH_COLUMNS, match_expression, search_index_exists, search_statement, \
+        search_words
+    from common.cache import TTLCache
+    from common.models import Service, ServiceLog, ServiceStatusCurrent, ServiceLogHourly, ServiceLogDaily, \
+        RollupMixin, AppType, User
+    from common.routes import route_plans
+    from common.sensors import parse_value
 except ImportError:
     logging.warning("Packages database and common need to be near this package")
     raise ImportError("Packages database and common need to be near this package")
@@ -25,13 +38,52 @@ except ImportError:
 
 class DataManager:
     __logger = logging.getLogger(__name__)
+    # Known service ids (and app types) used to validate ingested logs,
+    # reloaded after APP_IDS_TTL seconds or when a service is added
+    APP_IDS_TTL = 60
+    __app_ids: Optional[frozenset[int]] = None
+    __app_types: dict[int, str] = {}
+    __app_ids_loaded_at = 0.0
+    __app_ids_lock = threading.Lock()
+    # Bumped on every write that changes what the dashboard shows
+    __data_version = 0
+    __data_version_lock = threading.Lock()
+    # Key of the PostgreSQL advisory lock the writers of logs take, see _lock_log_ids
+    LOG_IDS_LOCK = 7420001
+    # Users read on every request by auth.load_logged_in_user, dropped when a user is updated. Only the cache of the
+    # process that made the update is dropped, the other workers see it when the entry expires: the TTL is short
+    user_cache = TTLCache(max_size=int(os.getenv("USER_CACHE_SIZE", 1024)),
+                          ttl=float(os.getenv("USER_CACHE_TTL", 10)), name="users")
+
+    @staticmethod
+    def create_schema() -> list[int]:
+        """
+        Creates the missing tables and applies the pending migrations, the entry points call it once at startup
+        :return: the versions of the migrations applied
+        """
+        return upgrade(get_engine())
 
-    def __init__(self):
-        Base.metadata.create_all(get_engine())
+    @classmethod
+    def _after_fork_in_child(cls):
+        # Locks held by another thread of the parent would never be released in the child
+        cls.__app_ids_lock = threading.Lock()
+        cls.__data_version_lock = threading.Lock()
+        cls.__app_ids = None
+
+    @classmethod
+    def data_version(cls) -> int:
+        """
+        Gets a counter that changes every time services or logs are written by this process
+        """
+        return cls.__data_version
+
+    @classmethod
+    def _data_changed(cls, services: bool = False):
+        with cls.__data_version_lock:
+            cls.__data_version += 1
+        if services:
+            cls.__app_ids = None
 
-    # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ #
-    # ++++++++++++++++++++ Create information ++++++++++++++++++++ #
-    # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ #
     @classmethod
     def add_service(cls, service: Service) -> tuple[bool, str]:
         """
@@ -63,6 +115,7 @@ class DataManager:
                 return False, f"[Error] Couldn't find the table {Service.__tablename__}"
             else:
                 cls.__logger.info(f"[Success] Created the Service {service.name} in the Database")
+                cls._data_changed(services=True)
                 return True, "Success"
 
     @classmethod
@@ -98,6 +151,7 @@ class DataManager:
                 return False, f"[Error] Couldn't find the table {Service.__tablename__}"
             else:
                 cls.__logger.info(f"[Success] Services created: {', '.join(services_name)}")
+                cls._data_changed(services=True)
                 return True, "Success"
 
     @classmethod
@@ -115,12 +169,17 @@ class DataManager:
         session = get_session()
 
         with session as sm:
+            cls._lock_log_ids(sm)
+            service_log.value = parse_value(service_log.service.app_type, service_log.other_data)
             sm.add(service_log)
             cls.__logger.debug(f"Adding this log to DB: {service_log.__repr__()}")
             try:
+                cls._update_status_current(sm, [(service_log.service.app_id,
+                                                 service_log.status,
+                                                 service_log.status_date)])
                 cls.__logger.info(f"Committing log to Database for the Service: {service_log.service.name}")
                 sm.commit()
-            except sqlalchemy.exc.OperationalError or sqlalchemy.orm.exc.FlushError:
+            except (sqlalchemy.exc.OperationalError, sqlalchemy.exc.IntegrityError, sqlalchemy.orm.exc.FlushError):
                 cls.__logger.exception(f"There was a problem with the Database and couldn't create log"
                                        f" for the Service {service_log.service.name}", exc_info=True)
                 return False, "[Error] Couldn't add the service log"
@@ -134,6 +193,7 @@ class DataManager:
                 return False, f"[Error] Couldn't find the table {ServiceLog.__tablename__}"
             else:
                 cls.__logger.info(f"[Success] Log created for the Service {service_log.service.name}")
+                cls._data_changed()
                 return True, "Success"
 
     @classmethod
@@ -147,17 +207,23 @@ class DataManager:
         session = get_session()
 
         with session as sm:
+            cls._lock_log_ids(sm)
             services_name = []
+            entries = []
             for service_log in service_logs:
                 if isinstance(service_log, ServiceLog):
                     services_name.append(service_log.service.name)
+                    entries.append((service_log.service.app_id, service_log.status, service_log.status_date,
+                                    service_log.other_data))
+                    service_log.value = parse_value(service_log.service.app_type, service_log.other_data)
                     sm.add(service_log)
                 else:
                     cls.__logger.error(f"It was sent a not recognized object to the Database: {service_log}")
             try:
+                cls._update_status_current(sm, [entry[:3] for entry in entries])
                 cls.__logger.info(f"Committing logs to Database for the Services: {', '.join(services_name)}")
                 sm.commit()
-            except sqlalchemy.exc.OperationalError or sqlalchemy.orm.exc.FlushError:
+            except (sqlalchemy.exc.OperationalError, sqlalchemy.exc.IntegrityError, sqlalchemy.orm.exc.FlushError):
                 cls.__logger.exception(f"There was a problem with the Database and couldn't create log"
                                        f" for the Services: {', '.join(services_name)}", exc_info=True)
                 return False, "[Error] Couldn't add the service logs"
@@ -171,8 +237,105 @@ class DataManager:
                 return False, f"[Error] Couldn't find the table {ServiceLog.__tablename__}"
             else:
                 cls.__logger.info(f"[Success] Log created for the Services: {', '.join(services_name)}")
+                cls._data_changed()
                 return True, "Success"
 
+    @classmethod
+    def bulk_insert_logs(cls, rows: list[dict]) -> tuple[bool, str]:
+        """
+        Inserts already validated logs with a single executemany, without building ORM objects
+        :param rows: dicts with the keys app_id, status, status_date and other_data
+        :return: a tuple with a bool True if the logs were inserted or False otherwise
+        and a string with an error or a result message
+        """
+        if not rows:
+            return True, "No logs to insert"
+
+        cls.get_app_ids()
+        rows = [{**row, "value": parse_value(cls.__app_types.get(row["app_id"]), row.get("other_data"))}
+                for row in rows]
+
+        session = get_session()
+
+        with session as sm:
+            try:
+                cls.__logger.info(f"Committing {len(rows)} logs to Database")
+                cls._lock_log_ids(sm)
+                sm.execute(insert(ServiceLog.__table__), rows)
+                cls._update_status_current(sm, [(row["app_id"], row["status"], row["status_date"]) for row in rows])
+                sm.commit()
+            except sqlalchemy.exc.IntegrityError:
+                cls.__logger.exception(f"There was a problem with the values and couldn't insert the logs", exc_info=True)
+                return False, "[Error] Couldn't add the service logs"
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't insert the logs",
+                                       exc_info=True)
+                return False, "[Error] Couldn't add the service logs"
+            except sqlalchemy.exc.NoSuchTableError:
+                cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
+                                       f"table {ServiceLog.__tablename__}", exc_info=True)
+                return False, f"[Error] Couldn't find the table {ServiceLog.__tablename__}"
+            else:
+                cls.__logger.info(f"[Success] {len(rows)} logs inserted")
+                cls._data_changed()
+                return True, "Success"
+
+    @classmethod
+    def _lock_log_ids(cls, sm):
+        """
+        Makes the ids of new logs visible in commit order, the rollup watermark and the log tail read the logs after
+        the last id they saw. SQLite has a single writer already, on PostgreSQL the writers of logs take turns
+        :param sm: the session about to insert logs, the lock is released when it commits or rolls back
+        """
+        if sm.get_bind().dialect.name == "postgresql":
+            sm.execute(select(func.pg_advisory_xact_lock(cls.LOG_IDS_LOCK)))
+
+    @classmethod
+    def _update_status_current(cls, sm, entries: Iterable[tuple[int, str, datetime]]):
+        """
+        Folds new logs into service_status_current inside the caller's transaction
+        :param sm: the session that is going to commit the logs
+        :param entries: tuples of (app_id, status, status_date)
+        """
+        logs_by_app: dict[int, list[tuple[str, datetime]]] = {}
+        for app_id, status, status_date in sorted(entries, key=lambda entry: entry[2]):
+            logs_by_app.setdefault(app_id, []).append((status, status_date))
+
+        for app_id, logs in logs_by_app.items():
+            current = sm.get(ServiceStatusCurrent, app_id)
+            if current is None:
+                current = ServiceStatusCurrent(app_id=app_id)
+                for status, status_date in logs:
+                    current.apply_log(status, status_date)
+                if cls._insert_status_current(sm, current):
+                    continue
+                # Another writer created the row of this service meanwhile, the logs are folded into it
+                current = sm.get(ServiceStatusCurrent, app_id)
+
+            for status, status_date in logs:
+                current.apply_log(status, status_date)
+
+    @staticmethod
+    def _insert_status_current(sm, current: ServiceStatusCurrent) -> bool:
+        """
+        Creates the first status of a service unless another transaction did it first
+        :return: True if it was inserted or False if the service already had one
+        """
+        dialect = sm.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            statement = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(ServiceStatusCurrent.__table__)
+            columns = [column.name for column in ServiceStatusCurrent.__table__.columns]
+            result = sm.execute(statement.values({column: getattr(current, column) for column in columns})
+                                .on_conflict_do_nothing(index_elements=["app_id"]))
+            return result.rowcount == 1
+
+        try:
+            with sm.begin_nested():
+                sm.add(current)
+        except sqlalchemy.exc.IntegrityError:
+            return False
+        return True
+
     @classmethod
     def add_user(cls, user: User) -> tuple[bool, str]:
         """
@@ -304,18 +467,7 @@ class DataManager:
         session = get_session()
 
         with session as sm:
-            query = sm.query(Service)
-
-            if app_id:
-                query = query.filter(Service.app_id == app_id)
-            if name:
-                query = query.filter(Service.name.ilike(f"%{name}%"))
-            if url:
-                query = query.filter(Service.url.ilike(f"%{url}%"))
-            if status:
-                query = query.filter(Service.status == status)
-            if app_type:
-                query = query.filter(Service.app_type.ilike(f"%{app_type.value}%"))
+            query = cls._services_query(sm, app_id=app_id, name=name, url=url, status=status, app_type=app_type)
 
             cls.__logger.debug(f"Query constructed is: {query}")
 
@@ -336,6 +488,98 @@ class DataManager:
                 cls.__logger.info(f"No record matched the value queried")
                 return None, "No record matched the value queried"
 
+    @staticmethod
+    def _services_query(sm, app_id: int = None, name: str = None, url: str = None, status: str = None,
+                        app_type: AppType = None):
+        """
+        Builds the query of the services matching the search criteria, see get_services
+        """
+        query = sm.query(Service)
+
+        if app_id:
+            query = query.filter(Service.app_id == app_id)
+        if name:
+            query = query.filter(Service.name.ilike(f"%{name}%"))
+        if url:
+            query = query.filter(Service.url.ilike(f"%{url}%"))
+        if status:
+            query = query.filter(Service.status == status)
+        if app_type:
+            query = query.filter(Service.app_type.ilike(f"%{app_type.value}%"))
+        return query
+
+    @classmethod
+    def get_services_page(cls,
+                          after: int = None,
+                          limit: int = 50,
+                          status: Optional[Literal["active", "inactive"]] = None,
+                          app_type: AppType = None) -> tuple[Optional[tuple[list[Service], int]], str]:
+        """
+        Gets one page of services ordered by app_id using keyset pagination, with the number of services matching
+        the filters
+        :param after: app_id of the last service of the previous page, None for the first page
+        :param limit: maximum number of services in the page
+        :param status: only the services with this status, all of them if None
+        :param app_type: only the services of this type, all of them if None
+        :return: a tuple with the list of Services of the page and the total, and a 'Success' string
+        or None and an error message otherwise
+        """
+        if (after is not None and not isinstance(after, int)) or not isinstance(limit, int) or limit < 1 or \
+                (status and not isinstance(status, str)) or (app_type and not isinstance(app_type, AppType)):
+            cls.__logger.debug(f"It wasn't provided a valid search value: {after=}, {limit=}, {status=}, {app_type=}")
+            return None, "It wasn't provided a valid search value"
+
+        session = get_session()
+
+        with session as sm:
+            query = cls._services_query(sm, status=status, app_type=app_type)
+            page = query.order_by(Service.app_id)
+            if after is not None:
+                page = page.filter(Service.app_id > after)
+
+            cls.__logger.debug(f"Query constructed is: {page}")
+
+            try:
+                cls.__logger.info(f"Querying the Database: getting a page of services")
+                services = page.limit(limit).all()
+                total = query.count()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            except sqlalchemy.exc.NoSuchTableError:
+                cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
+                                       f"table {Service.__tablename__}", exc_info=True)
+                return None, f"[Error] Couldn't find the table {Service.__tablename__}"
+            else:
+                return (services, total), "Success"
+
+    @classmethod
+    def get_app_ids(cls) -> frozenset[int]:
+        """
+        Gets the ids of every service from an in-memory cache
+        :return: a frozenset with the app_id of every service, empty if the Database couldn't be read
+        """
+        if cls.__app_ids is not None and time.monotonic() - cls.__app_ids_loaded_at < cls.APP_IDS_TTL:
+            return cls.__app_ids
+
+        with cls.__app_ids_lock:
+            session = get_session()
+
+            with session as sm:
+                try:
+                    cls.__logger.info(f"Querying the Database: getting the services ids")
+                    app_types = {app_id: app_type for app_id, app_type in sm.query(Service.app_id, Service.app_type)}
+                except sqlalchemy.exc.OperationalError:
+                    cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                           f"a record", exc_info=True)
+                    return cls.__app_ids or frozenset()
+
+            cls.__app_types = app_types
+            cls.__app_ids = frozenset(app_types)
+            cls.__app_ids_loaded_at = time.monotonic()
+            return cls.__app_ids
+
     @classmethod
     def get_services_by_type(cls) -> tuple[Optional[list[Service]], str]:
         """
@@ -364,6 +608,154 @@ class DataManager:
                 cls.__logger.info(f"No record matched the value queried")
                 return None, "No record matches the value queried"
 
+    @classmethod
+    def search_services(cls, query: str,
+                        limit: int = 20,
+                        status: Optional[Literal["active", "inactive"]] = None,
+                        app_type: AppType = None,
+                        columns: tuple[str, ...] = None) -> tuple[Optional[list[Service]], str]:
+        """
+        Full-text search over name, description, url and app_type: every word typed must match the start of a word
+        of the service. Uses the FTS5 index (database.search), or LIKE on databases without it
+        :param query: the words typed, e.g.: "temp are"
+        :param limit: maximum number of services returned
+        :param status: only the services with this status, all of them if None
+        :param app_type: only the services of this type, all of them if None
+        :param columns: only look for the words in these SEARCH_COLUMNS, in all of them if None
+        :return: a list of Services, best match first, and a 'Success' string or None and an error message otherwise
+        """
+        valid_columns = not columns or set(columns) <= set(SEARCH_COLUMNS)
+        expression = match_expression(query, columns) if isinstance(query, str) and valid_columns else None
+        if not expression or not isinstance(limit, int) or limit < 1 or \
+                (app_type and not isinstance(app_type, AppType)):
+            cls.__logger.debug(f"It wasn't provided a valid search value: {query=}, {limit=}, {app_type=}, "
+                               f"{columns=}")
+            return None, "It wasn't provided a valid search value"
+        app_type = app_type.value if app_type else None
+
+        session = get_session()
+
+        with session as sm:
+            try:
+                if search_index_exists(sm.connection()):
+                    services = sm.query(Service).from_statement(search_statement(status, app_type)) \
+                        .params(expression=expression, status=status, app_type=app_type, limit=limit).all()
+                else:
+                    words = search_words(query)
+                    searched = [getattr(Service, column) for column in columns or SEARCH_COLUMNS]
+                    db_query = sm.query(Service).filter(*(or_(*(column.ilike(f"%{word}%") for column in searched))
+                                                          for word in words))
+                    if status:
+                        db_query = db_query.filter(Service.status == status)
+                    if app_type:
+                        db_query = db_query.filter(Service.app_type == app_type)
+                    # Names starting with the words first
+                    starts = and_(*(Service.name.ilike(f"{word}%") for word in words))
+                    services = db_query.order_by(case((starts, 0), else_=1), Service.name).limit(limit).all()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            else:
+                if services:
+                    return services, "Success"
+
+                cls.__logger.info(f"No record matched the value queried")
+                return None, "No record matched the value queried"
+
+    @staticmethod
+    def _logs_date_range(start_date_: date = None,
+                         end_date_: date = None) -> tuple[Optional[datetime], Optional[datetime]]:
+        """
+        Turns the dates requested into the datetime range to filter the logs
+        :param start_date_: first day requested
+        :param end_date_: last day requested, if it is missing or before start_date_ only start_date_ is used
+        :return: a tuple with the start and end datetimes, both None when no date was requested
+        """
+        if start_date_:
+            start_date = datetime(start_date_.year, start_date_.month, start_date_.day, 0, 0, 0)
+            if end_date_ and end_date_ >= start_date_:
+                end_date = datetime(end_date_.year, end_date_.month, end_date_.day, 23, 59, 59)
+            else:
+                end_date = start_date + timedelta(hours=23, minutes=59, seconds=59)
+            return start_date, end_date
+
+        if end_date_:
+            end_date = datetime(end_date_.year, end_date_.month, end_date_.day, 23, 59, 59)
+            return end_date - timedelta(hours=23, minutes=59, seconds=59), end_date
+
+        return None, None
+
+    @staticmethod
+    def _log_source(sm, start_date: datetime = None, end_date: datetime = None):
+        """
+        The logs to read between the dates: ServiceLog when no monthly partition overlaps them, otherwise an alias
+        of ServiceLog over service_log and those partitions (UNION ALL), the database applies the filters of the
+        query to each of them
+        :param sm: the session of the query, the partitions are read in its transaction
+        :param start_date: start of the range, None for no lower bound
+        :param end_date: end of the range, None for no upper bound
+        """
+        partitions = overlapping_partitions(sm, start_date, end_date)
+        if not partitions:
+            return ServiceLog
+
+        log = ServiceLog.__table__
+        logs = union_all(select(log), *(select(partition) for partition in partitions))
+        return aliased(ServiceLog, logs.subquery(f"{log.name}_all"))
+
+    @staticmethod
+    def _logs_columns_query(sm, app_id: int,
+                            start_date_: date = None,
+                            end_date_: date = None,
+                            after: tuple[datetime, int] = None):
+        start_date, end_date = DataManager._logs_date_range(start_date_, end_date_)
+        log = DataManager._log_source(sm, start_date, end_date)
+
+        query = sm.query(log.log_id, log.status_date, log.status, log.other_data).filter(log.app_id == app_id)
+        if start_date:
+            query = query.filter(log.status_date >= start_date)
+        if end_date:
+            query = query.filter(log.status_date <= end_date)
+        if after:
+            query = query.filter(tuple_(log.status_date, log.log_id) > tuple_(*after))
+
+        return query.order_by(log.status_date, log.log_id)
+
+    @staticmethod
+    def _logs_query(sm, start_date_: date = None,
+                    end_date_: date = None,
+                    name: str = None,
+                    app_id: int = None,
+                    app_type: AppType = None):
+        start_date, end_date = DataManager._logs_date_range(start_date_, end_date_)
+        log = DataManager._log_source(sm, start_date, end_date)
+
+        query = sm.query(log)
+        if start_date:
+            query = query.filter(log.status_date >= start_date)
+        if end_date:
+            query = query.filter(log.status_date <= end_date)
+
+        if app_id or name or app_type:
+            query = query.join(Service, log.service).options(joinedload(Service.app_id == log.app_id))
+            if app_id:
+                query = query.filter(log.app_id == app_id)
+            if name:
+                query = query.filter(Service.name.ilike(f"%{name}%"))
+            if app_type:
+                query = query.filter(Service.app_type.ilike(f"%{app_type.value}%"))
+
+        return query.order_by(log.status_date)
+
+    @staticmethod
+    def _last_active_time_query(sm, app_id: int = None, log=ServiceLog):
+        query = sm.query(max(log.status_date).label("status_date"), log.app_id) \
+            .filter(log.status == "Running").group_by(log.app_id)
+        if app_id:
+            query = query.filter(log.app_id == app_id)
+        return query.order_by(log.status_date)
+
     @classmethod
     def get_logs(cls, start_date_: date = None,
                  end_date_: date = None,
@@ -392,39 +784,14 @@ class DataManager:
         session = get_session()
 
         with session as sm:
-            query = sm.query(ServiceLog)
-
-            if start_date_:
-                start_date = datetime(start_date_.year, start_date_.month, start_date_.day, 0, 0, 0)
-                query = query.filter(ServiceLog.status_date >= start_date)
-            if not end_date_ and start_date_:
-                end_date = start_date + timedelta(hours=23, minutes=59, seconds=59)
-                query = query.filter(ServiceLog.status_date <= end_date)
-            elif start_date_ and end_date_ and end_date_ < start_date_:
-                end_date = start_date + timedelta(hours=23, minutes=59, seconds=59)
-                query = query.filter(ServiceLog.status_date <= end_date)
-            elif end_date_ and start_date_:
-                end_date = datetime(end_date_.year, end_date_.month, end_date_.day, 23, 59, 59)
-                query = query.filter(ServiceLog.status_date <= end_date)
-            if end_date_ and not start_date_:
-                end_date = datetime(end_date_.year, end_date_.month, end_date_.day, 23, 59, 59)
-                start_date = end_date - timedelta(hours=23, minutes=59, seconds=59)
-                query = query.filter(ServiceLog.status_date >= start_date)
-
-            if app_id or name or app_type:
-                query = query.join(Service).options(joinedload(Service.app_id == ServiceLog.app_id))
-                if app_id:
-                    query = query.filter(Service.app_id == app_id)
-                if name:
-                    query = query.filter(Service.name.ilike(f"%{name}%"))
-                if app_type:
-                    query = query.filter(Service.app_type.ilike(f"%{app_type.value}%"))
+            query = cls._logs_query(sm, start_date_=start_date_, end_date_=end_date_,
+                                    name=name, app_id=app_id, app_type=app_type)
 
             cls.__logger.debug(f"Query constructed is: {query}")
 
             try:
                 cls.__logger.info(f"Querying the Database: getting logs")
-                logs = query.order_by(ServiceLog.status_date).all()
+                logs = query.all()
             except sqlalchemy.exc.OperationalError:
                 cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
                                        f"a record", exc_info=True)
@@ -436,6 +803,246 @@ class DataManager:
             else:
                 return logs, "Success"
 
+    @classmethod
+    def get_log_columns(cls, app_id: int,
+                        start_date_: date = None,
+                        end_date_: date = None) -> tuple[Optional[tuple[tuple, tuple, tuple]], str]:
+        """
+        Gets the logs of a service as columns ordered by status_date, without building a ServiceLog (and joining
+        its Service) per row: only status_date, status and value are selected
+        :param app_id: an integer with the service id
+        :param start_date_: first day of the range
+        :param end_date_: last day of the range
+        :return: a tuple with the status_date, status and value columns and a 'Success' string or None and
+        an error message otherwise. status_date is left as the driver returns it (ISO 8601 strings on SQLite,
+        datetimes on other databases) to be decoded all at once
+        """
+        if not isinstance(app_id, int) or (start_date_ and not isinstance(start_date_, date)) or \
+                (end_date_ and not isinstance(end_date_, date)):
+            cls.__logger.debug(f"It wasn't provided a valid search value: {app_id=}, {start_date_=}, {end_date_=}")
+            return None, "It wasn't provided a valid search value"
+
+        start_date, end_date = cls._logs_date_range(start_date_, end_date_)
+        session = get_session()
+
+        with session as sm:
+            log = cls._log_source(sm, start_date, end_date)
+            # The String type skips the per row parsing DateTime does on SQLite
+            query = select(type_coerce(log.status_date, String), log.status, log.value).where(log.app_id == app_id)
+            if start_date:
+                query = query.where(log.status_date >= start_date)
+            if end_date:
+                query = query.where(log.status_date <= end_date)
+            query = query.order_by(log.status_date)
+
+            cls.__logger.debug(f"Query constructed is: {query}")
+
+            try:
+                cls.__logger.info(f"Querying the Database: getting the log columns")
+                # Through the connection, so the rows skip the ORM loading
+                rows = sm.connection().execute(query).all()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            except sqlalchemy.exc.NoSuchTableError:
+                cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
+                                       f"table {ServiceLog.__tablename__}", exc_info=True)
+                return None, f"[Error] Couldn't find the table {ServiceLog.__tablename__}"
+            else:
+                return tuple(zip(*rows)) or ((), (), ()), "Success"
+
+    @classmethod
+    def get_logs_page(cls, app_id: int,
+                      start_date_: date = None,
+                      end_date_: date = None,
+                      after: tuple[datetime, int] = None,
+                      limit: int = 500) -> tuple[Optional[list[Row]], str]:
+        """
+        Gets one page of logs of a service ordered by (status_date, log_id) using keyset pagination
+        :param app_id: an integer with the service id
+        :param start_date_: first day of the range
+        :param end_date_: last day of the range
+        :param after: (status_date, log_id) of the last log of the previous page
+        :param limit: maximum number of logs in the page
+        :return: a list of rows with log_id, status_date, status and other_data and a 'Success' string
+        or None and an error message otherwise
+        """
+        if not isinstance(app_id, int) or (start_date_ and not isinstance(start_date_, date)) or \
+                (end_date_ and not isinstance(end_date_, date)):
+            cls.__logger.debug(f"It wasn't provided a valid search value: {app_id=}, {start_date_=}, {end_date_=}")
+            return None, "It wasn't provided a valid search value"
+
+        session = get_session()
+
+        with session as sm:
+            query = cls._logs_columns_query(sm, app_id, start_date_=start_date_, end_date_=end_date_, after=after)
+
+            cls.__logger.debug(f"Query constructed is: {query}")
+
+            try:
+                cls.__logger.info(f"Querying the Database: getting a page of logs")
+                logs = query.limit(limit).all()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            except sqlalchemy.exc.NoSuchTableError:
+                cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
+                                       f"table {ServiceLog.__tablename__}", exc_info=True)
+                return None, f"[Error] Couldn't find the table {ServiceLog.__tablename__}"
+            else:
+                return logs, "Success"
+
+    @classmethod
+    def iter_logs(cls, app_id: int,
+                  start_date_: date = None,
+                  end_date_: date = None,
+                  after: tuple[datetime, int] = None,
+                  batch_size: int = 1000) -> Iterator[Row]:
+        """
+        Streams the logs of a service ordered by (status_date, log_id), fetching them in batches
+        It uses its own session, so it can be consumed after the request scope is gone
+        :param app_id: an integer with the service id
+        :param start_date_: first day of the range
+        :param end_date_: last day of the range
+        :param after: (status_date, log_id) of the last log already sent
+        :param batch_size: number of rows fetched from the database each time
+        :return: an iterator of rows with log_id, status_date, status and other_data
+        """
+        session = new_session()
+
+        with session as sm:
+            query = cls._logs_columns_query(sm, app_id, start_date_=start_date_, end_date_=end_date_, after=after)
+
+            cls.__logger.debug(f"Query constructed is: {query}")
+            cls.__logger.info(f"Querying the Database: streaming logs")
+            try:
+                yield from query.yield_per(batch_size)
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+
+    @classmethod
+    def get_rollups(cls, app_id: int,
+                    resolution: Literal["hour", "day"],
+                    start_date_: date = None,
+                    end_date_: date = None) -> tuple[Optional[list[RollupMixin]], str]:
+        """
+        Gets the hourly or daily aggregates of a service ordered by bucket
+        :param app_id: an integer with the service id
+        :param resolution: "hour" or "day"
+        :param start_date_: first day of the range
+        :param end_date_: last day of the range
+        :return: a list of rollups and a 'Success' string or None and an error message otherwise
+        """
+        model = {"hour": ServiceLogHourly, "day": ServiceLogDaily}.get(resolution)
+        if not isinstance(app_id, int) or model is None:
+            cls.__logger.debug(f"It wasn't provided a valid search value: {app_id=}, {resolution=}")
+            return None, "It wasn't provided a valid search value"
+
+        session = get_session()
+
+        with session as sm:
+            query = sm.query(model).filter(model.app_id == app_id)
+
+            start_date, end_date = cls._logs_date_range(start_date_, end_date_)
+            if start_date:
+                query = query.filter(model.bucket_start >= start_date)
+            if end_date:
+                query = query.filter(model.bucket_start <= end_date)
+
+            cls.__logger.debug(f"Query constructed is: {query}")
+
+            try:
+                cls.__logger.info(f"Querying the Database: getting {resolution} rollups")
+                rollups = query.order_by(model.bucket_start).all()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            except sqlalchemy.exc.NoSuchTableError:
+                cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
+                                       f"table {model.__tablename__}", exc_info=True)
+                return None, f"[Error] Couldn't find the table {model.__tablename__}"
+            else:
+                return rollups, "Success"
+
+    @classmethod
+    def get_reading_summary(cls, app_id: int,
+                            start_date_: date = None,
+                            end_date_: date = None,
+                            above: float = None,
+                            below: float = None) -> tuple[Optional[dict], str]:
+        """
+        Aggregates the sensor readings of a service in the database, e.g. to check them against thresholds
+        :param app_id: an integer with the service id
+        :param start_date_: first day of the range
+        :param end_date_: last day of the range
+        :param above: also count the readings greater than this value
+        :param below: also count the readings lower than this value
+        :return: a dict with count, min, max, avg, above and below and a 'Success' string
+        or None and an error message otherwise
+        """
+        if not isinstance(app_id, int) or (start_date_ and not isinstance(start_date_, date)) or \
+                (end_date_ and not isinstance(end_date_, date)):
+            cls.__logger.debug(f"It wasn't provided a valid search value: {app_id=}, {start_date_=}, {end_date_=}")
+            return None, "It wasn't provided a valid search value"
+
+        start_date, end_date = cls._logs_date_range(start_date_, end_date_)
+        session = get_session()
+
+        with session as sm:
+            log = cls._log_source(sm, start_date, end_date)
+            columns = [func.count(log.value), func.min(log.value), func.max(log.value), func.avg(log.value)]
+            columns.append(func.sum(case((log.value > above, 1), else_=0)) if above is not None else null())
+            columns.append(func.sum(case((log.value < below, 1), else_=0)) if below is not None else null())
+            query = select(*columns).where(log.app_id == app_id, log.value.isnot(None))
+            if start_date:
+                query = query.where(log.status_date >= start_date)
+            if end_date:
+                query = query.where(log.status_date <= end_date)
+
+            cls.__logger.debug(f"Query constructed is: {query}")
+
+            try:
+                cls.__logger.info(f"Querying the Database: aggregating the readings")
+                count, minimum, maximum, average, count_above, count_below = sm.execute(query).one()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            else:
+                return {"count": count, "min": minimum, "max": maximum, "avg": average,
+                        "above": count_above, "below": count_below}, "Success"
+
+    @classmethod
+    def get_logs_after(cls, log_id: Optional[int], limit: int = 1000) -> tuple[Optional[list[Row]], str]:
+        """
+        Gets the logs committed after log_id by any process, the oldest first
+        :param log_id: the last log already seen, None gets only the last log
+        :param limit: logs returned at most
+        :return: a tuple with a list of rows of log_id, app_id, status, status_date and value or None
+        and a string with an error or a result message
+        """
+        log = ServiceLog.__table__
+        query = select(log.c.log_id, log.c.app_id, log.c.status, log.c.status_date, log.c.value)
+        if log_id is None:
+            query = query.order_by(log.c.log_id.desc()).limit(1)
+        else:
+            query = query.where(log.c.log_id > log_id).order_by(log.c.log_id).limit(limit)
+
+        session = get_session()
+        with session as sm:
+            try:
+                rows = sm.execute(query).all()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"the new logs", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            else:
+                return rows, "Success"
+
     @classmethod
     def get_last_active_time(cls, app_id: int = None) -> tuple[Optional[list[ServiceLog]], str]:
         if app_id and not isinstance(app_id, int):
@@ -444,33 +1051,67 @@ class DataManager:
 
         session = get_session()
         with session as sm:
-            query = sm.query(max(ServiceLog.status_date).label("status_date"), ServiceLog.app_id).filter(ServiceLog.status == "Running").group_by(ServiceLog.app_id)
+            query = sm.query(ServiceStatusCurrent.last_running_date.label("status_date"),
+                             ServiceStatusCurrent.app_id) \
+                .filter(ServiceStatusCurrent.last_running_date.isnot(None))
             if app_id:
-                query = query.filter(ServiceLog.app_id == app_id)
+                query = query.filter(ServiceStatusCurrent.app_id == app_id)
 
             cls.__logger.debug(f"Query constructed is: {query}")
 
             try:
-                cls.__logger.info(f"Querying the Database: getting logs")
-                logs = query.order_by(ServiceLog.status_date).all()
+                cls.__logger.info(f"Querying the Database: getting last running dates")
+                logs = query.order_by(ServiceStatusCurrent.last_running_date).all()
             except sqlalchemy.exc.OperationalError:
                 cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
                                        f"a record", exc_info=True)
                 return None, "[Error] Couldn't obtain the values"
             except sqlalchemy.exc.NoSuchTableError:
                 cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
-                                       f"table {ServiceLog.__tablename__}", exc_info=True)
-                return None, f"[Error] Couldn't find the table {ServiceLog.__tablename__}"
+                                       f"table {ServiceStatusCurrent.__tablename__}", exc_info=True)
+                return None, f"[Error] Couldn't find the table {ServiceStatusCurrent.__tablename__}"
             else:
                 return logs, "Success"
 
     @classmethod
-    def get_user_id(cls, user_id: int) -> Optional[User]:
+    def get_status_current(cls) -> tuple[Optional[dict[int, ServiceStatusCurrent]], str]:
+        """
+        Gets the latest known status of every service
+        :return: a dict keyed by app_id and a 'Success' string or None and an error message otherwise
         """
+        session = get_session()
+        with session as sm:
+            try:
+                cls.__logger.info(f"Querying the Database: getting current status")
+                currents = sm.query(ServiceStatusCurrent).all()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't retrieve "
+                                       f"a record", exc_info=True)
+                return None, "[Error] Couldn't obtain the values"
+            except sqlalchemy.exc.NoSuchTableError:
+                cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
+                                       f"table {ServiceStatusCurrent.__tablename__}", exc_info=True)
+                return None, f"[Error] Couldn't find the table {ServiceStatusCurrent.__tablename__}"
+            else:
+                return {current.app_id: current for current in currents}, "Success"
 
-        :param user_id:
-        :return:
+    @classmethod
+    def get_user_id(cls, user_id: int, cached: bool = False) -> Optional[User]:
+        """
+        Gets a user by its id
+        :param user_id: an integer with the user id
+        :param cached: look in user_cache first; the User returned is shared between requests, don't modify it
+        :return: the User or None if it doesn't exist
         """
+        if cached:
+            user = cls.user_cache.get(user_id)
+            if user is not None:
+                return user
+
+            user = cls.get_user_id(user_id)
+            if user is not None:
+                cls.user_cache.set(user_id, user)
+            return user
 
         session = get_session()
 
@@ -565,18 +1206,20 @@ class DataManager:
                 cls.__logger.debug(f"Service to update is: {service_.__repr__()}")
                 cls.__logger.info(f"Querying the Database")
                 service = sm.query(Service).get(service_.app_id)
+                route = service.route
 
                 attributes = inspect.getmembers(Service, lambda a: not (inspect.isroutine(a)))
                 property_list = [
                     a[0] for a in attributes
                     if "__" not in a[0] and
-                    a[0] not in ("app_id", "logs", "metadata", "registry") and
+                    a[0] not in ("app_id", "logs", "metadata", "registry", "route_plan") and
                     not ("route_pattern" in a[0]) and
                     not a[0].startswith('_sa')
                 ]
 
                 for property_ in property_list:
                     setattr(service, property_, getattr(service_, property_))
+                route_changed = service.route != route
 
                 cls.__logger.info(f"Committing updated values to the Database")
                 sm.commit()
@@ -597,6 +1240,9 @@ class DataManager:
                                        f"the Service: {service_.__repr__()}", exc_info=True)
                 return False, "[Error] There was a problem with a value passed to update the service"
             else:
+                if route_changed:
+                    route_plans.invalidate(service_.app_id)
+                cls._data_changed()
                 return True, "Service was updated"
 
     @classmethod
@@ -638,6 +1284,7 @@ class DataManager:
                                            f"the Service", exc_info=True)
                     return False, "[Error] Couldn't update the service"
         cls.__logger.info(f"[Success] Status changed to: {status}")
+        cls._data_changed()
         return True, f"Service's status changed to: {status}"
 
     @classmethod
@@ -690,6 +1337,7 @@ class DataManager:
                                        f"the Service: {user_.__repr__()}", exc_info=True)
                 return False, "[Error] There was a problem with a value passed to update the service"
             else:
+                cls.user_cache.invalidate(user_.id)
                 return True, f"User {user.email} was updated"
 
     @classmethod
@@ -730,5 +1378,99 @@ class DataManager:
                     cls.__logger.exception(f"There was a problem with the Database and couldn't update "
                                            f"the User", exc_info=True)
                     return False, "[Error] Couldn't update the user"
+        cls.user_cache.invalidate(user_id)
         cls.__logger.info(f"[Success] Status changed to: {status}")
         return True, f"User's status changed to: {status}"
+
+    # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ #
+    # +++++++++++++++++++++++ Maintenance ++++++++++++++++++++++++ #
+    # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ #
+    @classmethod
+    def explain_hot_queries(cls) -> dict[str, dict]:
+        """
+        Runs EXPLAIN QUERY PLAN over the queries used by the dashboard and the service graph (SQLite only)
+        :return: a dict keyed by query name with the plan lines and a bool telling if service_log is read by an index
+        """
+        session = get_session()
+        plans = {}
+
+        with session as sm:
+            if sm.get_bind().dialect.name != "sqlite":
+                cls.__logger.info(f"EXPLAIN QUERY PLAN is only available for SQLite")
+                return plans
+
+            queries = {
+                "get_logs": cls._logs_query(sm, start_date_=date.today(), app_id=1),
+                "last_running_dates": cls._last_active_time_query(sm)
+            }
+
+            for name, query in queries.items():
+                compiled = query.statement.compile(dialect=sm.get_bind().dialect)
+                params = compiled.construct_params()
+                parameters = tuple(params[key] for key in compiled.positiontup)
+                rows = sm.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters).all()
+                plan = [row[-1] for row in rows]
+                log_steps = [step for step in plan if f" {ServiceLog.__tablename__} " in f"{step} "]
+                plans[name] = {
+                    "plan": plan,
+                    "uses_index": bool(log_steps) and all("USING" in step and "INDEX" in step for step in log_steps)
+                }
+                cls.__logger.debug(f"Query plan for {name}: {plan}")
+
+        return plans
+
+    @staticmethod
+    def _rebuild_status_current(sm):
+        sm.query(ServiceStatusCurrent).delete(synchronize_session=False)
+        # service_log and every attached partition
+        log = DataManager._log_source(sm)
+
+        last_dates = sm.query(log.app_id, max(log.status_date)) \
+            .filter(log.app_id.isnot(None)).group_by(log.app_id).all()
+        last_running = {app_id: status_date for status_date, app_id in DataManager._last_active_time_query(sm, log=log)}
+
+        for app_id, last_status_date in last_dates:
+            current = ServiceStatusCurrent(app_id=app_id)
+            current.last_status_date = last_status_date
+            current.last_status = sm.query(log.status) \
+                .filter(log.app_id == app_id, log.status_date == last_status_date) \
+                .order_by(log.log_id.desc()).limit(1).scalar()
+            current.last_running_date = last_running.get(app_id)
+
+            failures = sm.query(log.log_id).filter(log.app_id == app_id)
+            if current.last_running_date is not None:
+                failures = failures.filter(log.status_date > current.last_running_date)
+            current.consecutive_failures = failures.count()
+            sm.add(current)
+
+        return len(last_dates)
+
+    @classmethod
+    def rebuild_status_current(cls) -> tuple[bool, str]:
+        """
+        Recomputes service_status_current from the whole service_log table
+        :return: a tuple with a bool True if the table was rebuilt or False otherwise
+        and a string with an error or a result message
+        """
+        session = get_session()
+
+        with session as sm:
+            try:
+                cls.__logger.info(f"Rebuilding {ServiceStatusCurrent.__tablename__} from {ServiceLog.__tablename__}")
+                services = cls._rebuild_status_current(sm)
+                sm.commit()
+            except sqlalchemy.exc.OperationalError:
+                cls.__logger.exception(f"There was a problem with the Database and couldn't rebuild "
+                                       f"{ServiceStatusCurrent.__tablename__}", exc_info=True)
+                return False, "[Error] Couldn't rebuild the current status"
+            except sqlalchemy.exc.NoSuchTableError:
+                cls.__logger.exception(f"There was a problem with the Database, couldn't find the "
+                                       f"table {ServiceStatusCurrent.__tablename__}", exc_info=True)
+                return False, f"[Error] Couldn't find the table {ServiceStatusCurrent.__tablename__}"
+            else:
+                cls.__logger.info(f"[Success] Current status rebuilt for {services} services")
+                cls._data_changed()
+                return True, f"Current status rebuilt for {services} services"
+
+
+os.register_at_fork(after_in_child=DataManager._after_fork_in_child)
@@ -0,0 +1,273 @@
+"""
+Write-behind buffer for service logs: many small writes are coalesced and committed in one transaction
+"""
+# Standard library imports
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+# Local specific imports
+try:
+    from common.models import ServiceLog
+except ImportError:
+    logging.warning("Package common need to be near this package")
+    raise ImportError("Package common need to be near this package")
+
+
+class IngestBuffer:
+    """
+    Queues log rows and flushes them from a background thread when max_rows are waiting or max_delay seconds
+    have passed since the first one. When the queue is full put() blocks up to put_timeout (backpressure)
+    and then drops the row. A failed flush, e.g.: the database is locked, is tried again up to retries times
+    before its rows are counted as failed.
+    """
+    __logger = logging.getLogger(__name__)
+
+    def __init__(self,
+                 writer: Callable[[list[dict]], tuple[bool, str]] = None,
+                 max_rows: int = 500,
+                 max_delay: float = 0.2,
+                 max_queue: int = 10000,
+                 put_timeout: float = 1.0,
+                 retries: int = 4,
+                 retry_delay: float = 0.25):
+        """
+        :param writer: function that commits a list of rows, by default DataManager.bulk_insert_logs
+        :param max_rows: rows that trigger a flush
+        :param max_delay: seconds a row can wait before being flushed
+        :param max_queue: rows that can be waiting, beyond that writers block
+        :param put_timeout: seconds a writer blocks on a full queue before the row is dropped
+        :param retries: times a failed flush is tried again, the rows were already acknowledged to their senders
+        :param retry_delay: seconds before the first retry, doubled before each of the next ones
+        """
+        if writer is None:
+            # Imported here because data_manager imports this package
+            from database.data_manager import DataManager
+            writer = DataManager.bulk_insert_logs
+
+        self.writer = writer
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    def start(self) -> "IngestBuffer":
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-buffer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        """Stops the flushing thread and writes what is still queued"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def put(self, row: dict, timeout: float = None) -> bool:
+        """
+        Queues a row with the keys app_id, status, status_date and other_data
+        :param row: the log to write
+        :param timeout: seconds to wait for room in the queue, by default put_timeout
+        :return: True if the row was queued or False if it was dropped because the queue stayed full
+        """
+        try:
+            self._queue.put(row, timeout=self.put_timeout if timeout is None else timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            self.__logger.warning(f"Ingest queue is full, a log for the service {row.get('app_id')} was dropped")
+            return False
+
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def put_many(self, rows: Iterable[dict], timeout: float = None) -> int:
+        """
+        Queues the rows in order until the queue stays full, then drops the rest
+        :param timeout: seconds to wait for room in the queue for the whole batch, by default put_timeout
+        :return: the number of rows queued, the first ones of rows
+        """
+        rows = list(rows)
+        deadline = time.monotonic() + (self.put_timeout if timeout is None else timeout)
+        queued = 0
+        for row in rows:
+            try:
+                self._queue.put(row, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                break
+            queued += 1
+
+        with self._stats_lock:
+            self.enqueued += queued
+            self.dropped += len(rows) - queued
+        if queued < len(rows):
+            self.__logger.warning(f"Ingest queue is full, {len(rows) - queued} of {len(rows)} logs were dropped")
+        return queued
+
+    def put_service_log(self, service_log: ServiceLog) -> bool:
+        return self.put({"app_id": service_log.app_id or service_log.service.app_id,
+                         "status": service_log.status,
+                         "status_date": service_log.status_date,
+                         "other_data": service_log.other_data})
+
+    def flush(self) -> int:
+        """
+        Writes everything queued right now in batches of max_rows, from the calling thread
+        :return: the number of rows written
+        """
+        written = 0
+        while True:
+            batch = self._drain(self.max_rows)
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "retried": self.retried,
+                "flush_seconds_total": round(self.flush_seconds_total, 6),
+                "flush_seconds_max": round(self.flush_seconds_max, 6),
+                "flush_seconds_avg": round(self.flush_seconds_total / self.flushes, 6) if self.flushes else 0.0
+            }
+
+    def _drain(self, limit: int) -> list[dict]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            # The first row opens a window of max_delay seconds to gather up to max_rows
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+
+    def _write(self, batch: list[dict]) -> int:
+        with self._write_lock:
+            start = time.perf_counter()
+            delay = self.retry_delay
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    # Usually a transient error, e.g.: another process holds the SQLite write lock
+                    self.__logger.warning(f"Couldn't flush {len(batch)} logs ({message}), "
+                                          f"retry {attempt} of {self.retries} in {delay}s")
+                    time.sleep(delay)
+                    delay *= 2
+                    with self._stats_lock:
+                        self.retried += 1
+                try:
+                    written, message = self.writer(batch)
+                except Exception:
+                    self.__logger.exception(f"Couldn't flush {len(batch)} logs", exc_info=True)
+                    written, message = False, "[Error] Unexpected error"
+                if written:
+                    break
+            elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self.flushes += 1
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+            if written:
+                self.flushed += len(batch)
+            else:
+                self.failed += len(batch)
+
+        if not written:
+            self.__logger.error(f"{len(batch)} logs were lost, the flush failed {self.retries + 1} times: {message}")
+            return 0
+        return len(batch)
+
+
+_buffer: Optional[IngestBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_ingest_buffer() -> IngestBuffer:
+    """
+    Returns the process wide buffer, started on first use and configured by the environment variables
+    INGEST_BUFFER_ROWS, INGEST_BUFFER_DELAY_MS, INGEST_BUFFER_QUEUE and INGEST_BUFFER_RETRIES
+    """
+    global _buffer
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = IngestBuffer(max_rows=int(os.getenv("INGEST_BUFFER_ROWS", 500)),
+                                       max_delay=int(os.getenv("INGEST_BUFFER_DELAY_MS", 200)) / 1000,
+                                       max_queue=int(os.getenv("INGEST_BUFFER_QUEUE", 10000)),
+                                       retries=int(os.getenv("INGEST_BUFFER_RETRIES", 4))).start()
+    return _buffer
+
+
+def ingest_buffer_stats() -> Optional[dict]:
+    """
+    :return: the counters of the process wide buffer or None if it was never used
+    """
+    return _buffer.stats() if _buffer is not None else None
+
+
+def _after_fork_in_child():
+    """
+    The rows queued in the parent are written by the parent: the child empties its copy of the buffer, so the
+    stop() registered at exit doesn't write them a second time, and creates its own buffer on first use
+    """
+    global _buffer, _buffer_lock
+
+    if _buffer is not None:
+        _buffer._queue = queue.Queue(maxsize=_buffer._queue.maxsize)
+        _buffer._thread = None
+        _buffer._write_lock = threading.Lock()
+        _buffer._stats_lock = threading.Lock()
+    _buffer_lock = threading.Lock()
+    _buffer = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,107 @@
+"""
+Follows service_log for the logs committed by any process (the checker, other web workers), so every web worker
+pushes them to its /events clients and knows its cached pages are stale. The logs are read after the last id seen,
+DataManager._lock_log_ids makes their ids visible in commit order on SQLite and PostgreSQL
+"""
+# Standard library imports
+import logging
+import os
+import threading
+from typing import Optional
+
+# Local specific imports
+try:
+    from common.broadcaster import get_broadcaster
+    from database import get_engine
+    from database.data_manager import DataManager
+except ImportError:
+    logging.warning("Packages database and common need to be near this package")
+    raise ImportError("Packages database and common need to be near this package")
+
+
+__logger = logging.getLogger(__name__)
+
+
+class LogTail(threading.Thread):
+    """Background thread that reads the logs after the last one seen every interval seconds"""
+    __logger = logging.getLogger(__name__)
+
+    def __init__(self, interval: float = 2.0, batch_size: int = 1000):
+        super().__init__(name="log-tail", daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_log_id: Optional[int] = None
+        self._stopped = threading.Event()
+
+    def run(self):
+        self.__logger.info(f"Log tail started, interval {self.interval}s")
+        dialect = get_engine().dialect.name
+        if dialect not in ("sqlite", "postgresql"):
+            self.__logger.warning(f"Logs committed out of id order on {dialect} are never pushed to /events")
+        while not self._stopped.is_set():
+            self.poll()
+            self._stopped.wait(self.interval)
+
+    def poll(self) -> int:
+        """
+        Publishes the logs committed since the last poll, the first poll only takes note of the last log
+        :return: the number of new logs
+        """
+        if self.last_log_id is None:
+            rows, message = DataManager.get_logs_after(None)
+            if rows is not None:
+                self.last_log_id = rows[0].log_id if rows else 0
+            return 0
+
+        new = 0
+        while True:
+            rows, message = DataManager.get_logs_after(self.last_log_id, self.batch_size)
+            if not rows:
+                break
+            self.last_log_id = rows[-1].log_id
+            new += len(rows)
+            DataManager._data_changed()
+            get_broadcaster().publish("logs", [{"app_id": row.app_id,
+                                                "status": row.status,
+                                                "status_date": row.status_date.isoformat(),
+                                                "temperature": row.value}
+                                               for row in rows])
+            if len(rows) < self.batch_size:
+                break
+        return new
+
+    def stop(self):
+        self._stopped.set()
+
+
+_log_tail: Optional[LogTail] = None
+_log_tail_lock = threading.Lock()
+
+
+def start_log_tail() -> Optional[LogTail]:
+    """
+    Starts the log tail of this process once, every EVENTS_POLL seconds (2), 0 disables it
+    :return: the log tail or None if it is disabled
+    """
+    global _log_tail
+
+    if _log_tail is None:
+        interval = float(os.getenv("EVENTS_POLL", 2))
+        if interval <= 0:
+            return None
+        with _log_tail_lock:
+            if _log_tail is None:
+                _log_tail = LogTail(interval)
+                _log_tail.start()
+    return _log_tail
+
+
+def _after_fork_in_child():
+    # Threads don't survive a fork, the child starts its own tail on its first request
+    global _log_tail, _log_tail_lock
+
+    _log_tail_lock = threading.Lock()
+    _log_tail = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
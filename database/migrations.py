@@ -0,0 +1,206 @@
+# Standard library imports
+from datetime import datetime
+import logging
+from typing import Callable
+
+# Third party imports
+try:
+    from sqlalchemy import Table, MetaData, Column, Integer, String, DateTime, bindparam, func, inspect, select, \
+        text, update
+    from sqlalchemy.engine import Connection, Engine
+    from sqlalchemy.orm import Session
+except ImportError:
+    logging.warning("Package sqlalchemy need to be installed")
+    raise ImportError("Package sqlalchemy need to be installed")
+
+# Local specific imports
+try:
+    from database import Base, get_engine
+    from common.models import LogPartition, RollupWatermark, Service, ServiceLog, service_log_partition
+    from common.sensors import SENSOR_TYPES, parse_value
+    from database.rollups import reset_rollups
+    from database.search import create_search_index
+except ImportError:
+    logging.warning("Packages database and common need to be near this package")
+    raise ImportError("Packages database and common need to be near this package")
+
+
+__logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False)
+)
+
+
+def _create_service_log_indexes(connection: Connection):
+    for index in ServiceLog.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+
+def _backfill_status_current(connection: Connection):
+    # Imported here because data_manager applies the migrations when it is instantiated
+    from database.data_manager import DataManager
+
+    with Session(bind=connection) as sm:
+        DataManager._rebuild_status_current(sm)
+        sm.flush()
+
+
+def backfill_values(connection: Connection, batch_size: int = 5000, log: Table = None) -> int:
+    """
+    Parses the reading of the sensor logs written before service_log.value existed, in batches by log_id
+    :param connection: an open connection, the caller commits
+    :param batch_size: number of logs read and updated at a time
+    :param log: service_log or one of its partitions, service_log by default
+    :return: the number of logs updated
+    """
+    log = log if log is not None else ServiceLog.__table__
+    set_value = update(log).where(log.c.log_id == bindparam("b_log_id")).values(value=bindparam("b_value"))
+    updated = 0
+    last_log_id = 0
+
+    while True:
+        rows = connection.execute(select(log.c.log_id, log.c.other_data, Service.__table__.c.app_type)
+                                  .join(Service.__table__, Service.__table__.c.app_id == log.c.app_id)
+                                  .where(log.c.log_id > last_log_id,
+                                         log.c.value.is_(None),
+                                         log.c.other_data.isnot(None),
+                                         Service.__table__.c.app_type.in_(SENSOR_TYPES))
+                                  .order_by(log.c.log_id)
+                                  .limit(batch_size)).all()
+        if not rows:
+            return updated
+
+        last_log_id = rows[-1].log_id
+        values = [{"b_log_id": row.log_id, "b_value": parse_value(row.app_type, row.other_data)} for row in rows]
+        values = [value for value in values if value["b_value"] is not None]
+        if values:
+            connection.execute(set_value, values)
+            updated += len(values)
+
+
+def backfill_all_values(connection: Connection, batch_size: int = 5000) -> int:
+    """
+    Runs backfill_values on service_log and on its attached partitions
+    :param connection: an open connection, the caller commits
+    :return: the number of logs updated
+    """
+    partitions = connection.execute(select(LogPartition.name)
+                                    .where(LogPartition.state == LogPartition.ATTACHED)).scalars().all()
+    updated = backfill_values(connection, batch_size)
+    for name in partitions:
+        updated += backfill_values(connection, batch_size, service_log_partition(name))
+    return updated
+
+
+def _add_service_log_value(connection: Connection):
+    # Databases created before the column existed, create_all doesn't add columns to existing tables
+    columns = {column["name"] for column in inspect(connection).get_columns(ServiceLog.__tablename__)}
+    if "value" not in columns:
+        column_type = ServiceLog.__table__.c.value.type.compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE {ServiceLog.__tablename__} ADD COLUMN value {column_type}"))
+
+    updated = backfill_values(connection)
+    __logger.info(f"Readings parsed from the existing logs: {updated}")
+
+
+def _create_service_search(connection: Connection):
+    create_search_index(connection)
+
+
+def _backfill_unit_readings(connection: Connection):
+    # Migration 3 only parsed "<sensor name>-<reading>", the sensor pages write "<sensor name> - <reading> <unit>"
+    updated = backfill_all_values(connection)
+    __logger.info(f"Readings parsed from the existing logs: {updated}")
+
+    if updated:
+        # The rollups folded so far have no readings, the logs still in service_log are folded again by the next
+        # update_rollups
+        with Session(bind=connection) as sm:
+            reset_rollups(sm)
+            sm.flush()
+
+
+def _service_log_autoincrement(connection: Connection):
+    # Other databases never reuse the ids of a sequence, the SQLite tables created before need to be rebuilt
+    if connection.dialect.name != "sqlite":
+        return
+    table = ServiceLog.__tablename__
+    sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                             {"name": table}).scalar()
+    if "AUTOINCREMENT" not in sql.upper():
+        old_columns = {column["name"] for column in inspect(connection).get_columns(table)}
+        columns = ", ".join(column.name for column in ServiceLog.__table__.columns if column.name in old_columns)
+        for index in ServiceLog.__table__.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_rebuild"))
+        ServiceLog.__table__.create(bind=connection)
+        connection.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_rebuild"))
+        connection.execute(text(f"DROP TABLE {table}_rebuild"))
+
+    # The ids already reused are behind the watermark, the next ones start after every id handed out so far
+    last_ids = [connection.execute(select(func.max(ServiceLog.__table__.c.log_id))).scalar(),
+                connection.execute(select(func.max(RollupWatermark.last_log_id))).scalar()]
+    for name in connection.execute(select(LogPartition.name)
+                                   .where(LogPartition.state == LogPartition.ATTACHED)).scalars().all():
+        partition = service_log_partition(name)
+        last_ids.append(connection.execute(select(func.max(partition.c.log_id))).scalar())
+    last_id = max((last for last in last_ids if last is not None), default=0)
+    if connection.execute(text("UPDATE sqlite_sequence SET seq = max(seq, :seq) WHERE name = :name"),
+                          {"seq": last_id, "name": table}).rowcount == 0:
+        connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                           {"seq": last_id, "name": table})
+
+
+# Ordered list of (version, description, migration), append new migrations at the end
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Time series indexes on service_log", _create_service_log_indexes),
+    (2, "Backfill service_status_current from service_log", _backfill_status_current),
+    (3, "Sensor readings in service_log.value", _add_service_log_value),
+    (4, "Full-text search index over the services", _create_service_search),
+    (5, "Sensor readings written with a unit in service_log.value", _backfill_unit_readings),
+    (6, "service_log ids never reused (AUTOINCREMENT)", _service_log_autoincrement),
+]
+
+
+def applied_versions(connection: Connection) -> set[int]:
+    """
+    Gets the versions already applied to the database
+    :param connection: an open connection
+    :return: a set with the applied versions
+    """
+    schema_migrations.create(bind=connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine: Engine = None) -> list[int]:
+    """
+    Creates the missing tables and applies the pending migrations, each one in its own transaction
+    :param engine: engine to migrate, by default the process wide engine
+    :return: a list with the versions applied
+    """
+    engine = engine or get_engine()
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    done = []
+    for version, description, migration in MIGRATIONS:
+        if version in applied:
+            continue
+
+        __logger.info(f"Applying migration {version}: {description}")
+        with engine.begin() as connection:
+            migration(connection)
+            connection.execute(schema_migrations.insert().values(version=version,
+                                                                 description=description,
+                                                                 applied_at=datetime.now()))
+        done.append(version)
+
+    if done:
+        __logger.info(f"[Success] Migrations applied: {', '.join(str(version) for version in done)}")
+    return done
@@ -0,0 +1,250 @@
+"""
+Monthly partitions of service_log: new logs are always written to service_log, the current partition, and the
+closed months are moved to their own table (service_log_<yyyymm>) once they are rolled up. Reads by date range
+go to service_log and to the partitions of the months they overlap. A partition can be detached to its own SQLite
+file and attached again, or archived (database.retention.archive_partition) and dropped as a whole
+"""
+# Standard library imports
+from datetime import date, datetime
+import logging
+import os
+import time
+from typing import Optional
+
+# Third party imports
+try:
+    from sqlalchemy import Table, and_, delete, func, insert, select, update
+    from sqlalchemy.engine import Row
+except ImportError:
+    logging.warning("Package sqlalchemy need to be installed")
+    raise ImportError("Package sqlalchemy need to be installed")
+
+# Local specific imports
+try:
+    from database import get_engine
+    from database.rollups import WATERMARK_NAME, update_rollups
+    from common.models import LogPartition, RollupWatermark, ServiceLog, service_log_partition
+except ImportError:
+    logging.warning("Packages database and common need to be near this package")
+    raise ImportError("Packages database and common need to be near this package")
+
+
+__logger = logging.getLogger(__name__)
+
+# Name of the SQLite file database while a partition is copied to or from it
+DETACHED_SCHEMA = "detached"
+
+
+def month_start(day: date) -> datetime:
+    return datetime(day.year, day.month, 1)
+
+
+def next_month(day: date) -> datetime:
+    return datetime(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(day: date) -> str:
+    return f"{ServiceLog.__tablename__}_{day:%Y%m}"
+
+
+def overlapping_partitions(connection, start_date: datetime = None, end_date: datetime = None) -> list[Table]:
+    """
+    Partition pruning: the attached partitions with logs between the dates
+    :param connection: a connection or session, read in its transaction so the partitions match the logs read
+    :param start_date: start of the range, None for no lower bound
+    :param end_date: end of the range (included), None for no upper bound
+    :return: the tables of the partitions, oldest first
+    """
+    query = select(LogPartition.name).where(LogPartition.state == LogPartition.ATTACHED)
+    if start_date:
+        query = query.where(LogPartition.month_end > start_date)
+    if end_date:
+        query = query.where(LogPartition.month_start <= end_date)
+    return [service_log_partition(name)
+            for name in connection.execute(query.order_by(LogPartition.month_start)).scalars()]
+
+
+def get_partitions() -> list[dict]:
+    """
+    :return: every partition with its state and, for the attached ones, the number of logs
+    """
+    with get_engine().connect() as connection:
+        partitions = connection.execute(select(LogPartition.__table__).order_by(LogPartition.month_start)).all()
+        return [{**partition._asdict(),
+                 "logs": connection.execute(select(func.count())
+                                            .select_from(service_log_partition(partition.name))).scalar()
+                 if partition.state == LogPartition.ATTACHED else None}
+                for partition in partitions]
+
+
+def _get_partition(connection, name: str) -> Optional[Row]:
+    return connection.execute(select(LogPartition.__table__).where(LogPartition.name == name)).first()
+
+
+def partition_month(day: date, batch_size: int = 5000, pause: float = 0.0) -> int:
+    """
+    Moves the logs of a closed month from service_log to its partition, one short transaction per batch
+    Only the logs already rolled up are moved, the rest stay in service_log until the next run
+    :param day: any day of the month
+    :param batch_size: logs moved per transaction
+    :param pause: seconds between two batches, it leaves room to the writers
+    :return: the number of logs moved
+    :raise ValueError if the month isn't closed yet or its partition isn't attached
+    """
+    start, end = month_start(day), next_month(day)
+    if end > month_start(datetime.now()):
+        raise ValueError(f"The month {start:%Y-%m} isn't closed yet, its logs stay in {ServiceLog.__tablename__}")
+
+    name = partition_name(start)
+    log = ServiceLog.__table__
+    table = service_log_partition(name)
+    engine = get_engine()
+
+    with engine.begin() as connection:
+        watermark = connection.execute(select(RollupWatermark.last_log_id)
+                                       .where(RollupWatermark.name == WATERMARK_NAME)).scalar() or 0
+        in_month = and_(log.c.status_date >= start, log.c.status_date < end, log.c.log_id <= watermark)
+
+        partition = _get_partition(connection, name)
+        if partition is None:
+            if connection.execute(select(log.c.log_id).where(in_month).limit(1)).first() is None:
+                return 0
+            table.create(bind=connection, checkfirst=True)
+            # Registered before any log is moved, so the reads find every log in one place or the other
+            connection.execute(insert(LogPartition.__table__).values(name=name, month_start=start, month_end=end,
+                                                                     state=LogPartition.ATTACHED))
+        elif partition.state != LogPartition.ATTACHED:
+            raise ValueError(f"The partition {name} is {partition.state}, attach it first")
+
+    moved = 0
+    while True:
+        with engine.begin() as connection:
+            batch = select(log.c.log_id).where(in_month).order_by(log.c.log_id).limit(batch_size).subquery()
+            upto = connection.execute(select(func.max(batch.c.log_id))).scalar()
+            if upto is None:
+                break
+
+            chunk = and_(in_month, log.c.log_id <= upto)
+            connection.execute(insert(table).from_select(list(log.c.keys()), select(log).where(chunk)))
+            count = connection.execute(delete(log).where(chunk)).rowcount
+        moved += count
+        __logger.debug(f"Moved {count} logs to {name} up to log_id {upto}")
+        if count < batch_size:
+            break
+        time.sleep(pause)
+
+    if moved:
+        __logger.info(f"[Success] Moved {moved} logs to {name}")
+    return moved
+
+
+def partition_logs(before: date = None, batch_size: int = 5000, pause: float = 0.0) -> dict[str, int]:
+    """
+    Brings the rollups up to date and moves every closed month still in service_log to its partition
+    :param before: months before this day's month are moved, the current month by default
+    :param batch_size: logs moved per transaction
+    :param pause: seconds between two batches
+    :return: the number of logs moved per partition
+    """
+    update_rollups()
+    last = month_start(min(before or date.today(), date.today()))
+    with get_engine().connect() as connection:
+        first = connection.execute(select(func.min(ServiceLog.status_date))).scalar()
+
+    moved = {}
+    month = month_start(first) if first else last
+    while month < last:
+        count = partition_month(month, batch_size=batch_size, pause=pause)
+        if count:
+            moved[partition_name(month)] = count
+        month = next_month(month)
+    return moved
+
+
+def drop_partition(name: str, state: str = None, path: str = None):
+    """
+    Drops the table of a partition
+    :param name: name of the partition
+    :param state: new state of the partition (detached or archived), None forgets it
+    :param path: where its logs went
+    """
+    with get_engine().begin() as connection:
+        service_log_partition(name).drop(bind=connection, checkfirst=True)
+        if state:
+            connection.execute(update(LogPartition.__table__).where(LogPartition.name == name)
+                               .values(state=state, path=path))
+        else:
+            connection.execute(delete(LogPartition.__table__).where(LogPartition.name == name))
+
+
+def detach_partition(name: str, directory: str) -> str:
+    """
+    Moves an attached partition to its own SQLite file, <directory>/<name>.db, out of the reads
+    :param name: name of the partition
+    :param directory: folder of the file
+    :return: the path of the file
+    :raise ValueError if the database isn't SQLite or the partition isn't attached
+    """
+    engine = get_engine()
+    if engine.dialect.name != "sqlite":
+        raise ValueError(f"Partitions can only be detached from SQLite")
+    with engine.connect() as connection:
+        partition = _get_partition(connection, name)
+    if partition is None or partition.state != LogPartition.ATTACHED:
+        raise ValueError(f"The partition {name} isn't attached")
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.abspath(os.path.join(directory, f"{name}.db"))
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # ATTACH and DETACH can't run inside a transaction
+        cursor.execute(f"ATTACH DATABASE ? AS {DETACHED_SCHEMA}", (path,))
+        try:
+            cursor.execute(f"CREATE TABLE {DETACHED_SCHEMA}.{ServiceLog.__tablename__} AS SELECT * FROM {name}")
+            connection.commit()
+        finally:
+            connection.rollback()
+            cursor.execute(f"DETACH DATABASE {DETACHED_SCHEMA}")
+    finally:
+        connection.close()
+
+    drop_partition(name, LogPartition.DETACHED, path)
+    __logger.info(f"[Success] Partition {name} detached to {path}")
+    return path
+
+
+def attach_partition(name: str) -> int:
+    """
+    Copies a detached partition back from its SQLite file, the file is left in place
+    :param name: name of the partition
+    :return: the number of logs attached
+    :raise ValueError if the partition isn't detached
+    """
+    engine = get_engine()
+    with engine.connect() as connection:
+        partition = _get_partition(connection, name)
+    if partition is None or partition.state != LogPartition.DETACHED:
+        raise ValueError(f"The partition {name} isn't detached")
+
+    table = service_log_partition(name)
+    table.create(bind=engine, checkfirst=True)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {DETACHED_SCHEMA}", (partition.path,))
+        try:
+            cursor.execute(f"INSERT INTO {name} SELECT * FROM {DETACHED_SCHEMA}.{ServiceLog.__tablename__}")
+            attached = cursor.rowcount
+            connection.commit()
+        finally:
+            connection.rollback()
+            cursor.execute(f"DETACH DATABASE {DETACHED_SCHEMA}")
+    finally:
+        connection.close()
+
+    with engine.begin() as connection:
+        connection.execute(update(LogPartition.__table__).where(LogPartition.name == name)
+                           .values(state=LogPartition.ATTACHED, path=None))
+    __logger.info(f"[Success] Partition {name} attached again, {attached} logs")
+    return attached
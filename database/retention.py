@@ -0,0 +1,271 @@
+"""
+Retention of the raw logs: the logs older than the TTL of their service type are exported to gzipped CSV files,
+one per day, then deleted in bounded batches, from service_log and its monthly partitions. Rollups are kept
+forever, so the graphs of old dates still work
+"""
+# Standard library imports
+import csv
+from datetime import date, datetime, timedelta
+import gzip
+import logging
+import os
+import time
+from typing import Optional
+
+# Third party imports
+try:
+    from sqlalchemy import Table, and_, func, select
+except ImportError:
+    logging.warning("Package sqlalchemy need to be installed")
+    raise ImportError("Package sqlalchemy need to be installed")
+
+# Local specific imports
+try:
+    from database import get_engine
+    from database.partitions import drop_partition, overlapping_partitions
+    from database.rollups import WATERMARK_NAME, update_rollups
+    from common.models import AppType, LogPartition, RollupWatermark, Service, ServiceLog, service_log_partition
+except ImportError:
+    logging.warning("Packages database and common need to be near this package")
+    raise ImportError("Packages database and common need to be near this package")
+
+
+__logger = logging.getLogger(__name__)
+
+# Columns of the archive files, in this order, after a header row
+ARCHIVE_COLUMNS: tuple[str, ...] = ("log_id", "app_id", "status", "status_date", "other_data", "value")
+
+
+def parse_retention(value: str, default: Optional[float] = None) -> dict[str, Optional[float]]:
+    """
+    :param value: days of raw logs kept per AppType, e.g.: "web=90,temperature_sensor=30"
+    :param default: days kept for the types not listed, None keeps them forever
+    :return: days per AppType value, None for the types whose logs are never deleted
+    :raise ValueError if a type or a number of days is not valid
+    """
+    retention = {app_type.value: default for app_type in AppType}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        app_type, _, days = item.partition("=")
+        if app_type.strip() not in retention:
+            raise ValueError(f"Unknown service type {app_type}, it must be one of: {', '.join(retention)}")
+        retention[app_type.strip()] = float(days) if days.strip() else None
+    return retention
+
+
+def archive_path(directory: str, day: date, first_log_id: int) -> str:
+    """
+    Archives are partitioned by date: <directory>/service_log/<year>/<month>/service_log-<day>-<first log_id>.csv.gz
+    """
+    return os.path.join(directory, ServiceLog.__tablename__, f"{day:%Y}", f"{day:%m}",
+                        f"{ServiceLog.__tablename__}-{day.isoformat()}-{first_log_id}.csv.gz")
+
+
+def write_archive(directory: str, rows: list) -> list[str]:
+    """
+    Writes the rows to one file per day, each file is complete on disk before this returns
+    :param directory: root of the archive
+    :param rows: rows with the ARCHIVE_COLUMNS, ordered by log_id
+    :return: the paths written
+    """
+    days: dict[date, list] = {}
+    for row in rows:
+        days.setdefault(row.status_date.date(), []).append(row)
+
+    paths = []
+    for day, day_rows in days.items():
+        path = archive_path(directory, day, day_rows[0].log_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to its final name and renamed, a crash never leaves a truncated archive behind
+        partial = f"{path}.part"
+        with gzip.open(partial, "wt", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(ARCHIVE_COLUMNS)
+            writer.writerows((row.log_id, row.app_id, row.status, row.status_date.isoformat(sep=" "),
+                              row.other_data, row.value) for row in day_rows)
+        with open(partial, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(partial, path)
+        paths.append(path)
+    return paths
+
+
+def expire_logs(retention: dict[str, Optional[float]],
+                archive_dir: Optional[str],
+                batch_size: int = 5000,
+                pause: float = 0.0,
+                now: datetime = None,
+                dry_run: bool = False) -> dict:
+    """
+    Archives and deletes the logs older than the retention of their service type, one short transaction per batch
+    Only the logs already folded into the rollups are deleted, the rollups are brought up to date first
+    :param retention: days kept per AppType value, see parse_retention
+    :param archive_dir: root of the archive, None deletes the logs without exporting them
+    :param batch_size: logs archived and deleted per transaction
+    :param pause: seconds between two batches, it leaves room to the writers
+    :param now: reference time, now by default
+    :param dry_run: only count the logs that would be deleted, among the ones already rolled up
+    :return: a dict with the logs deleted (or expired on a dry run) per type and the archive files written
+    """
+    now = now or datetime.now()
+    log = ServiceLog.__table__
+    engine = get_engine()
+
+    if not dry_run:
+        update_rollups()
+    with engine.connect() as connection:
+        watermark = connection.execute(select(RollupWatermark.last_log_id)
+                                       .where(RollupWatermark.name == WATERMARK_NAME)).scalar() or 0
+
+    result = {"deleted": {}, "files": []}
+    for app_type, days in retention.items():
+        if days is None:
+            continue
+
+        cutoff = now - timedelta(days=days)
+        with engine.connect() as connection:
+            tables = [log] + overlapping_partitions(connection, None, cutoff)
+
+        deleted = 0
+        for table in tables:
+            expired = and_(table.c.app_id.in_(select(Service.app_id).where(Service.app_type == app_type)),
+                           table.c.status_date < cutoff)
+            # The logs of the partitions are all rolled up already
+            if table is log:
+                expired = and_(expired, table.c.log_id <= watermark)
+            if dry_run:
+                with engine.connect() as connection:
+                    deleted += connection.execute(select(func.count()).select_from(table).where(expired)).scalar()
+            else:
+                deleted += _expire(table, expired, archive_dir, batch_size, pause, result["files"])
+
+        result["deleted"][app_type] = deleted
+        if deleted and not dry_run:
+            __logger.info(f"[Success] Deleted {deleted} {app_type} logs older than {cutoff:%Y-%m-%d %H:%M}")
+
+    if not dry_run:
+        # Partitions left empty are dropped as a whole
+        with engine.connect() as connection:
+            empty = [table.name for table in overlapping_partitions(connection)
+                     if connection.execute(select(table.c.log_id).limit(1)).first() is None]
+        for name in empty:
+            drop_partition(name)
+
+    return result
+
+
+def _expire(table: Table, expired, archive_dir: Optional[str], batch_size: int, pause: float,
+            files: list[str]) -> int:
+    """
+    Archives and deletes the logs of a table matching expired in batches
+    :return: the number of logs deleted
+    """
+    engine = get_engine()
+    deleted = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(select(*(table.c[column] for column in ARCHIVE_COLUMNS))
+                                      .where(expired).order_by(table.c.log_id).limit(batch_size)).all()
+            if not rows:
+                break
+
+            if archive_dir:
+                files.extend(write_archive(archive_dir, rows))
+            # Same condition within the ids exported, so only those rows go
+            connection.execute(table.delete().where(expired, table.c.log_id.between(rows[0].log_id,
+                                                                                    rows[-1].log_id)))
+        deleted += len(rows)
+        __logger.debug(f"Deleted {len(rows)} logs from {table.name} up to log_id {rows[-1].log_id}")
+        if len(rows) < batch_size:
+            break
+        time.sleep(pause)
+    return deleted
+
+
+def archive_partition(name: str, archive_dir: str, batch_size: int = 5000) -> list[str]:
+    """
+    Exports every log of an attached partition to the archive, then drops the partition as a whole
+    :param name: name of the partition, e.g.: service_log_202201
+    :param archive_dir: root of the archive
+    :param batch_size: logs read at a time
+    :return: the archive files written
+    :raise ValueError if the partition isn't attached
+    """
+    engine = get_engine()
+    with engine.connect() as connection:
+        if name not in (table.name for table in overlapping_partitions(connection)):
+            raise ValueError(f"The partition {name} isn't attached")
+
+    table = service_log_partition(name)
+    files = []
+    last_log_id = 0
+    with engine.connect() as connection:
+        while True:
+            rows = connection.execute(select(*(table.c[column] for column in ARCHIVE_COLUMNS))
+                                      .where(table.c.log_id > last_log_id)
+                                      .order_by(table.c.log_id).limit(batch_size)).all()
+            if not rows:
+                break
+            files.extend(write_archive(archive_dir, rows))
+            last_log_id = rows[-1].log_id
+
+    drop_partition(name, LogPartition.ARCHIVED, os.path.abspath(archive_dir))
+    __logger.info(f"[Success] Partition {name} archived to {len(files)} files")
+    return files
+
+
+def compact(pages: int = 1000, max_steps: int = 100, pause: float = 0.0) -> dict:
+    """
+    Gives the free pages of a SQLite database back to the file system a few at a time, then updates the planner
+    statistics (PRAGMA optimize). Each step is a short transaction instead of the long lock of a full VACUUM
+    It needs auto_vacuum = INCREMENTAL, see enable_incremental_vacuum
+    :param pages: pages freed per step
+    :param max_steps: steps at most
+    :param pause: seconds between two steps
+    :return: a dict with the auto_vacuum mode and the free pages before and after
+    """
+    engine = get_engine()
+    if engine.dialect.name != "sqlite":
+        __logger.info(f"Compaction is only available for SQLite")
+        return {}
+
+    # The DBAPI connection commits each step, PRAGMA statements don't start a transaction by themselves
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        mode = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        before = after = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        # 2 is INCREMENTAL
+        if mode != 2:
+            __logger.warning(f"auto_vacuum is not incremental, the free pages can't be reclaimed step by step: "
+                             f"run python -m database compact --enable-incremental once")
+
+        steps = 0
+        while mode == 2 and after and steps < max_steps:
+            # The pragma frees one page per step of the statement and execute() only steps it once,
+            # executescript() runs it to the end (and commits)
+            cursor.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            after = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            steps += 1
+            if after:
+                time.sleep(pause)
+
+        cursor.execute("PRAGMA optimize").fetchall()
+        connection.commit()
+    finally:
+        connection.close()
+
+    __logger.info(f"[Success] Free pages: {before} before, {after} after")
+    return {"auto_vacuum": mode, "free_pages_before": before, "free_pages_after": after}
+
+
+def enable_incremental_vacuum():
+    """
+    Switches a SQLite database to auto_vacuum = INCREMENTAL, it runs a full VACUUM once, which locks the database
+    """
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("VACUUM")
+    finally:
+        connection.close()
@@ -0,0 +1,244 @@
+"""
+Hourly and daily rollups of service_log, built incrementally from a log_id watermark
+"""
+# Standard library imports
+from datetime import datetime
+import logging
+import os
+import threading
+from typing import Optional, Type
+
+# Third party imports
+try:
+    import sqlalchemy.exc
+    from sqlalchemy import Table, case, func, select, update
+    from sqlalchemy.orm import Session
+except ImportError:
+    logging.warning("Package sqlalchemy need to be installed")
+    raise ImportError("Package sqlalchemy need to be installed")
+
+# Local specific imports
+try:
+    from database import new_session
+    from common.models import Service, ServiceLog, ServiceLogHourly, ServiceLogDaily, RollupMixin, RollupWatermark, \
+        LogPartition, service_log_partition
+except ImportError:
+    logging.warning("Packages database and common need to be near this package")
+    raise ImportError("Packages database and common need to be near this package")
+
+
+__logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = ServiceLog.__tablename__
+ROLLUP_MODELS: tuple[Type[RollupMixin], ...] = (ServiceLogHourly, ServiceLogDaily)
+
+
+def bucket_start(column, resolution: str, dialect: str):
+    """
+    SQL expression with the start of the bucket a date belongs to
+    :param column: the date column
+    :param resolution: "hour" or "day"
+    :param dialect: name of the database dialect, SQLite and PostgreSQL are supported
+    """
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m-%d %H:00:00" if resolution == "hour" else "%Y-%m-%d 00:00:00", column)
+    return func.date_trunc(resolution, column)
+
+
+def _aggregate(sm: Session, first_log_id: int, last_log_id: Optional[int], log: Table = None) -> list[RollupMixin]:
+    """
+    Aggregates the logs in (first_log_id, last_log_id] per service and bucket with a GROUP BY
+    :param log: service_log or one of its partitions, service_log by default
+    :param last_log_id: None aggregates every log after first_log_id
+    :return: a partial rollup per model, service and bucket
+    """
+    log = log if log is not None else ServiceLog.__table__
+    dialect = sm.get_bind().dialect.name
+    partials = []
+    for model in ROLLUP_MODELS:
+        bucket = bucket_start(log.c.status_date, model.resolution, dialect)
+        rows = sm.query(log.c.app_id, bucket,
+                        func.count(log.c.log_id),
+                        func.sum(case((log.c.status == "Running", 1), else_=0)),
+                        func.min(log.c.status_date), func.max(log.c.status_date),
+                        func.count(log.c.value), func.sum(log.c.value),
+                        func.min(log.c.value), func.max(log.c.value)) \
+            .join(Service, Service.app_id == log.c.app_id) \
+            .filter(log.c.log_id > first_log_id) \
+            .group_by(log.c.app_id, bucket)
+        if last_log_id is not None:
+            rows = rows.filter(log.c.log_id <= last_log_id)
+
+        for app_id, start, total, running, first_date, last_date, value_count, value_sum, minimum, maximum in rows:
+            # SQLite returns the bucket as text
+            partial = model(app_id, start if isinstance(start, datetime) else datetime.fromisoformat(start))
+            partial.count_total = total
+            partial.count_running = running
+            partial.uptime = running / total
+            partial.first_status_date = first_date
+            partial.last_status_date = last_date
+            if value_count:
+                partial.value_count = value_count
+                partial.value_sum = value_sum
+                partial.value_min = minimum
+                partial.value_max = maximum
+            partials.append(partial)
+    return partials
+
+
+def _fold(sm: Session, partials: list[RollupMixin]):
+    # The rollups already stored are loaded with one query per model instead of one per bucket
+    sm.flush()
+    with sm.no_autoflush:
+        for model in ROLLUP_MODELS:
+            model_partials = [partial for partial in partials if type(partial) is model]
+            if not model_partials:
+                continue
+
+            starts = [partial.bucket_start for partial in model_partials]
+            stored = sm.query(model).filter(model.app_id.in_({partial.app_id for partial in model_partials}),
+                                            model.bucket_start.between(min(starts), max(starts)))
+            rollups = {(rollup.app_id, rollup.bucket_start): rollup for rollup in stored}
+            for partial in model_partials:
+                rollup = rollups.get((partial.app_id, partial.bucket_start))
+                if rollup is None:
+                    sm.add(partial)
+                else:
+                    rollup.merge(partial)
+
+
+def update_rollups(batch_size: int = 5000) -> int:
+    """
+    Folds the logs created after the watermark into the rollup tables, one transaction per batch
+    The watermark is moved with a compare-and-set, so concurrent runs never fold the same logs twice. A log committed
+    with an id below the watermark would never be folded, DataManager._lock_log_ids keeps that from happening
+    :param batch_size: number of logs per transaction
+    :return: the number of logs folded
+    """
+    folded = 0
+
+    while True:
+        session = new_session()
+        with session as sm:
+            watermark = sm.get(RollupWatermark, WATERMARK_NAME)
+            if watermark is None:
+                sm.add(RollupWatermark(WATERMARK_NAME))
+                sm.commit()
+                continue
+            last_log_id = watermark.last_log_id
+
+            batch = sm.query(ServiceLog.log_id).filter(ServiceLog.log_id > last_log_id) \
+                .order_by(ServiceLog.log_id).limit(batch_size).subquery()
+            upto, count = sm.query(func.max(batch.c.log_id), func.count(batch.c.log_id)).one()
+            if not count:
+                return folded
+
+            moved = sm.execute(update(RollupWatermark)
+                               .where(RollupWatermark.name == WATERMARK_NAME,
+                                      RollupWatermark.last_log_id == last_log_id)
+                               .values(last_log_id=upto)
+                               .execution_options(synchronize_session=False))
+            if moved.rowcount != 1:
+                __logger.info(f"Rollup watermark moved by another worker, stopping")
+                sm.rollback()
+                return folded
+
+            _fold(sm, _aggregate(sm, last_log_id, upto))
+            sm.commit()
+
+        folded += count
+        __logger.debug(f"Rolled up {count} logs, watermark at {upto}")
+        if count < batch_size:
+            return folded
+
+
+def reset_rollups(sm: Session) -> int:
+    """
+    Empties the rollup tables and the watermark and folds the attached partitions again, the logs still in
+    service_log are folded by the next update_rollups
+    :param sm: an open session, the caller commits
+    :return: the number of logs of the partitions folded
+    """
+    for model in ROLLUP_MODELS:
+        sm.query(model).delete(synchronize_session=False)
+    sm.query(RollupWatermark).filter(RollupWatermark.name == WATERMARK_NAME).delete(synchronize_session=False)
+    # Only logs behind the watermark are moved to a partition, they are folded once here
+    folded = 0
+    for name in sm.execute(select(LogPartition.name).where(LogPartition.state == LogPartition.ATTACHED)).scalars():
+        partials = _aggregate(sm, 0, None, service_log_partition(name))
+        folded += sum(partial.count_total for partial in partials if isinstance(partial, ROLLUP_MODELS[0]))
+        _fold(sm, partials)
+    return folded
+
+
+def rebuild_rollups() -> int:
+    """
+    Empties the rollup tables and folds every log again, the attached partitions included
+    The logs of the detached and archived partitions are out of the database, their rollups are lost
+    :return: the number of logs folded
+    """
+    session = new_session()
+    with session as sm:
+        folded = reset_rollups(sm)
+        sm.commit()
+
+    return folded + update_rollups()
+
+
+class RollupWorker(threading.Thread):
+    """Background thread that keeps the rollups up to date"""
+    __logger = logging.getLogger(__name__)
+
+    def __init__(self, interval: float = 60.0, batch_size: int = 5000):
+        super().__init__(name="rollup-worker", daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+
+    def run(self):
+        self.__logger.info(f"Rollup worker started, interval {self.interval}s")
+        while not self._stopped.is_set():
+            try:
+                folded = update_rollups(self.batch_size)
+            except sqlalchemy.exc.SQLAlchemyError:
+                self.__logger.exception(f"There was a problem with the Database and couldn't update the rollups",
+                                        exc_info=True)
+            else:
+                if folded:
+                    self.__logger.info(f"[Success] Rolled up {folded} logs")
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+
+_rollup_worker: Optional[RollupWorker] = None
+_rollup_worker_lock = threading.Lock()
+
+
+def start_rollup_worker() -> Optional[RollupWorker]:
+    """
+    Starts the rollup worker of this process once, every ROLLUP_INTERVAL seconds (60), unless ROLLUP_WORKER is false
+    :return: the rollup worker or None if it is disabled
+    """
+    global _rollup_worker
+
+    if _rollup_worker is None:
+        if os.getenv("ROLLUP_WORKER", "true").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        with _rollup_worker_lock:
+            if _rollup_worker is None:
+                _rollup_worker = RollupWorker(interval=float(os.getenv("ROLLUP_INTERVAL", 60)))
+                _rollup_worker.start()
+    return _rollup_worker
+
+
+def _after_fork_in_child():
+    # Threads don't survive a fork, the child starts its own worker
+    global _rollup_worker, _rollup_worker_lock
+
+    _rollup_worker_lock = threading.Lock()
+    _rollup_worker = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,115 @@
+"""
+Full-text search over the services: an SQLite FTS5 index of name, description, url and app_type, kept in sync with
+the service table by triggers, so every write (DataManager.add_service, update_service, ...) updates it in the same
+transaction. Words are matched by prefix and the results are ranked with bm25
+"""
+# Standard library imports
+import logging
+import re
+from typing import Iterable, Optional
+
+# Third party imports
+try:
+    from sqlalchemy import text
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.sql.elements import TextClause
+except ImportError:
+    logging.warning("Package sqlalchemy need to be installed")
+    raise ImportError("Package sqlalchemy need to be installed")
+
+# Local specific imports
+try:
+    from common.models import Service
+except ImportError:
+    logging.warning("Package common need to be near this package")
+    raise ImportError("Package common need to be near this package")
+
+
+__logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "service_search"
+SEARCH_COLUMNS: tuple[str, ...] = ("name", "description", "url", "app_type")
+# bm25 weight of each column, in SEARCH_COLUMNS order: a match in the name counts the most
+SEARCH_WEIGHTS: tuple[float, ...] = (10.0, 2.0, 4.0, 1.0)
+
+# Words as the unicode61 tokenizer splits them: letters and digits, anything else separates them
+_WORD = re.compile(r"[^\W_]+")
+
+
+def search_words(query: str) -> list[str]:
+    return _WORD.findall(query or "")
+
+
+def match_expression(query: str, columns: Iterable[str] = None) -> Optional[str]:
+    """
+    Turns what the user typed into an FTS5 query: every word must match the start of a word of the service
+    :param query: e.g.: "temp are" becomes "temp"* "are"*
+    :param columns: only match these SEARCH_COLUMNS, all of them if None
+    :return: the MATCH expression or None if there isn't any word to search
+    """
+    expression = " ".join(f'"{word}"*' for word in search_words(query))
+    if expression and columns:
+        return f"{{{' '.join(columns)}}} : ({expression})"
+    return expression or None
+
+
+def search_index_exists(connection: Connection) -> bool:
+    if connection.dialect.name != "sqlite":
+        return False
+    return connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {"name": SEARCH_TABLE}).first() is not None
+
+
+def create_search_index(connection: Connection) -> bool:
+    """
+    Creates the FTS5 index, the triggers that keep it in sync with the service table and indexes the services
+    :param connection: an open connection, the caller commits
+    :return: False if the database isn't SQLite or its SQLite lacks FTS5, the search falls back to LIKE then
+    """
+    if connection.dialect.name != "sqlite" or \
+            not connection.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+        __logger.warning(f"FTS5 isn't available, the service search will use LIKE")
+        return False
+
+    table, columns = Service.__tablename__, ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+    # External content: the index doesn't keep a copy of the text, the rows are read from the service table
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5({columns}, content='{table}', "
+        f"content_rowid='app_id', tokenize='unicode61', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.app_id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', old.app_id, {old_values}); "
+        f"END",
+        f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', old.app_id, {old_values}); "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.app_id, {new_values}); END",
+    ]
+    for statement in statements:
+        connection.execute(text(statement))
+    rebuild_search_index(connection)
+    return True
+
+
+def rebuild_search_index(connection: Connection):
+    """
+    Indexes every service again, from the service table
+    :param connection: an open connection, the caller commits
+    """
+    connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+
+def search_statement(status: Optional[str] = None, app_type: Optional[str] = None) -> TextClause:
+    """
+    Services matching :expression, best ranked first, at most :limit
+    :param status: only the services with :status, all of them if None
+    :param app_type: only the services of type :app_type, all of them if None
+    """
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    table = Service.__tablename__
+    return text(f"SELECT {table}.* FROM {SEARCH_TABLE} JOIN {table} ON {table}.app_id = {SEARCH_TABLE}.rowid "
+                f"WHERE {SEARCH_TABLE} MATCH :expression {f'AND {table}.status = :status ' if status else ''}"
+                f"{f'AND {table}.app_type = :app_type ' if app_type else ''}"
+                f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT :limit")
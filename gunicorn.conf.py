@@ -0,0 +1,38 @@
+"""
+Gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is loaded once in the master (preload_app), so the schema is created once per deployment, and the workers
+are forked from it. Process wide state (engine, caches, ingest buffer, events broadcaster) resets itself in each
+worker after the fork, see os.register_at_fork in the database and common packages.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Threads let a worker serve other requests while it streams /events or waits on the database
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 8))
+preload_app = True
+# Recycles workers now and then, the jitter keeps them from restarting at the same time
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+
+
+def pre_fork(server, worker):
+    # The master doesn't serve requests, the connections it opened to create the schema are closed
+    from database import dispose_engine
+    dispose_engine()
+
+
+def post_fork(server, worker):
+    # Each /events client holds one of the threads of the worker until it disconnects, some are kept for the
+    # other requests
+    from common.broadcaster import limit_to_threads
+    limit_to_threads(server.cfg.threads)
+
+    # Every worker runs one, the watermark compare-and-set keeps them from folding the same logs twice. The app
+    # would start it on the first request anyway, this way the rollups are ready before it
+    from database.rollups import start_rollup_worker
+    start_rollup_worker()
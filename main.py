@@ -7,8 +7,7 @@ from dotenv import load_dotenv
 from flask import Flask, render_template
 from flask_cors import CORS
 
-app = Flask(__name__)
-CORS(app)
+from database import remove_session
 
 
 def setup_logging(
@@ -34,27 +33,66 @@ def setup_logging(
         logging.basicConfig(level=default_level)
 
 
-@app.errorhandler(404)
 def page_not_found(e):
     return render_template("error.html", text=e), 404
 
 
-@app.errorhandler(401)
-def page_not_found(e):
+def unauthorized(e):
     return render_template("error.html", text=e), 401
 
 
-if __name__ == "__main__":
-    load_dotenv()
-    setup_logging()
+def start_background_work():
+    """Starts the rollup worker of this process if it isn't running yet, see create_app"""
+    from database.rollups import start_rollup_worker
+    start_rollup_worker()
+
+
+def create_app(config: dict = None, create_schema: bool = None) -> Flask:
+    """
+    Application factory, used by the development server below and by wsgi.py
+    :param config: values that override the Flask configuration
+    :param create_schema: create the tables and apply the pending migrations, by default the environment
+    variable DB_CREATE_SCHEMA (true). Run it once per deployment, e.g. in the WSGI master before forking workers
+    :return: the Flask app with every blueprint registered
+    """
+    app = Flask(__name__)
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev")
+    app.config.update(config or {})
+    CORS(app)
+    app.teardown_appcontext(remove_session)
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(401, unauthorized)
+
+    if create_schema is None:
+        create_schema = os.getenv("DB_CREATE_SCHEMA", "true").strip().lower() in ("1", "true", "yes", "on")
+
+    from database.data_manager import DataManager
+    if create_schema:
+        DataManager.create_schema()
+
+    # Started by the first request of each process, whatever the WSGI server: the ones that fork their workers
+    # call create_app before the fork, which threads don't survive
+    app.before_request(start_background_work)
 
     from auth import bp as auth_bp
     from views import bp as views_bp
     from admin import bp as admin_bp
+    from api import bp as api_bp
 
+    # First, so its hooks time the requests from the first before_request to the last after_request
+    if os.getenv("METRICS", "true").strip().lower() in ("1", "true", "yes", "on"):
+        from metrics import bp as metrics_bp
+        app.register_blueprint(metrics_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(views_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp)
+
+    return app
 
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    app = create_app()
     app.run("0.0.0.0", debug=True)
@@ -0,0 +1,70 @@
+from flask import (
+    Blueprint, Response, request
+)
+
+from auth import skip_user_load, token_required
+from common.cache import cache_stats
+from common.metrics import clear_request, collected, end_request, render, start_request
+from common.routes import route_plans
+from database import get_pool_stats
+
+bp = Blueprint("metrics", __name__)
+
+# Metric name, type and help of each key of get_pool_stats
+POOL_METRICS = {
+    "connections": ("wsc_db_pool_connections_total", "counter", "Database connections opened"),
+    "checkouts": ("wsc_db_pool_checkouts_total", "counter", "Connections taken from the pool"),
+    "checkins": ("wsc_db_pool_checkins_total", "counter", "Connections given back to the pool"),
+    "checked_out": ("wsc_db_pool_checked_out", "gauge", "Connections in use"),
+    "timeouts": ("wsc_db_pool_timeouts_total", "counter", "Checkouts that gave up waiting for a connection"),
+    "wait_total_seconds": ("wsc_db_pool_wait_seconds_total", "counter", "Seconds spent waiting for a connection"),
+    "wait_max_seconds": ("wsc_db_pool_wait_max_seconds", "gauge", "Longest wait for a connection"),
+    "wait_avg_seconds": ("wsc_db_pool_wait_avg_seconds", "gauge", "Average wait for a connection"),
+    "pool_size": ("wsc_db_pool_size", "gauge", "Connections the pool keeps"),
+    "pool_checked_in": ("wsc_db_pool_checked_in", "gauge", "Idle connections in the pool"),
+    "pool_overflow": ("wsc_db_pool_overflow", "gauge", "Connections opened beyond the pool size"),
+}
+
+
+@bp.before_app_request
+def start_request_metrics():
+    start_request(request.endpoint)
+
+
+@bp.after_app_request
+def end_request_metrics(response):
+    metrics = end_request(request.method, response.status_code)
+    if metrics is not None:
+        response.headers.add("Server-Timing", f'db;dur={metrics.query_seconds * 1000:.1f};'
+                                              f'desc="{metrics.queries} queries"')
+    return response
+
+
+@bp.teardown_app_request
+def clear_request_metrics(exception=None):
+    # Streamed responses run their queries until here, they still count for the endpoint
+    clear_request()
+
+
+@bp.route("/metrics")
+@skip_user_load
+@token_required
+def metrics():
+    """Request, query, connection pool and cache metrics of this process, in the Prometheus text format"""
+    pool = get_pool_stats()
+    caches = cache_stats()
+    caches["route_plans"] = route_plans.stats()
+
+    extra = [collected(POOL_METRICS[key][0], POOL_METRICS[key][2], {None: value}, kind=POOL_METRICS[key][1])
+             for key, value in pool.items() if key in POOL_METRICS]
+    extra += [
+        collected("wsc_cache_hits_total", "Cache lookups that found the entry",
+                  {name: stats["hits"] for name, stats in caches.items()}, "cache", "counter"),
+        collected("wsc_cache_misses_total", "Cache lookups that didn't find the entry",
+                  {name: stats["misses"] for name, stats in caches.items()}, "cache", "counter"),
+        collected("wsc_cache_hit_ratio", "Hits over lookups since the process started",
+                  {name: stats["hit_ratio"] for name, stats in caches.items()}, "cache"),
+        collected("wsc_cache_entries", "Entries kept", {name: stats["size"] for name, stats in caches.items()},
+                  "cache"),
+    ]
+    return Response(render(*extra), mimetype="text/plain; version=0.0.4")
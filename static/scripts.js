@@ -1,20 +1,144 @@
+// Milliseconds without typing before the search is sent
+var SEARCH_DEBOUNCE = 250;
+var search_timer = null;
+
 function searchbar() {
-    var input = document.getElementById("searchbar").value;
+    var input = document.getElementById("searchbar");
+    if (!document.getElementById("more")) {
+        filter_cards(input.value);
+        return;
+    }
+    clearTimeout(search_timer);
+    search_timer = setTimeout(function() { load_cards(input.value); }, SEARCH_DEBOUNCE);
+}
+
+function filter_cards(input) {
     var filter = input.toUpperCase();
     var cardContainer = document.getElementById("data");
     var cards = cardContainer.getElementsByClassName("col");
-    
+
     for (i = 0; i < cards.length; i++) {
         title = cards[i].getElementsByClassName("card-title");
         body = cards[i].getElementsByClassName("card-text");
         if (title[0].innerText.toUpperCase().includes(filter) || body[0].innerText.toUpperCase().includes(filter)) {
-            cards[i].classList.replace('d-none', '-');
+            cards[i].classList.remove('d-none');
         } else {
             cards[i].classList.add('d-none');
         }
     }
 }
 
+// The page only renders the first service cards, the next page is fetched when the end of the grid is about
+// to be visible and a search replaces the cards with the services found
+var cards_observer = null;
+var cards_controller = null;
+var cards_query = "";
+
+function page_cards() {
+    var more = document.getElementById("more");
+    if (!more || !("IntersectionObserver" in window)) {
+        return;
+    }
+    cards_observer = new IntersectionObserver(function(entries) {
+        if (entries[0].isIntersecting) {
+            load_cards();
+        }
+    }, {rootMargin: "800px"});
+    cards_observer.observe(more);
+}
+
+function load_cards(query) {
+    var more = document.getElementById("more");
+    var container = document.getElementById("data");
+    var reset = query !== undefined;
+    if (!reset && (!more.dataset.nextCursor || cards_controller)) {
+        return;
+    }
+    if (cards_controller) {
+        cards_controller.abort();
+    }
+
+    var url = new URL(more.dataset.pageUrl, window.location.href);
+    if (reset) {
+        cards_query = query.trim();
+    } else {
+        url.searchParams.set("cursor", more.dataset.nextCursor);
+    }
+    if (cards_query) {
+        url.searchParams.set("q", cards_query);
+    }
+
+    var controller = cards_controller = new AbortController();
+    fetch(url, {signal: controller.signal}).then(function(response) {
+        if (!response.ok) {
+            throw new Error("HTTP " + response.status);
+        }
+        return response.json();
+    }).then(function(page) {
+        var template = document.getElementById("card-template");
+        var cards = document.createDocumentFragment();
+        page["services"].forEach(function(service) { cards.appendChild(build_card(template, service)); });
+        if (reset) {
+            container.replaceChildren(cards);
+        } else {
+            container.appendChild(cards);
+        }
+        more.dataset.nextCursor = page["next_cursor"] || "";
+        more.querySelector("button").classList.toggle("d-none", !page["next_cursor"]);
+        document.getElementById("services-total").innerText = page["total"];
+    }).catch(function(error) {
+        if (error.name != "AbortError") {
+            console.log('There was a problem with the fetch request:' + error.message);
+            if (reset) {
+                filter_cards(cards_query);
+            }
+        }
+    }).finally(function() {
+        if (cards_controller === controller) {
+            cards_controller = null;
+            // The observer only fires on changes, the end of the grid may still be visible after this page
+            if (cards_observer) {
+                cards_observer.unobserve(more);
+                cards_observer.observe(more);
+            }
+        }
+    });
+}
+
+function build_card(template, service) {
+    var col = template.content.firstElementChild.cloneNode(true);
+    var card = col.querySelector(".card");
+    var active = service["status"] != "inactive";
+    card.dataset.appId = service["app_id"];
+    if (card.hasAttribute("id")) {
+        card.id = service["app_id"];
+    }
+
+    col.querySelectorAll("[data-field]").forEach(function(element) {
+        var value = service[element.dataset.field];
+        if (element.dataset.field == "last_online") {
+            value = value ? format_last_online(new Date(Date.parse(value))) : "Never";
+        }
+        element.textContent = value == null ? "" : value;
+    });
+    col.querySelectorAll("[data-href]").forEach(function(element) {
+        element.href = element.dataset.href.replace("{app_id}", service["app_id"]);
+    });
+    col.querySelectorAll("[data-active-class]").forEach(function(element) {
+        element.classList.add(active ? element.dataset.activeClass : element.dataset.inactiveClass);
+    });
+    col.querySelectorAll("[data-active-text]").forEach(function(element) {
+        element.textContent = active ? element.dataset.activeText : element.dataset.inactiveText;
+    });
+    col.querySelectorAll(active ? "[data-inactive]" : "[data-active]").forEach(function(element) {
+        element.remove();
+    });
+    col.querySelectorAll("[data-status-toggle]").forEach(function(element) {
+        element.onclick = function() { change_service_status(service["app_id"]); return false; };
+    });
+    return col;
+}
+
 function update_service(app_id) {
     var myHeaders = new Headers();
 
@@ -61,6 +185,49 @@ function update_service(app_id) {
     });
 }
 
+function preview_route(app_id) {
+    var params = new URLSearchParams();
+    params.append("route", document.getElementById("route").value);
+
+    var myRequest = new Request("/admin/service/" + app_id + "/route?" + params.toString(), { method: 'GET', mode: 'cors', cache: 'default' });
+
+    fetch(myRequest).then(function(response) {
+      if(response.ok) {
+        response.json().then(function(result) {
+            var tbody = document.getElementById("route_steps");
+            tbody.innerHTML = "";
+            if (result["message"]) {
+                var tr = document.createElement('tr');
+                var td = document.createElement('td');
+                td.setAttribute("colspan", "4");
+                td.classList.add("text-danger");
+                td.innerText = result["message"];
+                tr.appendChild(td);
+                tbody.appendChild(tr);
+                return;
+            }
+            for (var i = 0; i < result["steps"].length; i++) {
+                var tr = document.createElement('tr');
+                var fields = ["action", "tag", "attribute", "value"];
+                for (var j = 0; j < fields.length; j++) {
+                    var td = document.createElement('td');
+                    td.innerText = result["steps"][i][fields[j]];
+                    tr.appendChild(td);
+                }
+                tbody.appendChild(tr);
+            }
+        }).catch(function(error) {
+            console.log('There was a problem with the fetch request:' + error.message);
+        });
+      } else {
+        console.log("Net response was OK but HTTP response wasn't");
+      }
+    })
+    .catch(function(error) {
+      console.log('There was a problem with the fetch request:' + error.message);
+    });
+}
+
 function change_service_status(app_id) {
     var myHeaders = new Headers();
     var myInit = { method: 'POST',
@@ -267,6 +434,8 @@ function change_user_status(user_id) {
     });
 }
 
+var live_graph = false;
+
 function get_service_information(app_id) {
     var myHeaders = new Headers();
 
@@ -275,6 +444,7 @@ function get_service_information(app_id) {
     for (const pair of new FormData(form)) {
         data.append(pair[0], pair[1]);
     }
+    data.append("width", document.getElementById("plot_chart").clientWidth);
     var myInit = { method: 'POST',
                    headers: myHeaders,
                    body: data,
@@ -286,40 +456,69 @@ function get_service_information(app_id) {
     fetch(myRequest).then(function(response) {
       if(response.ok) {
         response.json().then(function(result) {
-            var graphs = JSON.parse(result["graph_json"]);
+            var graphs = result["graph_json"];
             graphs.config = {displaylogo: false, modeBarButtonsToRemove: ['pan2d', 'zoom2d', 'lasso2d', 'autoScale2d', 'toggleSpikelines', 'hoverClosestCartesian', 'hoverCompareCartesian']}
             Plotly.newPlot('plot_chart', graphs);
 
-            var logs = JSON.parse(result["logs"]);
-
-            var section = document.getElementById("table");
-            section.innerHTML = "";
-            var table = document.createElement("table");
-            var thead = document.createElement("thead");
-            var tr = document.createElement('tr');
-            var th1 = document.createElement('th');
-            th1.innerText = "Status Date";
-            th1.setAttribute("scope", "col")
-            var th2 = document.createElement('th');
-            th2.innerText = "Status Hour";
-            th2.setAttribute("scope", "col")
-            var th3 = document.createElement('th');
-            th3.innerText = "Status";
-            th3.setAttribute("scope", "col")
-            var th4 = document.createElement('th');
-            th4.innerText = "Other data";
-            th4.setAttribute("scope", "col")
-
-            table.classList.add("table", "table-hover", "table-sm", "text-center");
-            thead.classList.add("table-dark");
-            tr.appendChild(th1);
-            tr.appendChild(th2);
-            tr.appendChild(th3);
-            tr.appendChild(th4);
-            thead.appendChild(tr);
-            table.appendChild(thead);
-
-            var tbody = document.createElement("tbody");
+            // Only the graphs drawn from raw logs that reach today are extended by the live updates
+            var end = document.getElementById("end").value;
+            live_graph = graphs.data != undefined && graphs.data.length > 0 && graphs.data[0].name == "Status" &&
+                         (!end || end >= new Date().toISOString().slice(0, 10));
+        }).catch(function(error) {
+            console.log('There was a problem with the fetch request 1:' + error.message);
+        });
+      } else {
+        console.log("Net response was OK but HTTP response wasn't");
+      }
+    })
+    .catch(function(error) {
+      console.log('There was a problem with the fetch request 2:' + error.message);
+    });
+
+    var section = document.getElementById("table");
+    section.innerHTML = "";
+    var table = document.createElement("table");
+    var thead = document.createElement("thead");
+    var tr = document.createElement('tr');
+    var headers = ["Status Date", "Status Hour", "Status", "Other data"];
+    for (i = 0; i < headers.length; i++) {
+        var th = document.createElement('th');
+        th.innerText = headers[i];
+        th.setAttribute("scope", "col");
+        tr.appendChild(th);
+    }
+
+    table.classList.add("table", "table-hover", "table-sm", "text-center");
+    thead.classList.add("table-dark");
+    thead.appendChild(tr);
+    table.appendChild(thead);
+
+    var tbody = document.createElement("tbody");
+    tbody.setAttribute("id", "logs_body");
+    table.appendChild(tbody);
+    section.appendChild(table);
+
+    load_service_logs(app_id, null);
+}
+
+function load_service_logs(app_id, cursor) {
+    form = document.getElementById("form");
+    var params = new URLSearchParams();
+    for (const pair of new FormData(form)) {
+        params.append(pair[0], pair[1]);
+    }
+    if (cursor) {
+        params.append("cursor", cursor);
+    }
+
+    var myRequest = new Request("/service/" + app_id + "/logs?" + params.toString(), { method: 'GET', mode: 'cors', cache: 'default' });
+
+    fetch(myRequest).then(function(response) {
+      if(response.ok) {
+        response.json().then(function(result) {
+            var logs = result["logs"];
+            var tbody = document.getElementById("logs_body");
+
             for (i = 0; i < logs.length; i++) {
                 var tr = document.createElement('tr');
 
@@ -329,7 +528,6 @@ function get_service_information(app_id) {
                 var td3_span = document.createElement('span');
                 var td4 = document.createElement('td');
 
-                const options = {year: 'numeric', month: 'short', day: 'numeric' };
                 td1.innerText = new Date(Date.parse(logs[i]["status_date"])).toLocaleDateString('es-CO');
                 if (logs[i]["status"] == "Running") {
                     tr.classList.add("table-success");
@@ -341,7 +539,7 @@ function get_service_information(app_id) {
                     td3_span.innerText = '▼';
                 }
                 td2.innerText = new Date(Date.parse(logs[i]["status_date"])).toLocaleTimeString('es-CO');
-                if (logs[i]["other_data"] != "") {
+                if (logs[i]["other_data"]) {
                     td4.innerText = logs[i]["other_data"].split("-")[1];
                 }
 
@@ -353,8 +551,19 @@ function get_service_information(app_id) {
 
                 tbody.appendChild(tr);
             }
-            table.appendChild(tbody);
-            section.appendChild(table);
+
+            var more = document.getElementById("logs_more");
+            if (more) {
+                more.remove();
+            }
+            if (result["next_cursor"]) {
+                more = document.createElement("button");
+                more.setAttribute("id", "logs_more");
+                more.classList.add("btn", "btn-dark");
+                more.innerText = "Load more";
+                more.onclick = function() { load_service_logs(app_id, result["next_cursor"]); };
+                document.getElementById("table").appendChild(more);
+            }
         }).catch(function(error) {
             console.log('There was a problem with the fetch request 1:' + error.message);
         });
@@ -365,4 +574,75 @@ function get_service_information(app_id) {
     .catch(function(error) {
       console.log('There was a problem with the fetch request 2:' + error.message);
     });
-}
\ No newline at end of file
+}
+
+function format_last_online(status_date) {
+    var seconds = Math.abs(Math.floor((Date.now() - status_date.getTime()) / 1000));
+    var days = Math.floor(seconds / 86400);
+    var hours = Math.floor((seconds % 86400) / 3600);
+    var minutes = Math.floor((seconds % 3600) / 60);
+    seconds = seconds % 60;
+
+    if (days > 0) {
+        return days + "d " + hours + "h " + minutes + "m";
+    } else if (hours > 0) {
+        return hours + "h " + minutes + "m " + seconds + "s";
+    } else if (minutes > 0) {
+        return minutes + "m " + seconds + "s";
+    }
+    return seconds + "s";
+}
+
+function listen_logs(on_logs) {
+    // The browser reconnects by itself if the stream is closed
+    var source = new EventSource("/events");
+    source.addEventListener("logs", function(event) {
+        on_logs(JSON.parse(event.data));
+    });
+    return source;
+}
+
+function live_dashboard() {
+    listen_logs(function(logs) {
+        for (var i = 0; i < logs.length; i++) {
+            var card = document.querySelector('.card[data-app-id="' + logs[i]["app_id"] + '"]');
+            if (!card) {
+                continue;
+            }
+            if (logs[i]["status"] == "Running") {
+                var status_date = new Date(Date.parse(logs[i]["status_date"]));
+                card.querySelector(".last-online").innerText = "Last time online: " + format_last_online(status_date);
+                card.classList.remove("border-danger");
+            } else {
+                card.classList.add("border-danger");
+            }
+        }
+    });
+}
+
+function live_service(app_id) {
+    listen_logs(function(logs) {
+        if (!live_graph) {
+            return;
+        }
+        logs = logs.filter(function(log) { return log["app_id"] == app_id; });
+        if (logs.length == 0) {
+            return;
+        }
+        logs.sort(function(a, b) { return a["status_date"] < b["status_date"] ? -1 : 1; });
+
+        var update = {x: [logs.map(function(log) { return log["status_date"]; })],
+                      y: [logs.map(function(log) { return log["status"]; })]};
+        var indices = [0];
+
+        var readings = logs.filter(function(log) { return log["temperature"] != null; });
+        var traces = document.getElementById("plot_chart").data;
+        var temperature = traces.findIndex(function(trace) { return trace.name == "Temperature"; });
+        if (temperature >= 0 && readings.length > 0) {
+            update.x.push(readings.map(function(log) { return log["status_date"]; }));
+            update.y.push(readings.map(function(log) { return log["temperature"]; }));
+            indices.push(temperature);
+        }
+        Plotly.extendTraces('plot_chart', update, indices);
+    });
+}
@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.stub_server import StubServer
+
+
+@pytest.fixture(scope="session")
+def stub():
+    """The local stub server of the benchmarks, serving from a background thread"""
+    server = StubServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from benchmarks.stub_server import PASSWORD, SESSION_COOKIE, USER
+from checker.client import HttpClient, HttpError, ResponseTooLarge
+from checker.document import Document
+from checker.runner import NOT_RUNNING, RUNNING, CheckRunner, Target
+
+LOGIN_ROUTE = ("write:input:id:login_user|write:input:id:login_password|click:input:name:login_button|"
+               "obtain:div:class:infoContainer")
+BLANK_ROUTE = "blank:blank:blank:blank"
+
+
+def fetch(*requests, **client_options) -> tuple[list, dict]:
+    """
+    Sends the requests one after the other with the same client
+    :param requests: arguments of HttpClient.request
+    :return: the responses and the stats of the client
+    """
+    async def send():
+        client = HttpClient(**client_options)
+        try:
+            return [await client.request(*request) for request in requests], client.stats()
+        finally:
+            await client.close()
+    return asyncio.run(send())
+
+
+def check(*targets: Target, **runner_options) -> tuple[dict, list[dict]]:
+    """
+    :return: the row of each target by app_id and the rows the writer got
+    """
+    written = []
+
+    def writer(rows):
+        written.extend(rows)
+        return True, "Success"
+
+    rows = CheckRunner(writer=writer, **runner_options).run(targets)
+    return {row["app_id"]: row for row in rows}, written
+
+
+def test_document_finds_elements_and_their_text():
+    document = Document('<div class="box main"><p id="a">Hello <b>world</b></p><script>var x = 1;</script></div>')
+
+    assert document.find("div", "class", "main").text == "Hello world"
+    assert document.find("p", "id", "a").text == "Hello world"
+    assert document.find("p", "id", "b") is None
+    assert "var x" not in document.text
+
+
+def test_form_values_are_the_ones_a_browser_submits():
+    document = Document("""<form action="/send" method="POST">
+        <input type="hidden" name="token" value="t">
+        <input type="text" name="user">
+        <input type="checkbox" name="remember" checked>
+        <input type="checkbox" name="newsletter" value="yes">
+        <input type="text" name="disabled" value="x" disabled>
+        <select name="lang"><option value="es">ES</option><option value="en" selected>EN</option></select>
+        <textarea name="notes">Some notes</textarea>
+        <input type="submit" name="save" value="Save">
+        <button name="cancel" value="1">Cancel</button>
+    </form>""")
+    form = document.forms[0]
+
+    assert (form.action, form.method) == ("/send", "post")
+    assert form.values(clicked=document.find("input", "name", "save")) == {
+        "token": "t", "user": "", "remember": "on", "lang": "en", "notes": "Some notes", "save": "Save"}
+    assert "save" not in form.values()
+
+
+def test_client_reuses_keep_alive_connections(stub):
+    responses, stats = fetch(("GET", f"{stub.url}/ok"), ("GET", f"{stub.url}/ok"))
+
+    assert [response.status for response in responses] == [200, 200]
+    assert "It works" in responses[1].text
+    assert (stats["opened"], stats["reused"]) == (1, 1)
+
+
+def test_client_reads_chunked_bodies(stub):
+    (chunked, plain), _ = fetch(("GET", f"{stub.url}/chunked"), ("GET", f"{stub.url}/ok"))
+
+    assert chunked.status == 200
+    assert chunked.body == plain.body
+
+
+def test_client_follows_redirects_with_the_cookies_set(stub):
+    cookies = {}
+    (response,), _ = fetch(("POST", f"{stub.url}/login", {"user": USER, "password": PASSWORD, "token": "stub-token"},
+                            cookies))
+
+    assert response.url == f"{stub.url}/home"
+    assert cookies == {SESSION_COOKIE: USER}
+    assert f"Welcome {USER}" in response.text
+
+
+def test_client_stops_following_redirects_without_a_session(stub):
+    (response,), _ = fetch(("GET", f"{stub.url}/home", None, None, 0))
+
+    assert response.status == 302
+    assert response.headers["location"] == "/login"
+
+
+def test_client_raises_http_error_on_a_truncated_body(stub):
+    with pytest.raises(HttpError, match="Incomplete response"):
+        fetch(("GET", f"{stub.url}/truncated"))
+
+
+def test_client_refuses_bodies_larger_than_the_limit(stub):
+    with pytest.raises(ResponseTooLarge):
+        fetch(("GET", f"{stub.url}/ok"), max_body_size=10)
+    with pytest.raises(ResponseTooLarge):
+        fetch(("GET", f"{stub.url}/chunked"), max_body_size=10)
+
+
+def test_runner_logs_in_and_obtains_the_element(stub):
+    rows, _ = check(Target(1, f"{stub.url}/login", LOGIN_ROUTE, "web", USER, PASSWORD),
+                    Target(2, f"{stub.url}/login", LOGIN_ROUTE, "web", USER, "wrong"))
+
+    assert (rows[1]["status"], rows[1]["other_data"]) == (RUNNING, f"Welcome {USER}")
+    assert rows[2]["status"] == NOT_RUNNING
+    assert "HTTP 401" in rows[2]["other_data"]
+
+
+def test_runner_reads_sensors_with_and_without_a_number(stub):
+    rows, _ = check(Target(1, f"{stub.url}/sensor", BLANK_ROUTE, "temperature_sensor",
+                           sensor_name="Temperatura_Area_ISP"),
+                    Target(2, f"{stub.url}/sensor", BLANK_ROUTE, "water_sensor", sensor_name="Sensor_Agua"),
+                    Target(3, f"{stub.url}/ok", BLANK_ROUTE, "water_sensor", sensor_name="Sensor_Nivel"))
+
+    name, _, value = rows[1]["other_data"].partition("-")
+    assert (rows[1]["status"], name) == (RUNNING, "Temperatura_Area_ISP")
+    assert 20 <= float(value) <= 30
+    assert (rows[2]["status"], rows[2]["other_data"]) == (RUNNING, "Sensor_Agua-Normal")
+    assert rows[3]["status"] == NOT_RUNNING
+
+
+def test_runner_times_out_slow_services(stub):
+    rows, _ = check(Target(1, f"{stub.url}/slow?delay=1", BLANK_ROUTE, "web"), timeout=0.2)
+
+    assert (rows[1]["status"], rows[1]["other_data"]) == (NOT_RUNNING, "Timeout after 0.2s")
+
+
+def test_runner_writes_every_row_when_a_service_misbehaves(stub):
+    rows, written = check(Target(1, f"{stub.url}/truncated", BLANK_ROUTE, "web"),
+                          Target(2, "http://127.0.0.1:1/", BLANK_ROUTE, "web"),
+                          Target(3, f"{stub.url}/error", BLANK_ROUTE, "web"),
+                          Target(4, f"{stub.url}/ok", "obtain:h1:id:title", "web"))
+
+    assert {row["app_id"] for row in written} == {1, 2, 3, 4}
+    assert [rows[app_id]["status"] for app_id in (1, 2, 3)] == [NOT_RUNNING] * 3
+    assert "HttpError" in rows[1]["other_data"]
+    assert (rows[4]["status"], rows[4]["other_data"]) == (RUNNING, "It works")
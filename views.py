@@ -1,35 +1,228 @@
+import base64
+import binascii
 import datetime
+import hashlib
 import json
+import os
+import time
 from datetime import date
-
-import pandas as pd
-
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly
+from typing import Optional, TYPE_CHECKING
 
 from flask import (
-    Blueprint, render_template, request
+    Blueprint, Response, abort, g, make_response, render_template, request, session, stream_with_context
 )
+from markupsafe import Markup
 
 from auth import login_required
+from common.broadcaster import get_broadcaster
+from common.cache import TTLCache
+from common.figures import Figure
 from database.data_manager import DataManager
+from database.log_tail import start_log_tail
 from common.models import AppType
+from common.sensors import SENSOR_TYPES
+
+if TYPE_CHECKING:
+    import numpy as np
+    from common.columns import LogColumns
 
 _PREFIX = "views"
 
 bp = Blueprint("views", __name__)
 dm = DataManager()
 
+LOGS_PAGE_SIZE = 200
+LOGS_PAGE_MAX_SIZE = 1000
+
+# Graph width in pixels, it bounds the number of points sent per trace
+GRAPH_WIDTH = 1000
+GRAPH_MIN_WIDTH = 100
+GRAPH_MAX_WIDTH = 4000
+
+# Longest date span (in days) drawn from raw logs, then from hourly rollups, longer spans use daily rollups
+GRAPH_RAW_MAX_DAYS = 3
+GRAPH_HOURLY_MAX_DAYS = 90
+
+# Seconds the dashboard is served from memory, it bounds how stale it is after writes made by other processes
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", 30))
+# Also keep the rendered service cards, not only the data they are rendered from
+DASHBOARD_FRAGMENT_CACHE = os.getenv("DASHBOARD_FRAGMENT_CACHE", "true").lower() in ("1", "true", "yes", "on")
+dashboard_cache = TTLCache(max_size=32, ttl=DASHBOARD_CACHE_TTL, name="dashboard")
+# Data versions are counted per process, ETags also carry when the process started
+_STARTED_AT = time.time_ns()
+
+# Service cards rendered with the page, the next ones are fetched from /services/page while scrolling
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", 48))
+SERVICES_PAGE_MAX_SIZE = 500
+# Columns the dashboard search looks in for visitors who aren't logged in, the ones the cards show them
+PUBLIC_SEARCH_COLUMNS = ("name", "description")
+
+# Seconds between comments sent on an idle /events stream, they keep proxies from closing it
+EVENTS_KEEPALIVE = 15
+
 
 @bp.route("/")
 def index():
-    services, stat = dm.get_services(status=None)
-    last_time_online, result = dm.get_last_active_time()
-    last_time_online_dict = {}
-    if last_time_online:
-        last_time_online_dict = {v: k for k, v in last_time_online}
-    return render_template("views/index.html", services=services, last_time_online=last_time_online_dict)
+    try:
+        filters = requested_service_filters()
+    except ValueError as e:
+        abort(400, str(e))
+
+    version, bucket = dm.data_version(), dashboard_bucket()
+    etag = dashboard_etag(version, bucket, filters)
+    # Flashed messages are rendered once, so a page carrying them must not be answered with a 304
+    has_flashes = "_flashes" in session
+    if not has_flashes and request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        services, total = dashboard_page(version, *filters)
+        next_cursor = services[-1].app_id if len(services) < total else None
+        response = make_response(render_template("views/index.html",
+                                                 service_cards=dashboard_cards(version, bucket, filters),
+                                                 total=total, next_cursor=next_cursor, status=filters[0],
+                                                 app_type=filters[1], app_types=AppType))
+
+    if not has_flashes:
+        response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def requested_service_filters() -> tuple[Optional[str], Optional[AppType]]:
+    """
+    Reads the status and type filters of the service cards from the query string
+    :return: a tuple with the status and the AppType, None for the ones not requested
+    :raise ValueError if one of them isn't valid
+    """
+    status = request.args.get("status") or None
+    if status not in (None, "active", "inactive"):
+        raise ValueError(f"Unknown status {status}, it must be active or inactive")
+
+    app_type = request.args.get("type") or None
+    try:
+        return status, AppType(app_type) if app_type else None
+    except ValueError:
+        raise ValueError(f"Unknown service type {app_type}, it must be one of: "
+                         f"{', '.join(app_type.value for app_type in AppType)}")
+
+
+def dashboard_bucket() -> int:
+    """
+    Time window the cached dashboard belongs to, a new one starts every DASHBOARD_CACHE_TTL seconds
+    """
+    return int(time.time() // DASHBOARD_CACHE_TTL) if DASHBOARD_CACHE_TTL > 0 else time.time_ns()
+
+
+def dashboard_etag(version: int, bucket: int, filters: tuple = (None, None)) -> str:
+    """
+    The page changes with the data, the time window (last time online is relative), the filters and the user in
+    the navbar
+    """
+    user = (g.user.id, g.user.name, g.user.type_) if g.get("user") else None
+    key = repr((os.getpid(), _STARTED_AT, version, bucket, filters, user))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def dashboard_last_online(version: int) -> dict:
+    """
+    Gets the last time each service was online, read once per data version
+    :return: a dict of app_id: last time online
+    """
+    last_time_online_dict = dashboard_cache.get(("last_online", version))
+    if last_time_online_dict is None:
+        last_time_online, result = dm.get_last_active_time()
+        last_time_online_dict = {}
+        if last_time_online:
+            last_time_online_dict = {v: k for k, v in last_time_online}
+        dashboard_cache.set(("last_online", version), last_time_online_dict)
+    return last_time_online_dict
+
+
+def dashboard_page(version: int, status: str = None, app_type: AppType = None) -> tuple[list, int]:
+    """
+    Gets the first page of services matching the filters, read once per data version
+    :return: a tuple with the services of the page and the number of services matching the filters
+    """
+    page = dashboard_cache.get(("page", version, status, app_type))
+    if page is None:
+        page, _ = dm.get_services_page(limit=DASHBOARD_PAGE_SIZE, status=status, app_type=app_type)
+        page = page or ([], 0)
+        dashboard_cache.set(("page", version, status, app_type), page)
+    return page
+
+
+def dashboard_cards(version: int, bucket: int, filters: tuple = (None, None)) -> Markup:
+    """
+    Renders the first page of service cards, kept for the time window when DASHBOARD_FRAGMENT_CACHE is set
+    """
+    key = ("cards", version, bucket, filters)
+    cards = dashboard_cache.get(key) if DASHBOARD_FRAGMENT_CACHE else None
+    if cards is None:
+        services, _ = dashboard_page(version, *filters)
+        cards = Markup(render_template("views/_service_cards.html", services=services,
+                                       last_time_online=dashboard_last_online(version)))
+        if DASHBOARD_FRAGMENT_CACHE:
+            dashboard_cache.set(key, cards)
+    return cards
+
+
+@bp.route("/services/page")
+def services_page():
+    """
+    Pages through the service cards as compact JSON, after the app_id in ?cursor=, filtered by ?status= and ?type=,
+    or searches them with ?q=. Visitors who aren't logged in only search the name and the description
+    """
+    last_time_online = dashboard_last_online(dm.data_version())
+    return service_cards_page(lambda service: {
+        "app_id": service.app_id,
+        "name": service.name,
+        "description": service.description,
+        "status": service.status,
+        "last_online": last_time_online[service.app_id].isoformat() if service.app_id in last_time_online else None
+    }, search_columns=None if g.user else PUBLIC_SEARCH_COLUMNS)
+
+
+def service_cards_page(service_to_dict, search_columns: tuple[str, ...] = None) -> Response:
+    """
+    Answers a request for a page of service cards
+    :param service_to_dict: turns a Service into the dict sent for its card
+    :param search_columns: columns searched with ?q=, all of them if None
+    :return: a JSON response with the services, the total matching and the cursor of the next page (null on the
+    last one)
+    """
+    try:
+        status, app_type = requested_service_filters()
+        cursor = request.args.get("cursor")
+        after = int(cursor) if cursor else None
+    except ValueError as e:
+        abort(400, str(e))
+    limit = min(max(request.args.get("limit", default=DASHBOARD_PAGE_SIZE, type=int), 1), SERVICES_PAGE_MAX_SIZE)
+
+    query = request.args.get("q", "").strip()
+    if query:
+        # Best match first, there is a single page
+        services, message = dm.search_services(query, limit=limit, status=status, app_type=app_type,
+                                               columns=search_columns)
+        services = services or []
+        total, next_cursor = len(services), None
+    else:
+        # One extra service tells whether there is a next page
+        page, message = dm.get_services_page(after=after, limit=limit + 1, status=status, app_type=app_type)
+        services, total = page or ([], 0)
+        next_cursor = None
+        if len(services) > limit:
+            services = services[:limit]
+            next_cursor = services[-1].app_id
+
+    if message.startswith("[Error]"):
+        abort(500, message)
+
+    return_dict = {
+        "services": [service_to_dict(service) for service in services],
+        "total": total,
+        "next_cursor": next_cursor
+    }
+    return Response(json.dumps(return_dict), mimetype="application/json")
 
 
 @bp.route("/service/<int:app_id>", methods=["GET", "POST"])
@@ -44,11 +237,88 @@ def service(app_id):
 def cb(app_id):
     if not isinstance(app_id, int):
         return_dict = {
-            "logs": {},
             "graph_json": {}
         }
         return json.dumps(return_dict, indent=4, sort_keys=True, default=str)
 
+    start_date, end_date = requested_dates()
+
+    _, graph_json = get_logs_and_graph(app_id=app_id, start_date=start_date, end_date=end_date,
+                                       width=requested_width())
+
+    # graph_json is already encoded, it is embedded as is instead of being encoded a second time
+    return Response(f'{{"graph_json": {graph_json or "{}"}}}', mimetype="application/json")
+
+
+@bp.before_app_request
+def follow_logs():
+    # Logs written by the checker and the other workers reach this one's /events clients and cached pages
+    start_log_tail()
+
+
+@bp.route("/events")
+@login_required
+def events():
+    """
+    Server-Sent Events stream of the logs committed by any process, sent as "logs" events with a list of
+    {app_id, status, status_date, temperature}
+    """
+    broadcaster = get_broadcaster()
+    subscription = broadcaster.subscribe()
+    if subscription is None:
+        abort(503)
+
+    def generate():
+        yield "retry: 5000\n\n"
+        while True:
+            message = subscription.get(timeout=EVENTS_KEEPALIVE)
+            yield message if message is not None else ": keepalive\n\n"
+
+    response = Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Runs when the client disconnects, even if the stream was never started
+    response.call_on_close(lambda: broadcaster.unsubscribe(subscription))
+    return response
+
+
+@bp.route("/service/<int:app_id>/logs")
+@login_required
+def logs_page(app_id):
+    """Pages through the logs of a service with a cursor, or streams all of them as NDJSON with format=ndjson"""
+    start_date, end_date = requested_dates()
+
+    try:
+        after = decode_cursor(request.args.get("cursor"))
+    except ValueError:
+        abort(400, "The cursor provided is not valid")
+
+    if request.args.get("format") == "ndjson":
+        def generate():
+            for log in dm.iter_logs(app_id=app_id, start_date_=start_date, end_date_=end_date, after=after):
+                yield json.dumps(log_row_to_dict(log), default=str) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    limit = min(max(request.args.get("limit", default=LOGS_PAGE_SIZE, type=int), 1), LOGS_PAGE_MAX_SIZE)
+    # One extra row tells whether there is a next page without counting the range
+    logs, _ = dm.get_logs_page(app_id=app_id, start_date_=start_date, end_date_=end_date, after=after, limit=limit + 1)
+    logs = logs or []
+
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_cursor(logs[-1].status_date, logs[-1].log_id)
+
+    return_dict = {
+        "logs": [log_row_to_dict(log) for log in logs],
+        "next_cursor": next_cursor
+    }
+
+    return Response(json.dumps(return_dict, default=str), mimetype="application/json")
+
+
+def requested_dates() -> tuple[date, date]:
+    """Reads the log-start and log-end dates from the form or the query string, defaults to today"""
     start_date = request.form.get("log-start") or request.args.get("log-start")
     end_date = request.form.get("log-end") or request.args.get("log-end")
 
@@ -65,14 +335,34 @@ def cb(app_id):
     if not isinstance(start_date, date) and not isinstance(end_date, date):
         start_date = date.today()
 
-    logs, graph_json = get_logs_and_graph(app_id=app_id, start_date=start_date, end_date=end_date)
+    return start_date, end_date
 
-    return_dict = {
-        "logs": json.dumps([log.to_dict() for log in logs], sort_keys=True, default=str),
-        "graph_json": graph_json
-    }
 
-    return json.dumps(return_dict, indent=4, sort_keys=True, default=str)
+def encode_cursor(status_date: datetime.datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{status_date.isoformat()}|{log_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    :raise ValueError if the cursor is not one built by encode_cursor
+    """
+    if not cursor:
+        return None
+
+    try:
+        status_date, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(status_date), int(log_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def log_row_to_dict(log) -> dict:
+    return {
+        "log_id": log.log_id,
+        "status": log.status,
+        "status_date": log.status_date,
+        "other_data": log.other_data
+    }
 
 
 @bp.app_template_filter("last_online")
@@ -94,37 +384,170 @@ def template_last_online(status_date: datetime.datetime):
         return f"{seconds}s"
 
 
-def get_logs_and_graph(app_id, start_date, end_date):
-    graph_json = {}
-    df = None
-    logs, _ = dm.get_logs(app_id=app_id, start_date_=start_date, end_date_=end_date)
-    service_, _ = dm.get_service(app_id=app_id)
+def get_logs_and_graph(app_id, start_date, end_date, width: int = GRAPH_WIDTH):
+    """
+    Builds the status and temperature graph of a service, downsampled to a number of points bounded by width
+    :param width: width of the graph in pixels
+    :return: the raw logs as LogColumns (None when the graph comes from rollups) and the graph encoded as JSON
+    """
+    resolution = graph_resolution(start_date, end_date)
+    if resolution != "raw":
+        return None, get_rollup_graph(app_id, start_date, end_date, resolution)
 
-    if logs:
-        df = pd.DataFrame([log.to_dict() for log in logs])
+    logs, _ = dm.get_log_columns(app_id=app_id, start_date_=start_date, end_date_=end_date)
+    service_, _ = dm.get_service(app_id=app_id)
+    if not logs or not logs[0] or not service_:
+        return None, {}
 
-    if df is not None and service_.app_type == AppType.T_SENSOR.value:
-        df["other_data"] = df["other_data"].str.split("-", expand=True)[1]
+    # numpy is only loaded by the workers that draw a graph from raw logs
+    from common.columns import LogColumns
 
+    columns = LogColumns.decode(*logs, app_type=service_.app_type)
     try:
-        fig = make_subplots(specs=[[{"secondary_y": True}]])
-        fig.add_trace(go.Scatter(x=df["status_date"],
-                                 y=df["status"],
-                                 line=dict(color="blue"),
-                                 mode='lines+markers',
-                                 name='Status',
-                                 ), secondary_y=False)
+        fig = Figure()
+        kept = downsample_status(columns, width)
+        fig.add_scatter(columns.status_date[kept],
+                        columns.status[kept],
+                        line=dict(color="blue"),
+                        mode='lines+markers',
+                        name='Status',
+                        )
         if service_.app_type == AppType.T_SENSOR.value:
-            fig.add_trace(go.Scatter(x=df["status_date"],
-                                     y=df["other_data"],
-                                     line=dict(color="red"),
-                                     mode='markers',
-                                     name='Temperature',
-                                     ), secondary_y=True)
+            dates, temperatures, band = downsample_temperature(columns, width)
+            fig.add_scatter(dates,
+                            temperatures,
+                            secondary_y=True,
+                            line=dict(color="red"),
+                            mode='markers',
+                            name='Temperature',
+                            )
+            if band is not None:
+                starts, minimums, maximums = band
+                fig.add_scatter(starts,
+                                maximums,
+                                secondary_y=True,
+                                line=dict(width=0),
+                                mode='lines',
+                                showlegend=False,
+                                hoverinfo='skip',
+                                )
+                fig.add_scatter(starts,
+                                minimums,
+                                secondary_y=True,
+                                line=dict(width=0),
+                                mode='lines',
+                                fill='tonexty',
+                                fillcolor='rgba(255, 0, 0, 0.15)',
+                                name='Temperature range',
+                                hoverinfo='skip',
+                                )
     except (ValueError, TypeError):
-        fig = None
+        return columns, {}
+
+    return columns, fig.to_json()
+
+
+def graph_resolution(start_date: date, end_date: date) -> str:
+    """Chooses "raw", "hour" or "day" depending on the number of days requested"""
+    days = 1
+    if start_date and end_date and end_date >= start_date:
+        days = (end_date - start_date).days + 1
+
+    if days <= GRAPH_RAW_MAX_DAYS:
+        return "raw"
+    if days <= GRAPH_HOURLY_MAX_DAYS:
+        return "hour"
+    return "day"
+
+
+def get_rollup_graph(app_id, start_date, end_date, resolution) -> str:
+    """Builds the graph of a service from its hourly or daily rollups: uptime and sensor min/avg/max"""
+    rollups, _ = dm.get_rollups(app_id=app_id, resolution=resolution, start_date_=start_date, end_date_=end_date)
+    service_, _ = dm.get_service(app_id=app_id)
+
+    if not rollups or not service_:
+        return {}
+
+    fig = Figure()
+    fig.add_scatter([rollup.bucket_start for rollup in rollups],
+                    [round(rollup.uptime * 100, 2) for rollup in rollups],
+                    line=dict(color="blue"),
+                    mode='lines+markers',
+                    name=f'Uptime % per {resolution}',
+                    )
+    fig.update_yaxes(range=[0, 100], secondary_y=False)
+
+    readings = [rollup for rollup in rollups if rollup.value_count]
+    if service_.app_type in SENSOR_TYPES and readings:
+        name = "Temperature" if service_.app_type == AppType.T_SENSOR.value else "Reading"
+        x = [rollup.bucket_start for rollup in readings]
+        fig.add_scatter(x,
+                        [rollup.value_max for rollup in readings],
+                        secondary_y=True,
+                        line=dict(width=0),
+                        mode='lines',
+                        showlegend=False,
+                        hoverinfo='skip',
+                        )
+        fig.add_scatter(x,
+                        [rollup.value_min for rollup in readings],
+                        secondary_y=True,
+                        line=dict(width=0),
+                        mode='lines',
+                        fill='tonexty',
+                        fillcolor='rgba(255, 0, 0, 0.15)',
+                        name=f'{name} range',
+                        hoverinfo='skip',
+                        )
+        fig.add_scatter(x,
+                        [round(rollup.value_avg, 2) for rollup in readings],
+                        secondary_y=True,
+                        line=dict(color="red"),
+                        mode='lines',
+                        name=f'{name} average',
+                        )
+
+    return fig.to_json()
+
+
+def requested_width() -> int:
+    """Reads the graph width in pixels from the form or the query string"""
+    width = request.form.get("width", type=int) or request.args.get("width", type=int) or GRAPH_WIDTH
+    return min(max(width, GRAPH_MIN_WIDTH), GRAPH_MAX_WIDTH)
+
+
+def downsample_status(columns: "LogColumns", width: int) -> "np.ndarray":
+    """
+    Keeps the status changes (run-length collapsing), then LTTB if there are still more changes than pixels
+    :return: the indices of the logs kept
+    """
+    from common.columns import epoch_ns
+    from common.downsampling import collapse_runs, lttb
+
+    kept = collapse_runs(columns.status)
+    if len(kept) > width:
+        running = (columns.status[kept] == "Running").astype(float)
+        kept = kept[lttb(epoch_ns(columns.status_date)[kept], running, width)]
+    return kept
+
+
+def downsample_temperature(columns: "LogColumns", width: int) -> tuple["np.ndarray", "np.ndarray",
+                                                                       Optional[tuple["np.ndarray", ...]]]:
+    """
+    Reduces the temperature line to width points with LTTB
+    :return: the dates and readings kept and, when the line was reduced, the start, min and max of each time
+    bucket to draw as a band
+    """
+    import numpy as np
+    from common.columns import epoch_ns
+    from common.downsampling import bucket_aggregate, lttb
 
-    if fig:
-        graph_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+    present = ~np.isnan(columns.reading)
+    dates, y = columns.status_date[present], columns.reading[present]
+    if len(y) <= width:
+        return dates, y, None
 
-    return logs, graph_json
+    x = epoch_ns(dates)
+    starts, minimums, maximums, _ = bucket_aggregate(x, y, width // 2)
+    kept = lttb(x, y, width)
+    return dates[kept], y[kept], (starts.astype("int64").astype("datetime64[ns]"), minimums, maximums)
@@ -0,0 +1,11 @@
+"""
+Production entry point, served by a multi-worker WSGI server: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from main import create_app, setup_logging
+
+setup_logging()
+app = create_app()